@@ -16,6 +16,7 @@ from django_celery_beat.models import (
 
 from scraper.models import (
     FourmizzzServer,
+    JobLease,
     PlayerTarget,
     AllianceTarget,
     PrecisionSnapshot,
@@ -82,7 +83,8 @@ class PlayerTargetAdmin(admin.ModelAdmin):
                 alliance=obj.alliance.name,
             )
 
-        player_alliance = get_player_alliance(obj.server, obj.name)
+        # Cached only: a changelist page must not send the game a request per row
+        player_alliance = get_player_alliance(obj.server, obj.name, fetch_missing=False)
         if player_alliance:
             return format_html(
                 "<a target='_blank' rel='noopener' href='http://{server}.fourmizzz.fr/classementAlliance.php?alliance={alliance}'>{alliance}</a>",
@@ -148,7 +150,7 @@ class PrecisionSnapshotAdmin(admin.ModelAdmin):
                 alliance=obj.player.alliance.name,
             )
 
-        player_alliance = get_player_alliance(obj.player.server, obj.player.name)
+        player_alliance = get_player_alliance(obj.player.server, obj.player.name, fetch_missing=False)
         if player_alliance:
             return format_html(
                 "<a target='_blank' rel='noopener' href='http://{server}.fourmizzz.fr/classementAlliance.php?alliance={alliance}'>{alliance}</a>",
@@ -203,6 +205,25 @@ class RankingSnapshotAdmin(admin.ModelAdmin):
         return False
 
 
+@admin.register(JobLease)
+class JobLeaseAdmin(admin.ModelAdmin):
+    list_display = (
+        "server",
+        "job",
+        "acquired_at",
+        "expires_at",
+        "n_skipped",
+        "last_skipped_at",
+    )
+    list_filter = (("server", ChoiceDropdownFilter), "job")
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 # Disable Celery results admin
 admin.site.unregister(TaskResult)
 admin.site.unregister(GroupResult)
@@ -51,7 +51,15 @@ class FourmizzzServerForm(ModelForm):
 
     class Meta:
         model = FourmizzzServer
-        fields = ("name", "username", "password", "n_scanned_pages")
+        fields = (
+            "name",
+            "username",
+            "password",
+            "n_scanned_pages",
+            "requests_per_second",
+            "mv_requests_per_second",
+            "precision_polls_per_minute",
+        )
 
     def clean(self):
         cleaned_data = super(FourmizzzServerForm, self).clean()
@@ -0,0 +1,124 @@
+"""
+Set-based ingest of ranking rows.
+
+A page or a whole sweep is streamed into a temporary staging table with COPY FROM STDIN, then one
+statement does the rest in the database: diff every row against the player's previous row in the
+batch or else its RankingState, keep only the rows that changed, insert them as snapshots and move
+RankingState along. That is three round trips per batch, whatever its size, and no per-row work
+in Python.
+"""
+
+import datetime
+import io
+from typing import Any
+from typing import Iterable
+from typing import List
+from typing import Tuple
+
+from django.db import connection
+from django.db import transaction
+from django.utils import timezone
+
+_STAGING_TABLE = "ranking_staging"
+
+_INGEST_SQL = f"""
+WITH compared AS (
+    SELECT
+        staged.position,
+        staged.player_name,
+        staged.hunting_field,
+        staged.trophies,
+        -- A player seen twice in the batch (pushed onto the next page mid-sweep) is compared
+        -- against its own earlier row, the first time against its state
+        COALESCE(LAG(staged.hunting_field) OVER batch, state.hunting_field) AS previous_hunting_field,
+        COALESCE(LAG(staged.trophies) OVER batch, state.trophies) AS previous_trophies
+    FROM {_STAGING_TABLE} AS staged
+    LEFT JOIN scraper_rankingstate AS state
+        ON state.server_id = %(server_id)s AND state.player_name = staged.player_name
+    WINDOW batch AS (PARTITION BY staged.player_name ORDER BY staged.position)
+),
+inserted AS (
+    INSERT INTO scraper_rankingsnapshot
+        (time, server_id, player_name, hunting_field, trophies, hunting_field_diff, trophies_diff)
+    SELECT
+        %(time)s,
+        %(server_id)s,
+        player_name,
+        hunting_field,
+        trophies,
+        -- The first snapshot of a player has no diff
+        COALESCE(hunting_field - previous_hunting_field, 0),
+        COALESCE(trophies - previous_trophies, 0)
+    FROM compared
+    WHERE previous_hunting_field IS NULL
+        OR (hunting_field, trophies) <> (previous_hunting_field, previous_trophies)
+    ORDER BY position
+    RETURNING id, player_name, hunting_field, trophies, time
+)
+INSERT INTO scraper_rankingstate (server_id, player_name, hunting_field, trophies, time, snapshot_id)
+-- One row per player, its latest: ON CONFLICT cannot touch a row twice in one statement
+SELECT DISTINCT ON (player_name) %(server_id)s, player_name, hunting_field, trophies, time, id
+FROM inserted
+ORDER BY player_name, id DESC
+ON CONFLICT (server_id, player_name) DO UPDATE SET
+    hunting_field = EXCLUDED.hunting_field,
+    trophies = EXCLUDED.trophies,
+    time = EXCLUDED.time,
+    snapshot_id = EXCLUDED.snapshot_id
+"""
+
+
+def _copy_text(value: Any) -> str:
+    """One value in COPY's text format."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def copy_rows(cursor, table: str, columns: List[str], rows: Iterable[Tuple]) -> None:
+    """Stream `rows` into `columns` of `table` with COPY FROM STDIN."""
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(_copy_text(value) for value in row) + "\n")
+    buffer.seek(0)
+    quote = connection.ops.quote_name
+    cursor.copy_expert(
+        f"COPY {quote(table)} ({', '.join(quote(column) for column in columns)}) FROM STDIN", buffer
+    )
+
+
+def ingest_ranking_rows(server_id: int, rows: List[Tuple[str, int, int]]) -> int:
+    """
+    Save snapshots for the ranking rows that changed, and RankingState with them, in a transaction
+    of their own or a savepoint of the caller's: the staging table only lives that long.
+
+    Rows are (player name, hunting field, trophies), in ranking order. Like `auto_now_add`, every
+    snapshot gets the time of the save. Returns the number of players whose state moved.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TEMPORARY TABLE {_STAGING_TABLE} ("
+            "position integer, player_name varchar(100), hunting_field bigint, trophies integer"
+            ") ON COMMIT DROP"
+        )
+        copy_rows(
+            cursor,
+            _STAGING_TABLE,
+            ["position", "player_name", "hunting_field", "trophies"],
+            ((position, *row) for position, row in enumerate(rows)),
+        )
+        cursor.execute(_INGEST_SQL, {"server_id": server_id, "time": timezone.now()})
+        updated = cursor.rowcount
+        # Dropped now rather than at commit, so another batch can follow in the same transaction
+        cursor.execute(f"DROP TABLE {_STAGING_TABLE}")
+    return updated
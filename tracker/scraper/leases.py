@@ -0,0 +1,57 @@
+"""
+Single-flight execution of the periodic jobs, one run per server at a time.
+
+Beat fires the sweeps every minute whether or not the previous one is done. A tick first takes the
+job's JobLease for the server: one conditional UPDATE, which Postgres serialises on the row, so
+exactly one worker on any node gets it. The run releases it when it is done, through the last
+task of its chain. A tick that finds it held skips that server and counts the skip on the lease.
+
+A run that dies without releasing (a worker killed, a task over its time limit) is not waited for
+forever: the lease lapses after its ttl.
+"""
+
+import datetime
+import uuid
+from typing import Optional
+
+from django.db.models import F
+from django.db.models import Q
+from django.utils import timezone
+
+from scraper.models import FourmizzzServer
+from scraper.models import JobLease
+
+
+def acquire_lease(
+    server: FourmizzzServer, job: str, ttl: datetime.timedelta
+) -> Optional[str]:
+    """
+    Take the lease of `job` on `server` for `ttl`. Returns the holder to release it with, or None
+    if the previous run still holds it, in which case the skip is recorded.
+    """
+    now = timezone.now()
+    JobLease.objects.get_or_create(server=server, job=job)
+    holder = uuid.uuid4().hex
+    acquired = (
+        JobLease.objects.filter(server=server, job=job)
+        .filter(Q(expires_at__isnull=True) | Q(expires_at__lte=now))
+        .update(holder=holder, acquired_at=now, expires_at=now + ttl)
+    )
+    if acquired:
+        return holder
+    JobLease.objects.filter(server=server, job=job).update(
+        n_skipped=F("n_skipped") + 1, last_skipped_at=now
+    )
+    return None
+
+
+def release_lease(server_pk: int, job: str, holder: str) -> bool:
+    """
+    Release the lease, unless it lapsed and another run took it since. Returns whether it was
+    released.
+    """
+    return bool(
+        JobLease.objects.filter(server_id=server_pk, job=job, holder=holder).update(
+            holder="", expires_at=None
+        )
+    )
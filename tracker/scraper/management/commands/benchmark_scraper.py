@@ -0,0 +1,213 @@
+import json
+import random
+import statistics
+import threading
+import time
+from functools import partial
+from typing import Callable
+from typing import Dict
+from typing import List
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db import transaction
+from django.test.utils import CaptureQueriesContext
+from django.test.utils import override_settings
+
+from scraper.matching import find_combinations
+from scraper.models import FourmizzzServer
+from scraper.models import PlayerTarget
+from scraper.models import PrecisionSnapshot
+from scraper.models import PrecisionState
+from scraper.models import RankingSnapshot
+from scraper.models import RankingState
+from scraper.parsers import ranking_rows
+from scraper.standin import StandinServer
+from scraper.standin import SyntheticWorld
+from scraper.tasks import _save_ranking_snapshots
+from scraper.tasks import take_page_ranking_snapshot
+from scraper.tasks import take_player_precision_snapshot
+
+
+def _summary(samples: List[float]) -> Dict[str, float]:
+    """Seconds, as milliseconds rounded to the microsecond."""
+    ordered = sorted(samples)
+    return {
+        "n": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def _timed(function: Callable, *args) -> float:
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the scrape, parse and persist path against the stand-in game, in a throwaway "
+        "test database, and print the results as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pages", type=int, default=20, help="Ranking pages per round")
+        parser.add_argument("--rounds", type=int, default=3, help="Ranking sweeps, a minute of moves apart")
+        parser.add_argument("--players", type=int, default=5000, help="Players in the synthetic world")
+        parser.add_argument("--precision-players", type=int, default=50)
+        parser.add_argument(
+            "--candidates",
+            type=int,
+            nargs="+",
+            default=[10, 30, 100],
+            help="Candidate counts to time the move matching with",
+        )
+        parser.add_argument(
+            "--matching-samples", type=int, default=20, help="Searches per candidate count, each on other moves"
+        )
+        parser.add_argument(
+            "--record-dir",
+            default="",
+            help="Serve the pages recorded there (FOURMIZZZ_RECORD_DIR) before synthetic ones",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="Write the JSON there instead of to stdout")
+        parser.add_argument("--keepdb", action="store_true", help="Keep the test database between runs")
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options["seed"])
+        world = SyntheticWorld(n_players=options["players"], seed=options["seed"])
+        standin = StandinServer(("127.0.0.1", 0), world=world, record_dir=options["record_dir"])
+        threading.Thread(target=standin.serve_forever, daemon=True).start()
+
+        # Everything is written to a test database, like `manage.py test` does, never to the real one
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options["keepdb"])
+        try:
+            with override_settings(
+                FOURMIZZZ_URL=f"http://127.0.0.1:{standin.server_address[1]}/{{server}}",
+                FOURMIZZZ_RECORD_DIR="",
+            ):
+                results = {
+                    "ranking": self.bench_ranking(world, options["pages"], options["rounds"]),
+                    "precision": self.bench_precision(world, options["precision_players"]),
+                    "matching": self.bench_matching(options["candidates"], options["matching_samples"]),
+                    "standin": dict(standin.stats),
+                    "options": {
+                        key: options[key]
+                        for key in (
+                            "pages",
+                            "rounds",
+                            "players",
+                            "precision_players",
+                            "matching_samples",
+                            "record_dir",
+                            "seed",
+                        )
+                    },
+                }
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options["keepdb"])
+            standin.shutdown()
+            standin.server_close()
+
+        output = json.dumps(results, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output + "\n")
+        else:
+            self.stdout.write(output)
+
+    def _server(self) -> FourmizzzServer:
+        server, _ = FourmizzzServer.objects.update_or_create(
+            name="s1",
+            defaults={
+                "username": "benchmark",
+                "password": "benchmark",
+                # Measure our own code, not the rate limiter's waits
+                "requests_per_second": 0,
+                "mv_requests_per_second": 0,
+            },
+        )
+        return server
+
+    def bench_ranking(self, world: SyntheticWorld, pages: int, rounds: int) -> Dict:
+        server = self._server()
+        RankingSnapshot.objects.filter(server=server).delete()
+        RankingState.objects.filter(server=server).delete()
+        parse_times, persist_times, task_times = list(), list(), list()
+        persist_queries, task_queries = list(), list()
+        rows_persisted = 0
+        for _ in range(rounds):
+            for page in range(1, pages + 1):
+                html = world.ranking_page(page)
+                parse_times.append(_timed(ranking_rows, html))
+
+                # Persisting on its own, rolled back so the task below sees the same previous values
+                rows = ranking_rows(html) or []
+                with transaction.atomic(), CaptureQueriesContext(connection) as queries:
+                    persist_times.append(_timed(_save_ranking_snapshots, server, rows))
+                    transaction.set_rollback(True)
+                persist_queries.append(len(queries))
+
+                # The whole task: fetch from the stand-in, parse, persist
+                before = RankingSnapshot.objects.count()
+                with CaptureQueriesContext(connection) as queries:
+                    task_times.append(_timed(take_page_ranking_snapshot, server.pk, page))
+                task_queries.append(len(queries))
+                rows_persisted += RankingSnapshot.objects.count() - before
+            world.advance()
+
+        return {
+            "parse_per_page": _summary(parse_times),
+            "persist_per_page": _summary(persist_times),
+            "task_per_page": _summary(task_times),
+            "persist_queries_per_page": statistics.fmean(persist_queries),
+            "task_queries_per_page": statistics.fmean(task_queries),
+            "rows_persisted": rows_persisted,
+            "rows_persisted_per_second": round(rows_persisted / sum(task_times), 1),
+        }
+
+    def bench_precision(self, world: SyntheticWorld, n_players: int) -> Dict:
+        server = self._server()
+        # Players in MV would notify Discord, which is not there
+        names = [name for name, player in world.players.items() if not player[3]][:n_players]
+        players = [
+            PlayerTarget.objects.get_or_create(server=server, name=name)[0] for name in names
+        ]
+        PrecisionSnapshot.objects.filter(player__in=players).delete()
+        PrecisionState.objects.filter(player__in=players).delete()
+        times = list()
+        with CaptureQueriesContext(connection) as queries:
+            for player in players:
+                times.append(_timed(take_player_precision_snapshot, player.pk))
+        return {
+            "snapshot_latency": _summary(times),
+            "queries_per_snapshot": len(queries) / max(1, len(players)),
+        }
+
+    def bench_matching(self, candidate_counts: List[int], samples: int) -> Dict:
+        search = partial(
+            find_combinations,
+            max_size=settings.MATCHING_MAX_SIZE,
+            time_budget=settings.MATCHING_TIME_BUDGET,
+        )
+        results = dict()
+        for n in candidate_counts:
+            matched_times, unmatched_times = list(), list()
+            for _ in range(samples):
+                snapshot_data = [(pk, self.rng.randint(-10**8, 10**8) or 1) for pk in range(n)]
+                # A move explained by three hunters, and one a unit off, which nothing explains:
+                # the full search, not cut short by magnitude
+                hunters = self.rng.sample([move for move in snapshot_data if move[1] > 0], min(3, n // 2))
+                found = sum(diff for _, diff in hunters)
+                matched_times.append(_timed(search, snapshot_data, found))
+                unmatched_times.append(_timed(search, snapshot_data, found + 1))
+            results[str(n)] = {
+                "matched": _summary(matched_times),
+                "unmatched": _summary(unmatched_times),
+            }
+        return results
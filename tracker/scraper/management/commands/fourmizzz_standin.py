@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand
+
+from scraper.standin import StandinServer
+from scraper.standin import SyntheticWorld
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve a local stand-in for the Fourmizzz game, to run the scraper offline. "
+        "Point FOURMIZZZ_URL at http://<host>:<port>/{server}."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument(
+            "--record-dir",
+            default="",
+            help="Serve the pages recorded there (FOURMIZZZ_RECORD_DIR) before synthetic ones",
+        )
+        parser.add_argument("--latency", type=float, default=0.2, help="Seconds added to every page")
+        parser.add_argument(
+            "--session-lifetime",
+            type=float,
+            default=None,
+            help="Seconds a login lasts, unlimited by default",
+        )
+        parser.add_argument(
+            "--no-serialise",
+            action="store_true",
+            help="Let requests of one session run in parallel, unlike the game",
+        )
+        parser.add_argument("--players", type=int, default=5000)
+        parser.add_argument("--moves-per-minute", type=int, default=30)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        world = SyntheticWorld(
+            n_players=options["players"],
+            moves_per_minute=options["moves_per_minute"],
+            seed=options["seed"],
+        )
+        server = StandinServer(
+            (options["host"], options["port"]),
+            world=world,
+            record_dir=options["record_dir"],
+            latency=options["latency"],
+            session_lifetime=options["session_lifetime"],
+            serialise=not options["no_serialise"],
+        )
+        self.stdout.write(f"Stand-in game on http://{options['host']}:{options['port']}/<server>/")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
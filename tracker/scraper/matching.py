@@ -0,0 +1,225 @@
+"""
+Which ranking moves explain a target's move.
+
+When a target loses (or gains) some hunting field or trophies, the players who took it moved by
+the opposite amount in the same minute. Finding them is a subset-sum over the moves of that minute:
+the smallest set of moves adding up to the target's.
+
+find_combinations searches it size by size, so the first size with an answer is the smallest one.
+Each size r is split in the middle: all the combinations of the first r // 2 moves are tabled as
+NumPy arrays sorted by sum, then the combinations of the remaining moves look up the sum they are
+missing, with one searchsorted per chunk of them. That is pairs against single moves for three
+moves, and pairs against pairs for four, instead of trying every combination.
+
+Only moves of the target's opposite sign are kept, and none larger than the target's. A player
+hunting the target gains what the target loses, so the others can only produce coincidences.
+Candidates are sorted by size, which bounds both halves: the first half holds the smallest moves,
+so it adds up to at most its share of the target, and a partial combination is dropped as soon as
+the smallest moves that could complete it overshoot, or the largest ones fall short. The time
+budget is checked between every step, and a search needing more than MAX_TABLE_ROWS combinations
+in memory at once gives up the same way.
+
+MoveWindow holds the ranking moves of a server around the minutes being processed. They are
+loaded once as NumPy arrays sorted by time, and each target's minute is then a slice, found for
+all targets in one searchsorted call.
+"""
+
+import datetime
+import time
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+import numpy as np
+
+# Most partial combinations held in memory at once, in the table of first halves or in a chunk of
+# second halves. A search that would need more gives up, like one out of time.
+MAX_TABLE_ROWS = 2_000_000
+# Second halves are built this many starting moves at a time
+_CHUNK = 128
+
+
+class _OutOfTime(Exception):
+    pass
+
+
+def _check(deadline: Optional[float]) -> None:
+    if deadline is not None and time.monotonic() > deadline:
+        raise _OutOfTime
+
+
+def _expand(begins: np.ndarray, ends: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """For rows with the ranges [begin, end), the row and the index of each element of each range."""
+    counts = np.maximum(ends - begins, 0)
+    total = int(counts.sum())
+    if total > MAX_TABLE_ROWS:
+        raise _OutOfTime
+    rows = np.repeat(np.arange(len(counts)), counts)
+    offsets = np.cumsum(counts) - counts
+    return rows, begins[rows] + np.arange(total) - offsets[rows]
+
+
+def _combinations_within(
+    values: np.ndarray,
+    size: int,
+    first: Tuple[int, int],
+    stop: int,
+    low: int,
+    high: int,
+    deadline: Optional[float],
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    All the combinations of `size` increasing indexes below `stop`, the first one within `first`,
+    whose values add up to between `low` and `high`, as rows of indexes and their sums.
+
+    `values` are sorted ascending, so an index is only taken if the smallest values that could
+    follow it still fit under `high`, and the largest ones can still reach `low`.
+    """
+    indexes = np.empty((1, 0), dtype=np.int64)
+    sums = np.zeros(1, dtype=np.int64)
+    largest = int(values[stop - 1]) if stop else 0
+    for taken in range(size):
+        _check(deadline)
+        left = size - taken
+        if taken:
+            begins, ends = indexes[:, -1] + 1, np.full(len(sums), stop - left + 1)
+        else:
+            begins, ends = np.array([first[0]]), np.array([min(first[1], stop - left + 1)])
+        # The next value v: with at least v for each of the others, v * left <= high - sum
+        ends = np.minimum(ends, np.searchsorted(values, (high - sums) // left, side="right"))
+        # With at most the largest value for each of the others, v >= low - sum - (left - 1) * largest
+        begins = np.maximum(begins, np.searchsorted(values, low - sums - (left - 1) * largest, side="left"))
+        rows, taken_indexes = _expand(begins, ends)
+        indexes = np.column_stack((indexes[rows], taken_indexes))
+        sums = sums[rows] + values[taken_indexes]
+    return indexes, sums
+
+
+def _combinations_adding_up(
+    values: np.ndarray, size: int, target: int, deadline: Optional[float]
+) -> Iterator[Tuple[int, ...]]:
+    """Index tuples of `size` increasing indexes whose values add up to exactly `target`."""
+    n, left = len(values), size // 2
+    if left == 0:
+        begin, end = np.searchsorted(values, [target, target + 1])
+        for i in range(begin, end):
+            yield (int(i),)
+        return
+
+    # The smallest `left` indexes of a combination. Their values are the smallest ones, so they add
+    # up to at most their share of the target; the others can at most all be the largest value.
+    right = size - left
+    firsts, first_sums = _combinations_within(
+        values, left, (0, n), n - right, target - right * int(values[-1]), target * left // size, deadline
+    )
+    if not len(first_sums):
+        return
+    order = np.argsort(first_sums, kind="stable")
+    firsts, first_sums = firsts[order], first_sums[order]
+
+    # The remaining indexes, all after them: each combination is found exactly once. Built a chunk
+    # of starting indexes at a time, each looking up the sum it is missing among the first halves.
+    low, high = target - int(first_sums[-1]), target - int(first_sums[0])
+    for chunk in range(left, n - right + 1, _CHUNK):
+        rests, rest_sums = _combinations_within(
+            values, right, (chunk, chunk + _CHUNK), n, low, high, deadline
+        )
+        _check(deadline)
+        missing = target - rest_sums
+        rows, matches = _expand(
+            np.searchsorted(first_sums, missing, side="left"),
+            np.searchsorted(first_sums, missing, side="right"),
+        )
+        keep = firsts[matches, -1] < rests[rows, 0]
+        for combination in np.column_stack((firsts[matches[keep]], rests[rows[keep]])).tolist():
+            yield tuple(combination)
+
+
+def find_combinations(
+    moves: Sequence[Tuple[int, int]],
+    target: int,
+    max_size: int = 4,
+    time_budget: Optional[float] = None,
+    all_minimal: bool = False,
+    limit: int = 10,
+) -> List[List[int]]:
+    """
+    The smallest combinations of (pk, diff) `moves` whose diffs add up to `target`, as lists of pks.
+
+    By default only the first one found; with `all_minimal`, all of that smallest size, up to
+    `limit`. Empty if there is none with up to `max_size` moves, or if `time_budget` seconds run
+    out first, in which case the combinations already found are returned.
+    """
+    if target == 0:
+        return []
+    sign = 1 if target > 0 else -1
+    candidates = sorted(
+        (diff * sign, pk) for pk, diff in moves if 0 < diff * sign <= target * sign
+    )
+    values = np.array([value for value, _ in candidates], dtype=np.int64)
+    deadline = None if time_budget is None else time.monotonic() + time_budget
+
+    found: List[List[int]] = list()
+    try:
+        for size in range(1, min(max_size, len(values)) + 1):
+            if int(values[:size].sum()) > target * sign:
+                # Even the smallest moves overshoot
+                break
+            for combination in _combinations_adding_up(values, size, target * sign, deadline):
+                found.append([candidates[i][1] for i in combination])
+                if not all_minimal or len(found) >= limit:
+                    return found
+            if found:
+                break
+    except _OutOfTime:
+        pass
+    return found
+
+
+def _microseconds(moment: datetime.datetime) -> int:
+    return round(moment.timestamp() * 1_000_000)
+
+
+class MoveWindow:
+    """
+    Ranking moves as arrays sorted by time: pk, time (in microseconds) and diff per field.
+
+    Built from (pk, time, hunting field diff, trophies diff) rows, in any order.
+    """
+
+    FIELDS = ("hunting_field", "trophies")
+
+    def __init__(self, rows: Sequence[Tuple[int, datetime.datetime, int, int]]):
+        rows = sorted(rows, key=lambda row: row[1])
+        self.pk = np.array([row[0] for row in rows], dtype=np.int64)
+        self.time = np.array([_microseconds(row[1]) for row in rows], dtype=np.int64)
+        self.diffs = {
+            field: np.array([row[2 + i] for row in rows], dtype=np.int64) for i, field in enumerate(self.FIELDS)
+        }
+
+    def slices(self, starts: Sequence[datetime.datetime], ends: Sequence[datetime.datetime]) -> List[Tuple[int, int]]:
+        """The (begin, end) bounds of the moves strictly between each start and its end."""
+        begins = np.searchsorted(self.time, [_microseconds(start) for start in starts], side="right")
+        stops = np.searchsorted(self.time, [_microseconds(end) for end in ends], side="left")
+        return list(zip(begins.tolist(), stops.tolist()))
+
+    def _nonzero(self, field: str, bounds: Tuple[int, int], exclude: int) -> Tuple[np.ndarray, np.ndarray]:
+        pk, diff = self.pk[slice(*bounds)], self.diffs[field][slice(*bounds)]
+        keep = (diff != 0) & (pk != exclude)
+        return pk[keep], diff[keep]
+
+    def has_moves(self, field: str, bounds: Tuple[int, int], exclude: int) -> bool:
+        """Whether anyone but `exclude` moved on that field within these bounds."""
+        return bool(len(self._nonzero(field, bounds, exclude)[0]))
+
+    def candidates(self, field: str, bounds: Tuple[int, int], exclude: int, target: int) -> List[Tuple[int, int]]:
+        """
+        The (pk, diff) moves within these bounds that could add up to `target`: of its sign, and
+        not larger.
+        """
+        pk, diff = self._nonzero(field, bounds, exclude)
+        signed = diff if target > 0 else -diff
+        keep = (signed > 0) & (signed <= abs(target))
+        return list(zip(pk[keep].tolist(), diff[keep].tolist()))
@@ -0,0 +1,60 @@
+# Generated by Django 4.2.6 on 2026-10-18 15:00
+
+import django.db.models.deletion
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scraper", "0005_fourmizzzserver_credentials"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="fourmizzzserver",
+            name="mv_requests_per_second",
+            field=models.FloatField(
+                default=2,
+                help_text="Separate allowance for the vacation checks, so they never wait behind a ranking sweep. 0 for no limit.",
+                verbose_name="MV requests per second",
+            ),
+        ),
+        migrations.AddField(
+            model_name="fourmizzzserver",
+            name="requests_per_second",
+            field=models.FloatField(
+                default=5,
+                help_text="Requests per second all workers together may send this server. 0 for no limit.",
+            ),
+        ),
+        migrations.CreateModel(
+            name="RequestBucket",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("lane", models.CharField(max_length=20)),
+                ("tokens", models.FloatField()),
+                ("updated_at", models.DateTimeField()),
+                (
+                    "server",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="request_buckets",
+                        to="scraper.fourmizzzserver",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("server", "lane")},
+            },
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 4.2.6 on 2026-10-18 15:01
+
+import django.db.models.deletion
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scraper", "0006_request_rate_limits"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="GameSession",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "username",
+                    models.CharField(
+                        help_text="A Fourmizzz account of its own: logging in again with the server's account would end the session the tracker already holds.",
+                        max_length=100,
+                    ),
+                ),
+                ("password", models.CharField(max_length=100)),
+                (
+                    "cookies",
+                    models.JSONField(
+                        default=dict,
+                        editable=False,
+                        help_text="Cookie jar managed by the tracker. Do not edit by hand.",
+                    ),
+                ),
+                (
+                    "last_login_attempt",
+                    models.DateTimeField(blank=True, editable=False, null=True),
+                ),
+                (
+                    "server",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="extra_sessions",
+                        to="scraper.fourmizzzserver",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("server", "username")},
+            },
+        ),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 4.2.6 on 2026-10-18 15:06
+
+import django.db.models.deletion
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scraper", "0007_gamesession"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PrecisionState",
+            fields=[
+                (
+                    "player",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="precision_state",
+                        serialize=False,
+                        to="scraper.playertarget",
+                    ),
+                ),
+                ("hunting_field", models.PositiveBigIntegerField()),
+                ("trophies", models.IntegerField()),
+                ("time", models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name="RankingState",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("player_name", models.CharField(max_length=100)),
+                ("hunting_field", models.PositiveBigIntegerField()),
+                ("trophies", models.IntegerField()),
+                ("time", models.DateTimeField()),
+                ("snapshot_id", models.BigIntegerField()),
+                (
+                    "server",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="scraper.fourmizzzserver",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("server", "player_name")},
+            },
+        ),
+        # Start from the snapshots already there, so the next diffs are not lost
+        migrations.RunSQL(
+            sql="""
+                INSERT INTO scraper_rankingstate (server_id, player_name, hunting_field, trophies, time, snapshot_id)
+                SELECT DISTINCT ON (server_id, player_name)
+                    server_id, player_name, hunting_field, trophies, time, id
+                FROM scraper_rankingsnapshot
+                ORDER BY server_id, player_name, id DESC;
+
+                INSERT INTO scraper_precisionstate (player_id, hunting_field, trophies, time)
+                SELECT DISTINCT ON (player_id) player_id, hunting_field, trophies, time
+                FROM scraper_precisionsnapshot
+                ORDER BY player_id, id DESC;
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
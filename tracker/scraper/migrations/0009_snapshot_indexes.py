@@ -0,0 +1,44 @@
+# Generated by Django 4.2.6 on 2026-10-18 15:20
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+    # Built concurrently, so the scraper keeps writing snapshots meanwhile
+    atomic = False
+
+    dependencies = [
+        ("scraper", "0008_latest_state"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="precisionsnapshot",
+            index=models.Index(
+                fields=["player", "-time"], name="precisionsnap_player_time_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="precisionsnapshot",
+            index=models.Index(
+                condition=models.Q(("processed", False)),
+                fields=["player"],
+                name="precisionsnap_unprocessed_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="rankingsnapshot",
+            index=models.Index(
+                fields=["server", "player_name", "-time"],
+                name="rankingsnap_player_time_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="rankingsnapshot",
+            index=models.Index(
+                fields=["server", "time"], name="rankingsnap_server_time_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,181 @@
+# Generated by Django 4.2.6 on 2026-10-18 15:40
+
+from django.db import migrations
+
+# Both snapshot tables become partitioned by day on `time` (see scraper.partitions). Postgres needs
+# the partition key in the primary key, so it becomes (id, time); ids still come from one sequence
+# and stay unique. Models are unchanged, so this is database-only.
+PARTITION_TABLE_SQL = """
+-- Workers may still be writing: they wait until the migration commits rather than have their rows
+-- committed after the copy below and dropped with the table. Reads go on.
+LOCK TABLE {table} IN EXCLUSIVE MODE;
+CREATE SEQUENCE {table}_new_id_seq;
+CREATE TABLE {table}_new (
+    id bigint NOT NULL DEFAULT nextval('{table}_new_id_seq'),
+    {columns},
+    PRIMARY KEY (id, time)
+) PARTITION BY RANGE (time);
+
+DO $$
+DECLARE
+    day date := COALESCE((SELECT min(time) AT TIME ZONE 'UTC' FROM {table})::date, current_date);
+BEGIN
+    WHILE day <= current_date + 3 LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF {table}_new FOR VALUES FROM (%L) TO (%L)',
+            '{table}_p' || to_char(day, 'YYYYMMDD'),
+            day::timestamp AT TIME ZONE 'UTC',
+            (day + 1)::timestamp AT TIME ZONE 'UTC'
+        );
+        day := day + 1;
+    END LOOP;
+END $$;
+CREATE TABLE {table}_default PARTITION OF {table}_new DEFAULT;
+
+INSERT INTO {table}_new ({names}) SELECT {names} FROM {table};
+-- Check the copied foreign keys now: pending checks would block the CREATE INDEX below
+SET CONSTRAINTS ALL IMMEDIATE;
+SELECT setval('{table}_new_id_seq', COALESCE((SELECT max(id) FROM {table}), 0) + 1, false);
+
+DROP TABLE {table};
+ALTER TABLE {table}_new RENAME TO {table};
+ALTER SEQUENCE {table}_new_id_seq RENAME TO {table}_id_seq;
+ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id;
+"""
+
+# The indexes created on the parent table are copied to each partition under generated, truncated
+# names. Name them after the parent index and the partition instead, e.g.
+# rankingsnap_player_time_idx_p20261018, as scraper.partitions does for the partitions it creates.
+NAME_PARTITION_INDEXES_SQL = """
+DO $$
+DECLARE
+    child_index record;
+BEGIN
+    FOR child_index IN
+        SELECT child.relname AS name, parent.relname || substr(part.relname, length('{table}') + 1) AS new_name
+        FROM pg_index
+        JOIN pg_class child ON child.oid = pg_index.indexrelid
+        JOIN pg_class part ON part.oid = pg_index.indrelid
+        JOIN pg_inherits index_inherits ON index_inherits.inhrelid = child.oid
+        JOIN pg_class parent ON parent.oid = index_inherits.inhparent
+        JOIN pg_inherits table_inherits ON table_inherits.inhrelid = part.oid
+        WHERE table_inherits.inhparent = '{table}'::regclass AND NOT pg_index.indisprimary
+    LOOP
+        EXECUTE format('ALTER INDEX %I RENAME TO %I', child_index.name, child_index.new_name);
+    END LOOP;
+END $$;
+"""
+
+# Back to one plain table, with the constraint and index names Django gave it up to 0009. All the
+# partitions, past and future, are copied back into it.
+UNPARTITION_TABLE_SQL = """
+LOCK TABLE {table} IN EXCLUSIVE MODE;
+CREATE TABLE {table}_old (
+    id bigint GENERATED BY DEFAULT AS IDENTITY,
+    {columns},
+    CONSTRAINT {table}_pkey PRIMARY KEY (id)
+);
+INSERT INTO {table}_old ({names}) SELECT {names} FROM {table};
+SET CONSTRAINTS ALL IMMEDIATE;
+SELECT setval(pg_get_serial_sequence('{table}_old', 'id'), COALESCE(max(id), 0) + 1, false) FROM {table};
+
+DROP TABLE {table};
+ALTER TABLE {table}_old RENAME TO {table};
+ALTER SEQUENCE {table}_old_id_seq RENAME TO {table}_id_seq;
+ALTER TABLE {table} RENAME CONSTRAINT {table}_old_hunting_field_check TO {table}_hunting_field_check;
+ALTER TABLE {table} RENAME CONSTRAINT {table}_old_{foreign_key}_fkey TO {foreign_key_name};
+"""
+
+RANKING_COLUMNS = """
+    time timestamp with time zone NOT NULL,
+    player_name varchar(100) NOT NULL,
+    hunting_field bigint NOT NULL CHECK (hunting_field >= 0),
+    trophies integer NOT NULL,
+    hunting_field_diff bigint NOT NULL,
+    trophies_diff integer NOT NULL,
+    server_id bigint NOT NULL REFERENCES scraper_fourmizzzserver (id) DEFERRABLE INITIALLY DEFERRED
+"""
+
+PRECISION_COLUMNS = """
+    time timestamp with time zone NOT NULL,
+    hunting_field bigint NOT NULL CHECK (hunting_field >= 0),
+    trophies integer NOT NULL,
+    hunting_field_diff bigint NOT NULL,
+    trophies_diff integer NOT NULL,
+    processed boolean NOT NULL,
+    player_id bigint NOT NULL REFERENCES scraper_playertarget (id) DEFERRABLE INITIALLY DEFERRED
+"""
+
+
+def _column_names(columns: str) -> str:
+    return ", ".join(["id"] + [line.split()[0] for line in columns.strip().splitlines()])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scraper", "0009_snapshot_indexes"),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            PARTITION_TABLE_SQL.format(
+                table="scraper_rankingsnapshot",
+                columns=RANKING_COLUMNS.strip(),
+                names=_column_names(RANKING_COLUMNS),
+            )
+            # The indexes of 0009, now partitioned indexes. They also cover the index Django adds
+            # for the foreign key, which is not recreated.
+            + """
+            CREATE INDEX rankingsnap_player_time_idx
+                ON scraper_rankingsnapshot (server_id, player_name, time DESC);
+            CREATE INDEX rankingsnap_server_time_idx
+                ON scraper_rankingsnapshot (server_id, time);
+            """
+            + NAME_PARTITION_INDEXES_SQL.format(table="scraper_rankingsnapshot"),
+            reverse_sql=UNPARTITION_TABLE_SQL.format(
+                table="scraper_rankingsnapshot",
+                columns=RANKING_COLUMNS.strip(),
+                names=_column_names(RANKING_COLUMNS),
+                foreign_key="server_id",
+                foreign_key_name="scraper_rankingsnaps_server_id_af878bbf_fk_scraper_f",
+            )
+            + """
+            CREATE INDEX scraper_rankingsnapshot_server_id_af878bbf
+                ON scraper_rankingsnapshot (server_id);
+            CREATE INDEX rankingsnap_player_time_idx
+                ON scraper_rankingsnapshot (server_id, player_name, time DESC);
+            CREATE INDEX rankingsnap_server_time_idx
+                ON scraper_rankingsnapshot (server_id, time);
+            """,
+        ),
+        migrations.RunSQL(
+            PARTITION_TABLE_SQL.format(
+                table="scraper_precisionsnapshot",
+                columns=PRECISION_COLUMNS.strip(),
+                names=_column_names(PRECISION_COLUMNS),
+            )
+            + """
+            CREATE INDEX precisionsnap_player_time_idx
+                ON scraper_precisionsnapshot (player_id, time DESC);
+            CREATE INDEX precisionsnap_unprocessed_idx
+                ON scraper_precisionsnapshot (player_id) WHERE NOT processed;
+            """
+            + NAME_PARTITION_INDEXES_SQL.format(table="scraper_precisionsnapshot"),
+            reverse_sql=UNPARTITION_TABLE_SQL.format(
+                table="scraper_precisionsnapshot",
+                columns=PRECISION_COLUMNS.strip(),
+                names=_column_names(PRECISION_COLUMNS),
+                foreign_key="player_id",
+                foreign_key_name="scraper_precisionsna_player_id_c4e43d65_fk_scraper_p",
+            )
+            + """
+            CREATE INDEX scraper_precisionsnapshot_player_id_c4e43d65
+                ON scraper_precisionsnapshot (player_id);
+            CREATE INDEX precisionsnap_player_time_idx
+                ON scraper_precisionsnapshot (player_id, time DESC);
+            CREATE INDEX precisionsnap_unprocessed_idx
+                ON scraper_precisionsnapshot (player_id) WHERE NOT processed;
+            """,
+        ),
+    ]
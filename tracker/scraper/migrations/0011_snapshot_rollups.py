@@ -0,0 +1,105 @@
+# Generated by Django 4.2.6 on 2026-10-18 16:00
+
+import django.db.models.deletion
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scraper", "0010_partition_snapshots"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RankingRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "period",
+                    models.CharField(
+                        choices=[("hour", "Hour"), ("day", "Day")],
+                        editable=False,
+                        max_length=4,
+                    ),
+                ),
+                ("start", models.DateTimeField(editable=False)),
+                ("n_snapshots", models.IntegerField(editable=False)),
+                ("first_hunting_field", models.PositiveBigIntegerField(editable=False)),
+                ("last_hunting_field", models.PositiveBigIntegerField(editable=False)),
+                ("min_hunting_field", models.PositiveBigIntegerField(editable=False)),
+                ("max_hunting_field", models.PositiveBigIntegerField(editable=False)),
+                ("hunting_field_moved", models.PositiveBigIntegerField(editable=False)),
+                ("first_trophies", models.IntegerField(editable=False)),
+                ("last_trophies", models.IntegerField(editable=False)),
+                ("min_trophies", models.IntegerField(editable=False)),
+                ("max_trophies", models.IntegerField(editable=False)),
+                ("trophies_moved", models.PositiveBigIntegerField(editable=False)),
+                ("player_name", models.CharField(editable=False, max_length=100)),
+                (
+                    "server",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="scraper.fourmizzzserver",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("server", "player_name", "period", "start")},
+            },
+        ),
+        migrations.CreateModel(
+            name="PrecisionRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "period",
+                    models.CharField(
+                        choices=[("hour", "Hour"), ("day", "Day")],
+                        editable=False,
+                        max_length=4,
+                    ),
+                ),
+                ("start", models.DateTimeField(editable=False)),
+                ("n_snapshots", models.IntegerField(editable=False)),
+                ("first_hunting_field", models.PositiveBigIntegerField(editable=False)),
+                ("last_hunting_field", models.PositiveBigIntegerField(editable=False)),
+                ("min_hunting_field", models.PositiveBigIntegerField(editable=False)),
+                ("max_hunting_field", models.PositiveBigIntegerField(editable=False)),
+                ("hunting_field_moved", models.PositiveBigIntegerField(editable=False)),
+                ("first_trophies", models.IntegerField(editable=False)),
+                ("last_trophies", models.IntegerField(editable=False)),
+                ("min_trophies", models.IntegerField(editable=False)),
+                ("max_trophies", models.IntegerField(editable=False)),
+                ("trophies_moved", models.PositiveBigIntegerField(editable=False)),
+                (
+                    "player",
+                    models.ForeignKey(
+                        editable=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="scraper.playertarget",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("player", "period", "start")},
+            },
+        ),
+    ]
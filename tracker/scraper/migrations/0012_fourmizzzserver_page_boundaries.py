@@ -0,0 +1,23 @@
+# Generated by Django 4.2.6 on 2026-10-18 17:30
+
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scraper", "0011_snapshot_rollups"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="fourmizzzserver",
+            name="page_boundaries",
+            field=models.JSONField(
+                default=dict,
+                editable=False,
+                help_text="Lowest hunting field of each ranking page, as last seen. Managed by the tracker.",
+            ),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.6 on 2026-10-18 19:10
+
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scraper", "0012_fourmizzzserver_page_boundaries"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="fourmizzzserver",
+            name="precision_polls_per_minute",
+            field=models.IntegerField(
+                default=0,
+                help_text="Most targets polled for precision snapshots per minute, the most recently active first. The others wait for the next minute. 0 for no limit.",
+            ),
+        ),
+        migrations.AddField(
+            model_name="playertarget",
+            name="next_poll_at",
+            field=models.DateTimeField(
+                blank=True,
+                editable=False,
+                help_text="When the target is due for its next precision snapshot. Managed by the tracker.",
+                null=True,
+            ),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.2.6 on 2026-10-18 19:40
+
+import django.db.models.deletion
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scraper", "0013_precision_polling"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="JobLease",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("job", models.CharField(max_length=50)),
+                ("holder", models.CharField(blank=True, default="", max_length=100)),
+                ("acquired_at", models.DateTimeField(blank=True, null=True)),
+                ("expires_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "n_skipped",
+                    models.PositiveIntegerField(
+                        default=0,
+                        help_text="Ticks skipped because the previous run was still going.",
+                    ),
+                ),
+                ("last_skipped_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "server",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="job_leases",
+                        to="scraper.fourmizzzserver",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("server", "job")},
+            },
+        ),
+    ]
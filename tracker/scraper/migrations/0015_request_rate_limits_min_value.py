@@ -0,0 +1,34 @@
+# Generated by Django 4.2.6 on 2026-10-18 15:47
+
+import django.core.validators
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scraper", "0014_joblease"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="fourmizzzserver",
+            name="mv_requests_per_second",
+            field=models.FloatField(
+                default=2,
+                help_text="Separate allowance for the vacation checks, so they never wait behind a ranking sweep. 0 for no limit.",
+                validators=[django.core.validators.MinValueValidator(0)],
+                verbose_name="MV requests per second",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="fourmizzzserver",
+            name="requests_per_second",
+            field=models.FloatField(
+                default=5,
+                help_text="Requests per second all workers together may send this server. 0 for no limit.",
+                validators=[django.core.validators.MinValueValidator(0)],
+            ),
+        ),
+    ]
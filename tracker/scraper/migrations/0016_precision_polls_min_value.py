@@ -0,0 +1,24 @@
+# Generated by Django 4.2.6 on 2026-10-18 15:58
+
+import django.core.validators
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scraper", "0015_request_rate_limits_min_value"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="fourmizzzserver",
+            name="precision_polls_per_minute",
+            field=models.IntegerField(
+                default=0,
+                help_text="Most targets polled for precision snapshots per minute, the most recently active first. The others wait for the next minute. 0 for no limit.",
+                validators=[django.core.validators.MinValueValidator(0)],
+            ),
+        ),
+    ]
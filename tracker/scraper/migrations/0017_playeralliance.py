@@ -0,0 +1,43 @@
+# Generated by Django 4.2.6 on 2026-10-18 16:01
+
+import django.db.models.deletion
+from django.db import migrations
+from django.db import models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scraper", "0016_precision_polls_min_value"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PlayerAlliance",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("player_name", models.CharField(max_length=100)),
+                ("alliance", models.CharField(blank=True, max_length=100)),
+                ("updated_at", models.DateTimeField()),
+                (
+                    "server",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="player_alliances",
+                        to="scraper.fourmizzzserver",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("server", "player_name")},
+            },
+        ),
+    ]
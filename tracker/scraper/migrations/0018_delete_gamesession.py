@@ -0,0 +1,16 @@
+# Generated by Django 4.2.6 on 2026-10-18 16:20
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("scraper", "0017_playeralliance"),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name="GameSession",
+        ),
+    ]
@@ -1,3 +1,4 @@
+from django.core.validators import MinValueValidator
 from django.db import models
 
 from scraper.web_agent import get_alliance_members
@@ -32,11 +33,98 @@ class FourmizzzServer(models.Model):
     n_scanned_pages = models.fields.IntegerField(
         verbose_name="Number of scanned pages", default=100
     )
+    page_boundaries = models.JSONField(
+        default=dict,
+        editable=False,
+        help_text="Lowest hunting field of each ranking page, as last seen. Managed by the tracker.",
+    )
+    requests_per_second = models.fields.FloatField(
+        default=5,
+        validators=[MinValueValidator(0)],
+        help_text="Requests per second all workers together may send this server. 0 for no limit.",
+    )
+    mv_requests_per_second = models.fields.FloatField(
+        verbose_name="MV requests per second",
+        default=2,
+        validators=[MinValueValidator(0)],
+        help_text="Separate allowance for the vacation checks, so they never wait behind a ranking "
+        "sweep. 0 for no limit.",
+    )
+    precision_polls_per_minute = models.fields.IntegerField(
+        default=0,
+        validators=[MinValueValidator(0)],
+        help_text="Most targets polled for precision snapshots per minute, the most recently active "
+        "first. The others wait for the next minute. 0 for no limit.",
+    )
 
     def __str__(self):
         return f"{self.name}"
 
 
+class RequestBucket(models.Model):
+    """
+    Token bucket limiting the requests sent to a server, shared by every worker.
+
+    `tokens` may go negative: each one below zero is a request already promised a later slot.
+    """
+
+    server = models.ForeignKey(
+        FourmizzzServer, on_delete=models.CASCADE, related_name="request_buckets"
+    )
+    lane = models.fields.CharField(max_length=20)
+    tokens = models.fields.FloatField()
+    updated_at = models.fields.DateTimeField()
+
+    class Meta:
+        unique_together = ("server", "lane")
+
+
+class JobLease(models.Model):
+    """
+    Single-flight lease of a periodic job on a server, shared by every worker. See scraper.leases.
+
+    A run holds it from its tick until it is released or `expires_at` passes. The ticks that find
+    it held are skipped and counted here.
+    """
+
+    server = models.ForeignKey(
+        FourmizzzServer, on_delete=models.CASCADE, related_name="job_leases"
+    )
+    job = models.fields.CharField(max_length=50)
+    holder = models.fields.CharField(max_length=100, blank=True, default="")
+    acquired_at = models.fields.DateTimeField(null=True, blank=True)
+    expires_at = models.fields.DateTimeField(null=True, blank=True)
+    n_skipped = models.fields.PositiveIntegerField(
+        default=0, help_text="Ticks skipped because the previous run was still going."
+    )
+    last_skipped_at = models.fields.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ("server", "job")
+
+    def __str__(self) -> str:
+        return f"{self.job} ({self.server.name})"
+
+
+class PlayerAlliance(models.Model):
+    """
+    The alliance of any player of a server, as last read from its member page or its alliance's
+    page, shared by every worker. Notifications name many players at once, and their alliances are
+    trusted for PLAYER_ALLIANCE_MAX_AGE (see web_agent.get_player_alliances).
+    """
+
+    server = models.ForeignKey(
+        FourmizzzServer, on_delete=models.CASCADE, related_name="player_alliances"
+    )
+    player_name = models.fields.CharField(max_length=100)
+    # "" for none
+    alliance = models.fields.CharField(max_length=100, blank=True)
+    updated_at = models.fields.DateTimeField()
+
+    class Meta:
+        unique_together = ("server", "player_name")
+
+
 class AllianceTarget(models.Model):
     name = models.CharField(max_length=100)
     server = models.ForeignKey(FourmizzzServer, on_delete=models.CASCADE)
@@ -75,6 +163,12 @@ class PlayerTarget(models.Model):
         editable=False,  # Make PlayerTargets not editable by the user
     )
     mv = models.fields.BooleanField(default=False)
+    next_poll_at = models.fields.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="When the target is due for its next precision snapshot. Managed by the tracker.",
+    )
 
     class Meta:
         unique_together = ("server", "name")
@@ -92,6 +186,20 @@ class PrecisionSnapshot(models.Model):
     trophies_diff = models.fields.IntegerField(editable=False, default=0)
     processed = models.fields.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            # A target's history, latest first
+            models.Index(
+                fields=["player", "-time"], name="precisionsnap_player_time_idx"
+            ),
+            # The snapshots waiting for process_snapshots, a handful among the whole history
+            models.Index(
+                fields=["player"],
+                name="precisionsnap_unprocessed_idx",
+                condition=models.Q(processed=False),
+            ),
+        ]
+
 
 class RankingSnapshot(models.Model):
     time = models.fields.DateTimeField(auto_now_add=True)
@@ -101,3 +209,94 @@ class RankingSnapshot(models.Model):
     trophies = models.fields.IntegerField(editable=False)
     hunting_field_diff = models.fields.BigIntegerField(editable=False, default=0)
     trophies_diff = models.fields.IntegerField(editable=False, default=0)
+
+    class Meta:
+        indexes = [
+            # A player's history, latest first
+            models.Index(
+                fields=["server", "player_name", "-time"],
+                name="rankingsnap_player_time_idx",
+            ),
+            # Everything scraped on a server in a time window, for matching simultaneous moves
+            models.Index(fields=["server", "time"], name="rankingsnap_server_time_idx"),
+        ]
+
+
+class RankingState(models.Model):
+    """
+    The latest ranking values of each player, kept next to the snapshot history.
+
+    Written in the same transaction as the ranking snapshots, so finding a player's previous
+    values is a key lookup instead of a scan of the history. `snapshot_id` is the snapshot that
+    last changed them.
+    """
+
+    server = models.ForeignKey(FourmizzzServer, on_delete=models.CASCADE)
+    player_name = models.fields.CharField(max_length=100)
+    hunting_field = models.fields.PositiveBigIntegerField()
+    trophies = models.fields.IntegerField()
+    time = models.fields.DateTimeField()
+    snapshot_id = models.fields.BigIntegerField()
+
+    class Meta:
+        unique_together = ("server", "player_name")
+
+
+class PrecisionState(models.Model):
+    """The latest precision values of a target, written with its precision snapshots."""
+
+    player = models.OneToOneField(
+        PlayerTarget,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="precision_state",
+    )
+    hunting_field = models.fields.PositiveBigIntegerField()
+    trophies = models.fields.IntegerField()
+    time = models.fields.DateTimeField()
+
+
+class SnapshotRollup(models.Model):
+    """
+    A player's snapshots of one hour or one day, summed up. See scraper.rollups.
+
+    Raw snapshots only live a few days; these keep the history at a fraction of the size.
+    """
+
+    HOUR = "hour"
+    DAY = "day"
+
+    period = models.fields.CharField(
+        max_length=4, choices=[(HOUR, "Hour"), (DAY, "Day")], editable=False
+    )
+    start = models.fields.DateTimeField(editable=False)
+    n_snapshots = models.fields.IntegerField(editable=False)
+    first_hunting_field = models.fields.PositiveBigIntegerField(editable=False)
+    last_hunting_field = models.fields.PositiveBigIntegerField(editable=False)
+    min_hunting_field = models.fields.PositiveBigIntegerField(editable=False)
+    max_hunting_field = models.fields.PositiveBigIntegerField(editable=False)
+    # Sum of the absolute diffs: how much moved, gains and losses alike
+    hunting_field_moved = models.fields.PositiveBigIntegerField(editable=False)
+    first_trophies = models.fields.IntegerField(editable=False)
+    last_trophies = models.fields.IntegerField(editable=False)
+    min_trophies = models.fields.IntegerField(editable=False)
+    max_trophies = models.fields.IntegerField(editable=False)
+    trophies_moved = models.fields.PositiveBigIntegerField(editable=False)
+
+    class Meta:
+        abstract = True
+
+
+class RankingRollup(SnapshotRollup):
+    server = models.ForeignKey(FourmizzzServer, on_delete=models.CASCADE)
+    player_name = models.fields.CharField(max_length=100, editable=False)
+
+    class Meta:
+        unique_together = ("server", "player_name", "period", "start")
+
+
+class PrecisionRollup(SnapshotRollup):
+    player = models.ForeignKey(PlayerTarget, on_delete=models.CASCADE, editable=False)
+
+    class Meta:
+        unique_together = ("player", "period", "start")
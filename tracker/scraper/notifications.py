@@ -0,0 +1,163 @@
+"""
+Move notifications: what a target did, and which ranking moves match it.
+
+Rendering loads everything it needs up front: the matched ranking snapshots in one query, and the
+alliance of everyone named in one lookup per server (see get_player_alliances). Every message is
+then built from those records, so its cost no longer grows with the number of lines.
+
+Each message is rendered and sent on its own: one that cannot be rendered or that Discord refuses
+is logged and does not keep the others from going out.
+"""
+
+import logging
+from typing import Dict
+from typing import List
+from typing import Literal
+from typing import NamedTuple
+from typing import Optional
+from typing import Set
+from typing import Tuple
+from typing import Union
+
+import pytz
+from django.utils import timezone
+
+from scraper.models import FourmizzzServer
+from scraper.models import PlayerTarget
+from scraper.models import PrecisionSnapshot
+from scraper.models import RankingSnapshot
+from scraper.utils import send_message
+from scraper.web_agent import get_player_alliances
+from tracker.settings import TIME_ZONE
+
+logger = logging.getLogger(__name__)
+
+
+class MoveNotification(NamedTuple):
+    """A target's move on one field, and the pks of the ranking snapshots of each explanation."""
+
+    player_target: PlayerTarget
+    precision_snapshots: List[PrecisionSnapshot]
+    explanations: List[List[int]]
+    field_name: Literal["hunting_field", "trophies"]
+
+
+def format_move(
+    server_name: str,
+    player_name: str,
+    alliance_name: Optional[str],
+    snapshot: Union[PrecisionSnapshot, RankingSnapshot],
+    field_name: Literal["hunting_field", "trophies"],
+    timestamp: bool = True,
+) -> str:
+    alliance = (
+        ""
+        if alliance_name is None
+        else f"([{alliance_name}](http://{server_name}.fourmizzz.fr/classementAlliance.php?alliance={alliance_name}))"
+    )
+    field_before = "{:,}".format(
+        getattr(snapshot, field_name) - getattr(snapshot, f"{field_name}_diff")
+    ).replace(",", " ")
+    field_after = "{:,}".format(getattr(snapshot, field_name)).replace(",", " ")
+    field_diff = "{:+,}".format(getattr(snapshot, f"{field_name}_diff")).replace(",", " ")
+    snapshot_time = timezone.localtime(snapshot.time, pytz.timezone(TIME_ZONE))
+    message = (
+        f"[{player_name}](http://{server_name}.fourmizzz.fr/Membre.php?Pseudo={player_name}){alliance}: "
+        f"{field_before} -> {field_after} ({field_diff})\n"
+    )
+    if timestamp:
+        message = snapshot_time.strftime("%d/%m/%Y %H:%M \n") + message
+    return message
+
+
+def load_related(
+    notifications: List[MoveNotification],
+) -> Tuple[Dict[int, RankingSnapshot], Dict[int, Dict[str, Optional[str]]]]:
+    """The ranking snapshots of every explanation by pk, and the alliances of everyone named per server pk."""
+    ranking_snapshots = RankingSnapshot.objects.in_bulk(
+        [
+            pk
+            for notification in notifications
+            for explanation in notification.explanations
+            for pk in explanation
+        ]
+    )
+    # Everyone named, per server
+    names: Dict[int, Tuple[FourmizzzServer, Set[str]]] = dict()
+    for notification in notifications:
+        server = notification.player_target.server
+        _, server_names = names.setdefault(server.pk, (server, set()))
+        server_names.add(notification.player_target.name)
+        for explanation in notification.explanations:
+            # A snapshot cleaned away since the match fails its own message, in render
+            server_names.update(ranking_snapshots[pk].player_name for pk in explanation if pk in ranking_snapshots)
+    alliances = {
+        server_pk: get_player_alliances(server, sorted(server_names))
+        for server_pk, (server, server_names) in names.items()
+    }
+    return ranking_snapshots, alliances
+
+
+def render(
+    notification: MoveNotification,
+    ranking_snapshots: Dict[int, RankingSnapshot],
+    alliances: Dict[int, Dict[str, Optional[str]]],
+) -> str:
+    """The notification's message, from what load_related loaded."""
+    player_target, precision_snapshots, explanations, field_name = notification
+    server = player_target.server
+    server_alliances = alliances[server.pk]
+    message = "Mouvements de la cible:\n"
+    for precision_snapshot in precision_snapshots:
+        if getattr(precision_snapshot, f"{field_name}_diff") != 0:
+            message += format_move(
+                server.name,
+                player_target.name,
+                server_alliances[player_target.name],
+                precision_snapshot,
+                field_name=field_name,
+            )
+
+    for i, explanation in enumerate(explanations or [[]]):
+        message += (
+            "\nMouvements correspondants:\n"
+            if len(explanations) <= 1
+            else f"\nMouvements correspondants (possibilité {i + 1}):\n"
+        )
+        for pk in explanation:
+            ranking_snapshot = ranking_snapshots[pk]
+            move = format_move(
+                server.name,
+                ranking_snapshot.player_name,
+                server_alliances[ranking_snapshot.player_name],
+                ranking_snapshot,
+                field_name=field_name,
+                timestamp=False,
+            )
+            message += f"{move}\n"
+    return message
+
+
+def send_move_notifications(notifications: List[MoveNotification]) -> int:
+    """Send every notification, and return how many went out."""
+    ranking_snapshots, alliances = load_related(notifications)
+    n_sent = 0
+    for notification in notifications:
+        player_target, field_name = notification.player_target, notification.field_name
+        alliance = player_target.alliance
+        try:
+            message = render(notification, ranking_snapshots, alliances)
+            send_message(
+                player_target.server.name,
+                alliance.name if alliance is not None else player_target.name,
+                player_target.name,
+                "Mouvement de Tdc" if field_name == "hunting_field" else "Mouvement de Trophées",
+                message,
+                color="80ff00" if field_name == "hunting_field" else "ffd700",
+                silent=field_name == "hunting_field",
+            )
+        except Exception:
+            logger.exception("Could not send the move notification of %s", player_target)
+        else:
+            n_sent += 1
+    return n_sent
@@ -0,0 +1,150 @@
+"""
+Extraction of the data we use from game pages.
+
+Building a full tree of every page is the main CPU cost of a sweep, while each page only has one
+region we care about. So every extractor here parses just that region (a `SoupStrainer`) and hands
+back plain values, never a tree.
+
+The backend is picked with the HTML_PARSER setting: "lxml" (default) or "html.parser" (pure
+Python, always available). A backend that is not installed falls back to "html.parser".
+"""
+
+import importlib.util
+import logging
+from functools import lru_cache
+from typing import List
+from typing import NamedTuple
+from typing import Optional
+from typing import Tuple
+
+from bs4 import BeautifulSoup
+from bs4 import SoupStrainer
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Shown on Membre.php instead of the profile when nobody has that name
+UNKNOWN_PLAYER_MARKER = "Aucun joueurs avec le pseudo"
+MV_MARKER = "Joueur en vacances"
+HUNTING_FIELD_SELECTOR = (
+    "#centre > center > div:nth-child(2) > div:nth-child(3) > table > tr:nth-child(2) > td:nth-child(2)"
+)
+
+
+class ParseError(Exception):
+    """The page does not have the structure we expect from it."""
+
+
+class MemberProfile(NamedTuple):
+    """Everything we read from a player's Membre.php page."""
+
+    exists: bool
+    hunting_field: Optional[int] = None
+    trophies: Optional[int] = None
+    mv: bool = False
+    alliance: Optional[str] = None
+
+
+@lru_cache(maxsize=None)
+def backend() -> str:
+    wanted = getattr(settings, "HTML_PARSER", "lxml")
+    if wanted != "html.parser" and importlib.util.find_spec(wanted) is None:
+        logger.warning("HTML parser '%s' is not installed, using html.parser instead", wanted)
+        return "html.parser"
+    return wanted
+
+
+def make_soup(html: str, parse_only: Optional[SoupStrainer] = None) -> BeautifulSoup:
+    return BeautifulSoup(html, backend(), parse_only=parse_only)
+
+
+def _to_int(text: str) -> int:
+    # Thousands are separated by spaces, sometimes non-breaking ones
+    return int(text.replace(" ", "").replace("\xa0", ""))
+
+
+def ranking_rows(html: str) -> Optional[List[Tuple[str, int, int]]]:
+    """
+    (player name, hunting field, trophies) for each row of a classement2.php page, or None if the
+    page does not exist.
+    """
+    soup = make_soup(html, parse_only=SoupStrainer("table", {"class": "tab_triable"}))
+    table = soup.find("table", {"class": "tab_triable"})
+    if table is None:
+        return None
+    rows = list()
+    for row in table.find_all("tr")[1:]:
+        _, player_name, hunting_field, _, _, trophies = row.find_all("td")
+        rows.append(
+            (
+                player_name.find("a").text,
+                _to_int(hunting_field.text),
+                _to_int(trophies.text),
+            )
+        )
+    return rows
+
+
+def member_profile(html: str) -> MemberProfile:
+    """
+    Read a Membre.php page.
+
+    Raises ParseError if the player exists but the page lacks the member box, which everything
+    else on the page hangs off. A missing hunting field or trophy count is left as None for the
+    caller to report, as only some callers need them.
+    """
+    soup = make_soup(html, parse_only=SoupStrainer(id="centre"))
+    centre = soup.find(id="centre")
+    if centre is None:
+        raise ParseError("no #centre block on the member page")
+    if UNKNOWN_PLAYER_MARKER in centre.text:
+        return MemberProfile(exists=False)
+
+    boite_membre = centre.find("div", {"class": "boite_membre"})
+    if boite_membre is None or boite_membre.find("table") is None:
+        raise ParseError("no member box on the member page")
+
+    hunting_field = None
+    cell = soup.select_one(HUNTING_FIELD_SELECTOR)
+    if cell is not None:
+        try:
+            hunting_field = _to_int(cell.text)
+        except ValueError:
+            pass
+
+    trophies = None
+    tableau_score = centre.find("table", {"class": "tableau_score"})
+    if tableau_score is not None:
+        try:
+            trophies = _to_int(tableau_score.find_all("tr")[4].find_all("td")[1].text)
+        except (IndexError, ValueError):
+            pass
+
+    return MemberProfile(
+        exists=True,
+        hunting_field=hunting_field,
+        trophies=trophies,
+        mv=MV_MARKER in boite_membre.text,
+        alliance=_member_alliance(boite_membre.find("table")),
+    )
+
+
+def _member_alliance(boite_membre_table) -> Optional[str]:
+    """The alliance named in the member box, or None if the player has no alliance."""
+    try:
+        trs = boite_membre_table.find_all("tr")
+        alliance_tr = trs[0] if "Alliance" in trs[0].text else trs[1]
+        alliance_a = alliance_tr.find_all("td")[1].find("a")
+    except IndexError:
+        raise ParseError("no alliance row in the member box")
+    return None if not alliance_a else alliance_a.text
+
+
+def alliance_members(html: str) -> List[str]:
+    """Member names listed on a classementAlliance.php page, empty if the alliance is unknown."""
+    soup = make_soup(html, parse_only=SoupStrainer(id="tabMembresAlliance"))
+    table = soup.find(id="tabMembresAlliance")
+    if table is None:
+        return []
+    rows = table.find_all("tr")[1:]
+    return list(row.find_all("td")[2].text for row in rows)
@@ -0,0 +1,115 @@
+"""
+Daily range partitions of the snapshot tables.
+
+RankingSnapshot and PrecisionSnapshot are partitioned on `time`, one partition per UTC day (see
+migration 0010). clean_old_snapshots creates the partitions a few days ahead and drops the ones
+past retention, which frees a whole day of rows at once instead of deleting them one by one.
+
+Each table also has a default partition, so rows still have somewhere to go if that task stops
+running for a while. Creating a daily partition moves the rows of its day out of it.
+"""
+
+import datetime
+from typing import List
+
+from django.db import connection
+from django.db import transaction
+
+PARTITIONED_TABLES = ("scraper_rankingsnapshot", "scraper_precisionsnapshot")
+# Partitions kept ready after today, so a few missed maintenance runs go unnoticed
+DAYS_AHEAD = 3
+
+
+def partition_name(table: str, day: datetime.date) -> str:
+    return f"{table}_p{day:%Y%m%d}"
+
+
+def _midnight(day: datetime.date) -> str:
+    """The start of that UTC day, as an SQL literal."""
+    return f"'{day:%Y-%m-%d} 00:00:00+00'"
+
+
+def existing_partitions(table: str) -> List[str]:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.relname = %s
+            """,
+            [table],
+        )
+        return [name for name, in cursor.fetchall()]
+
+
+def _name_partition_indexes(cursor, table: str, name: str):
+    """
+    Attaching a partition gives it a copy of each index of the table, under a generated, truncated
+    name. Name them after the table's index instead, e.g. rankingsnap_player_time_idx_p20261018.
+    """
+    cursor.execute(
+        """
+        SELECT child.relname, parent.relname
+        FROM pg_index
+        JOIN pg_class child ON child.oid = pg_index.indexrelid
+        JOIN pg_inherits ON pg_inherits.inhrelid = child.oid
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        WHERE pg_index.indrelid = %s::regclass AND NOT pg_index.indisprimary
+        """,
+        [name],
+    )
+    quote = connection.ops.quote_name
+    for index, parent_index in cursor.fetchall():
+        cursor.execute(f"ALTER INDEX {quote(index)} RENAME TO {quote(parent_index + name[len(table):])}")
+
+
+def create_partitions(table: str, first_day: datetime.date, last_day: datetime.date) -> List[str]:
+    """Create the missing daily partitions from `first_day` to `last_day` included, and return them."""
+    existing = set(existing_partitions(table))
+    quote = connection.ops.quote_name
+    created = list()
+    day = first_day
+    while day <= last_day:
+        name = partition_name(table, day)
+        if name not in existing:
+            start, end = _midnight(day), _midnight(day + datetime.timedelta(days=1))
+            # Rows of that day already in the default partition would make a plain
+            # PARTITION OF fail, so build the table, move them over, then attach it.
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(
+                    f"CREATE TABLE {quote(name)} (LIKE {quote(table)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+                )
+                cursor.execute(
+                    f"WITH moved AS (DELETE FROM {quote(table + '_default')} "
+                    f"WHERE time >= {start} AND time < {end} RETURNING *) "
+                    f"INSERT INTO {quote(name)} SELECT * FROM moved"
+                )
+                cursor.execute(
+                    f"ALTER TABLE {quote(table)} ATTACH PARTITION {quote(name)} FOR VALUES FROM ({start}) TO ({end})"
+                )
+                _name_partition_indexes(cursor, table, name)
+            created.append(name)
+        day += datetime.timedelta(days=1)
+    return created
+
+
+def drop_partitions_before(table: str, day: datetime.date) -> List[str]:
+    """Drop the daily partitions of the days before `day`, and return them."""
+    quote = connection.ops.quote_name
+    dropped = list()
+    prefix = f"{table}_p"
+    for name in sorted(existing_partitions(table)):
+        suffix = name[len(prefix):]
+        if not name.startswith(prefix) or not suffix.isdigit():
+            continue
+        if datetime.datetime.strptime(suffix, "%Y%m%d").date() < day:
+            with connection.cursor() as cursor:
+                cursor.execute(f"DROP TABLE {quote(name)}")
+            dropped.append(name)
+
+    # Normally empty, unless maintenance was not running
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {quote(table + '_default')} WHERE time < {_midnight(day)}")
+    return dropped
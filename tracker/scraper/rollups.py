@@ -0,0 +1,236 @@
+"""
+Hourly and daily summaries of the snapshots, kept long after the raw rows are dropped.
+
+roll_up() is incremental: it picks up from the last hour it summed up, rolls every complete hour
+of raw snapshots since into RankingRollup and PrecisionRollup, then every complete day of those
+hours into daily rows. Each hour and each day is computed with one INSERT ... SELECT ... ON
+CONFLICT in a transaction of its own, so running it again over the same hours only rewrites the
+same rows, and a run cut short by its time budget keeps what it did: the next one carries on from
+there. The raw snapshot partitions are only dropped up to rolled_up_until(), so no hour is lost.
+
+Hourly rows are kept HOURLY_RETENTION, daily rows forever: a player only has a row for the
+periods in which it moved, so that stays small.
+"""
+
+import datetime
+import time
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+
+from django.db import connection
+from django.db import transaction
+from django.db.models import Max
+from django.db.models import Min
+from django.db.models import QuerySet
+from django.utils import timezone
+from scraper.models import AllianceTarget
+from scraper.models import FourmizzzServer
+from scraper.models import PrecisionRollup
+from scraper.models import PrecisionSnapshot
+from scraper.models import RankingRollup
+from scraper.models import RankingSnapshot
+from scraper.models import SnapshotRollup
+
+HOURLY_RETENTION = datetime.timedelta(days=31)
+
+_AGGREGATES = """
+    {count},
+    (array_agg({first}hunting_field ORDER BY {order}))[1],
+    (array_agg({last}hunting_field ORDER BY {order_desc}))[1],
+    min({min}hunting_field),
+    max({max}hunting_field),
+    {moved_hunting_field},
+    (array_agg({first}trophies ORDER BY {order}))[1],
+    (array_agg({last}trophies ORDER BY {order_desc}))[1],
+    min({min}trophies),
+    max({max}trophies),
+    {moved_trophies}
+"""
+# From raw snapshots: snapshots are only saved on changes, so a row per change
+_FROM_SNAPSHOTS = _AGGREGATES.format(
+    count="count(*)",
+    first="",
+    last="",
+    min="",
+    max="",
+    order="time, id",
+    order_desc="time DESC, id DESC",
+    moved_hunting_field="sum(abs(hunting_field_diff))",
+    moved_trophies="sum(abs(trophies_diff))",
+)
+# From hourly rollups, into days
+_FROM_HOURS = _AGGREGATES.format(
+    count="sum(n_snapshots)",
+    first="first_",
+    last="last_",
+    min="min_",
+    max="max_",
+    order="start",
+    order_desc="start DESC",
+    moved_hunting_field="sum(hunting_field_moved)",
+    moved_trophies="sum(trophies_moved)",
+)
+_COLUMNS = """
+    n_snapshots,
+    first_hunting_field, last_hunting_field, min_hunting_field, max_hunting_field, hunting_field_moved,
+    first_trophies, last_trophies, min_trophies, max_trophies, trophies_moved
+"""
+_UPDATE = ", ".join(f"{column} = EXCLUDED.{column}" for column in _COLUMNS.replace(",", " ").split())
+
+
+def _roll(
+    table: str, keys: List[str], period: str, source: str, aggregates: str, time_column: str, start, end
+) -> int:
+    """
+    Sum up the `source` rows with `time_column` in [start, end) into rows of `period` in `table`.
+
+    `source` is a table or a subquery, `keys` the columns identifying a player.
+    """
+    keys_sql = ", ".join(keys)
+    truncated = f"date_trunc('{period}', {time_column})"
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {table} ({keys_sql}, period, start, {_COLUMNS})
+            SELECT {keys_sql}, %s, {truncated}, {aggregates}
+            FROM {source} AS source
+            WHERE {time_column} >= %s AND {time_column} < %s
+            GROUP BY {keys_sql}, {truncated}
+            ON CONFLICT ({keys_sql}, period, start) DO UPDATE SET {_UPDATE}
+            """,
+            [period, start, end],
+        )
+        return cursor.rowcount
+
+
+def _next_start(rollups: QuerySet, period: str, step: datetime.timedelta, first_source) -> Optional[datetime.datetime]:
+    """
+    Where the rollups of `period` stopped, or the start of the period of the first source row if
+    there are none yet.
+    """
+    last = rollups.filter(period=period).aggregate(last=Max("start"))["last"]
+    if last is not None:
+        return last + step
+    if first_source is None:
+        return None
+    first_source = first_source.replace(minute=0, second=0, microsecond=0)
+    return first_source.replace(hour=0) if period == SnapshotRollup.DAY else first_source
+
+
+def roll_up(now: Optional[datetime.datetime] = None, time_budget: Optional[float] = None) -> Dict[str, int]:
+    """
+    Sum up every complete hour and day not rolled up yet, or as many as fit in `time_budget`
+    seconds. Returns the rows written per table.
+    """
+    now = now or timezone.now()
+    deadline = None if time_budget is None else time.monotonic() + time_budget
+    this_hour = now.replace(minute=0, second=0, microsecond=0)
+    hour, day = datetime.timedelta(hours=1), datetime.timedelta(days=1)
+    written = dict()
+    for model, rollup_model, keys in (
+        (RankingSnapshot, RankingRollup, ["server_id", "player_name"]),
+        (PrecisionSnapshot, PrecisionRollup, ["player_id"]),
+    ):
+        source, table = model._meta.db_table, rollup_model._meta.db_table
+        rollups = rollup_model.objects.all()
+        written[table] = 0
+
+        first = model.objects.aggregate(first=Min("time"))["first"]
+        start = _next_start(rollups, SnapshotRollup.HOUR, hour, first)
+        while start is not None and start < this_hour:
+            if deadline is not None and time.monotonic() > deadline:
+                break
+            with transaction.atomic():
+                written[table] += _roll(
+                    table, keys, SnapshotRollup.HOUR, source, _FROM_SNAPSHOTS, "time", start, start + hour
+                )
+            start += hour
+        # Only the days whose hours are all summed up
+        hours_until = this_hour if start is None else min(start, this_hour)
+        days_until = hours_until.replace(hour=0)
+
+        first = rollups.filter(period=SnapshotRollup.HOUR).aggregate(first=Min("start"))["first"]
+        start = _next_start(rollups, SnapshotRollup.DAY, day, first)
+        hours = f"(SELECT * FROM {table} WHERE period = '{SnapshotRollup.HOUR}')"
+        while start is not None and start < days_until:
+            if deadline is not None and time.monotonic() > deadline:
+                break
+            with transaction.atomic():
+                written[table] += _roll(
+                    table, keys, SnapshotRollup.DAY, hours, _FROM_HOURS, "start", start, start + day
+                )
+            start += day
+
+        rollups.filter(period=SnapshotRollup.HOUR, start__lt=now - HOURLY_RETENTION).delete()
+    return written
+
+
+def rolled_up_until(now: Optional[datetime.datetime] = None) -> datetime.datetime:
+    """The start of the first hour with raw snapshots not summed up yet: everything before it is."""
+    now = now or timezone.now()
+    until = now.replace(minute=0, second=0, microsecond=0)
+    for model, rollup_model in ((RankingSnapshot, RankingRollup), (PrecisionSnapshot, PrecisionRollup)):
+        last = rollup_model.objects.filter(period=SnapshotRollup.HOUR).aggregate(last=Max("start"))["last"]
+        pending = model.objects.all()
+        if last is not None:
+            pending = pending.filter(time__gte=last + datetime.timedelta(hours=1))
+        first_pending = pending.aggregate(first=Min("time"))["first"]
+        if first_pending is not None:
+            until = min(until, first_pending.replace(minute=0, second=0, microsecond=0))
+    return until
+
+
+def player_history(
+    server: FourmizzzServer,
+    player_names: Iterable[str],
+    period: str = SnapshotRollup.DAY,
+    since: Optional[datetime.datetime] = None,
+    until: Optional[datetime.datetime] = None,
+) -> QuerySet:
+    """The ranking rollups of these players, oldest first. Periods in which a player did not move have no row."""
+    rollups = RankingRollup.objects.filter(server=server, player_name__in=list(player_names), period=period)
+    if since is not None:
+        rollups = rollups.filter(start__gte=since)
+    if until is not None:
+        rollups = rollups.filter(start__lt=until)
+    return rollups.order_by("start", "player_name")
+
+
+def alliance_history(
+    alliance: AllianceTarget,
+    period: str = SnapshotRollup.DAY,
+    since: Optional[datetime.datetime] = None,
+    until: Optional[datetime.datetime] = None,
+) -> List[Dict]:
+    """
+    Total hunting field and trophies of the alliance's tracked members at the end of each period.
+
+    A member that did not move in a period counts with its last known values, including ones from
+    before `since`.
+    """
+    names = list(alliance.playertarget_set.values_list("name", flat=True))
+    latest: Dict[str, tuple] = dict()
+    if since is not None:
+        for row in (
+            player_history(alliance.server, names, period, until=since)
+            .order_by("player_name", "-start")
+            .distinct("player_name")
+        ):
+            latest[row.player_name] = (row.last_hunting_field, row.last_trophies)
+
+    history = list()
+    rows = list(player_history(alliance.server, names, period, since, until))
+    for i, row in enumerate(rows):
+        latest[row.player_name] = (row.last_hunting_field, row.last_trophies)
+        if i + 1 == len(rows) or rows[i + 1].start != row.start:
+            history.append(
+                {
+                    "start": row.start,
+                    "hunting_field": sum(hunting_field for hunting_field, _ in latest.values()),
+                    "trophies": sum(trophies for _, trophies in latest.values()),
+                    "members": len(latest),
+                }
+            )
+    return history
@@ -0,0 +1,309 @@
+"""
+A local stand-in for the Fourmizzz game, to benchmark and load test the scraper offline.
+
+It serves classement2.php, Membre.php and classementAlliance.php, either from pages recorded with
+FOURMIZZZ_RECORD_DIR or generated from a synthetic world, and mimics the parts of the game the
+scraper has to cope with: response latency, sessions that expire, and PHP handling the requests
+of one session strictly one at a time. Start it with `python manage.py fourmizzz_standin` and
+point the tracker at it with FOURMIZZZ_URL=http://localhost:8765/{server}.
+"""
+
+import json
+import random
+import secrets
+import threading
+import time
+import urllib.parse
+from collections import Counter
+from collections import defaultdict
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from scraper.parsers import MV_MARKER
+from scraper.parsers import UNKNOWN_PLAYER_MARKER
+from scraper.web_agent import SESSION_EXPIRED_MARKER
+from scraper.web_agent import recording_path
+
+ROWS_PER_PAGE = 100
+LOGIN_PAGE = (
+    "<html><body><div id='centre'>"
+    f"<p>{SESSION_EXPIRED_MARKER}</p><form id='loginForm' method='post'></form>"
+    "</div></body></html>"
+)
+
+
+def _number(n: int) -> str:
+    return "{:,}".format(n).replace(",", " ")
+
+
+class SyntheticWorld:
+    """
+    Made-up players whose hunting field and trophies keep changing.
+
+    Every minute of wall time, `moves_per_minute` attacks move hunting field from one player to
+    another, and some of them trophies as well: the kind of simultaneous, opposite changes the
+    tracker matches against each other.
+    """
+
+    def __init__(
+        self,
+        n_players: int = 5000,
+        n_alliances: int = 50,
+        moves_per_minute: int = 30,
+        mv_share: float = 0.02,
+        seed: int = 0,
+    ):
+        self.rng = random.Random(seed)
+        self.moves_per_minute = moves_per_minute
+        self.lock = threading.Lock()
+        # name -> [hunting field, trophies, alliance, mv]
+        self.players: Dict[str, list] = dict()
+        for i in range(n_players):
+            alliance = f"ALLY{i % n_alliances}" if i % 7 else None
+            self.players[f"Joueur{i}"] = [
+                int(5e9 / (i + 1) ** 0.9),
+                self.rng.randint(0, 50000),
+                alliance,
+                self.rng.random() < mv_share,
+            ]
+        self.started = time.monotonic()
+        self.minutes_played = 0
+        self._ranking: Optional[List[str]] = None
+
+    def advance(self, minutes: int = 1) -> None:
+        """Play `minutes` more minutes of moves right away."""
+        with self.lock:
+            self._play(minutes)
+
+    def _catch_up(self) -> None:
+        elapsed = int((time.monotonic() - self.started) // 60)
+        if elapsed > self.minutes_played:
+            self._play(elapsed - self.minutes_played)
+
+    def _play(self, minutes: int) -> None:
+        names = list(self.players)
+        for _ in range(minutes * self.moves_per_minute):
+            attacker, victim = self.rng.sample(names, 2)
+            if self.players[attacker][3] or self.players[victim][3]:
+                continue  # players in MV can neither attack nor be attacked
+            taken = self.players[victim][0] * self.rng.randint(1, 20) // 100
+            self.players[attacker][0] += taken
+            self.players[victim][0] -= taken
+            if self.rng.random() < 0.3:
+                trophies = self.rng.randint(1, 100)
+                self.players[attacker][1] += trophies
+                self.players[victim][1] -= trophies
+        self.minutes_played += minutes
+        self._ranking = None
+
+    def _sorted_names(self) -> List[str]:
+        if self._ranking is None:
+            self._ranking = sorted(self.players, key=lambda name: -self.players[name][0])
+        return self._ranking
+
+    def ranking_page(self, page: int) -> str:
+        with self.lock:
+            self._catch_up()
+            names = self._sorted_names()
+            first = (page - 1) * ROWS_PER_PAGE
+            if page < 1 or first >= len(names):
+                return "<html><body><div id='centre'><p>Aucun joueur</p></div></body></html>"
+            rows = [
+                f"<tr><td>{first + i + 1}</td><td><a href='Membre.php?Pseudo={name}'>{name}</a></td>"
+                f"<td>{_number(self.players[name][0])}</td><td>-</td><td>-</td>"
+                f"<td>{_number(self.players[name][1])}</td></tr>"
+                for i, name in enumerate(names[first:first + ROWS_PER_PAGE])
+            ]
+        return (
+            "<html><body><div id='centre'><table class='tab_triable'>"
+            "<tr><th>Rang</th><th>Pseudo</th><th>Terrain</th><th>Fourmilière</th>"
+            "<th>Technologie</th><th>Trophées</th></tr>"
+            f"{''.join(rows)}</table></div></body></html>"
+        )
+
+    def member_page(self, name: str) -> str:
+        with self.lock:
+            self._catch_up()
+            player = self.players.get(name)
+            if player is None:
+                return (
+                    "<html><body><div id='centre'>"
+                    f"<p>{UNKNOWN_PLAYER_MARKER} {name}</p></div></body></html>"
+                )
+            hunting_field, trophies, alliance, mv = player
+        alliance_link = f"<a href='classementAlliance.php?alliance={alliance}'>{alliance}</a>"
+        score_rows = "".join(f"<tr><td>-</td><td>{i}</td></tr>" for i in range(4))
+        return (
+            "<html><body><div id='centre'><center><div>Profil</div><div>"
+            "<div class='boite_membre'><table>"
+            f"<tr><td>Alliance :</td><td>{alliance_link if alliance else ''}</td></tr>"
+            f"<tr><td>Pseudo :</td><td>{name}</td></tr>"
+            f"</table>{MV_MARKER if mv else ''}</div>"
+            "<div>-</div>"
+            "<div><table><tr><td>-</td><td>-</td></tr>"
+            f"<tr><td>Terrain de chasse</td><td>{_number(hunting_field)}</td></tr></table></div>"
+            "</div></center>"
+            f"<table class='tableau_score'>{score_rows}"
+            f"<tr><td>Trophées</td><td>{_number(trophies)}</td></tr></table>"
+            "</div></body></html>"
+        )
+
+    def alliance_page(self, alliance: str) -> str:
+        with self.lock:
+            members = [name for name, player in self.players.items() if player[2] == alliance]
+        rows = "".join(
+            f"<tr><td>{i + 1}</td><td>-</td><td>{name}</td></tr>" for i, name in enumerate(members)
+        )
+        if not members:
+            return "<html><body><div id='centre'><p>Alliance inconnue</p></div></body></html>"
+        return (
+            "<html><body><div id='centre'><table id='tabMembresAlliance'>"
+            f"<tr><th>Rang</th><th>-</th><th>Pseudo</th></tr>{rows}</table></div></body></html>"
+        )
+
+
+class StandinServer(ThreadingHTTPServer):
+    """
+    Serves the stand-in game on `address`, under /<server name>/<page>.
+
+    `latency` is added to every page, `session_lifetime` (seconds, None for never) is how long a
+    login lasts, and `serialise` makes the requests of a session wait for each other like they do
+    on the game's PHP session lock. GET /stats returns counters as JSON.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: Tuple[str, int],
+        world: Optional[SyntheticWorld] = None,
+        record_dir: str = "",
+        latency: float = 0.0,
+        session_lifetime: Optional[float] = None,
+        serialise: bool = True,
+    ):
+        super().__init__(address, _Handler)
+        self.world = world or SyntheticWorld()
+        self.record_dir = record_dir
+        self.latency = latency
+        self.session_lifetime = session_lifetime
+        self.serialise = serialise
+        self.lock = threading.Lock()
+        # session id -> expiry (time.monotonic()), None for never
+        self.sessions: Dict[str, Optional[float]] = dict()
+        self.session_locks: Dict[str, threading.Lock] = defaultdict(threading.Lock)
+        self.waiting: Counter = Counter()
+        self.stats: Counter = Counter()
+
+    def log_in(self, session_id: Optional[str]) -> str:
+        # Like PHP 5.3, adopt the session id the client sent rather than issuing a new one.
+        session_id = session_id or secrets.token_hex(13)
+        with self.lock:
+            self.sessions[session_id] = (
+                None if self.session_lifetime is None else time.monotonic() + self.session_lifetime
+            )
+            self.stats["logins"] += 1
+        return session_id
+
+    def logged_in(self, session_id: Optional[str]) -> bool:
+        with self.lock:
+            if session_id not in self.sessions:
+                return False
+            expiry = self.sessions[session_id]
+            return expiry is None or time.monotonic() < expiry
+
+    def page(self, server_name: str, path: str) -> Optional[str]:
+        if self.record_dir:
+            recorded = recording_path(self.record_dir, server_name, path)
+            if recorded is not None and recorded.exists():
+                return recorded.read_text(encoding="utf-8")
+
+        page, _, query = path.partition("?")
+        params = dict(urllib.parse.parse_qsl(query))
+        if page == "classement2.php":
+            return self.world.ranking_page(int(params.get("page", 1)))
+        if page == "Membre.php":
+            return self.world.member_page(params.get("Pseudo", ""))
+        if page == "classementAlliance.php":
+            return self.world.alliance_page(params.get("alliance", ""))
+        if page in ("alliance.php", "index.php", ""):
+            return "<html><body><div id='centre'><p>Bienvenue</p></div></body></html>"
+        return None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # Keep-alive, like the real game, so connection pooling can be measured
+    protocol_version = "HTTP/1.1"
+    server: StandinServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def _session_id(self) -> Optional[str]:
+        cookie = SimpleCookie(self.headers.get("Cookie", ""))
+        return cookie["PHPSESSID"].value if "PHPSESSID" in cookie else None
+
+    def _split_path(self) -> Tuple[str, str]:
+        server_name, _, path = self.path.lstrip("/").partition("/")
+        return server_name, path
+
+    def _reply(self, body: str, status: int = 200, session_id: Optional[str] = None) -> None:
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        if session_id:
+            self.send_header("Set-Cookie", f"PHPSESSID={session_id}; path=/")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        _, path = self._split_path()
+        if not path.startswith("index.php"):
+            return self._reply("", status=404)
+        session_id = self.server.log_in(self._session_id())
+        self._reply("<html><body><div id='centre'>Connecté</div></body></html>", session_id=session_id)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            with self.server.lock:
+                stats = dict(self.server.stats)
+            return self._reply(json.dumps(stats))
+
+        server_name, path = self._split_path()
+        session_id = self._session_id()
+        # Handlers run in threads of their own, so every shared counter is updated under the lock
+        with self.server.lock:
+            self.server.stats["requests"] += 1
+        if not self.server.logged_in(session_id):
+            with self.server.lock:
+                self.server.stats["logged_out"] += 1
+            return self._reply(LOGIN_PAGE)
+
+        if self.server.serialise:
+            with self.server.lock:
+                self.server.waiting[session_id] += 1
+                self.server.stats["max_queued"] = max(
+                    self.server.stats["max_queued"], self.server.waiting[session_id]
+                )
+                # The defaultdict inserts on a miss: concurrent first requests must share one lock
+                lock = self.server.session_locks[session_id]
+        else:
+            lock = threading.Lock()  # uncontended
+        try:
+            with lock:
+                time.sleep(self.server.latency)
+                body = self.server.page(server_name, path)
+        finally:
+            if self.server.serialise:
+                with self.server.lock:
+                    self.server.waiting[session_id] -= 1
+        if body is None:
+            return self._reply("", status=404)
+        self._reply(body)
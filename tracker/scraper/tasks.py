@@ -1,58 +1,176 @@
 import datetime
-import itertools
+import time
+from collections import defaultdict
+from functools import partial
+from typing import Callable
+from typing import Dict
 from typing import List
-from typing import Literal
+from typing import Optional
 from typing import Tuple
-from typing import Union
 
-import pytz
 from celery import chain
 from celery import group
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
 from django.db.models import F
-from django.db.models import Func
-from django.db.models import QuerySet
+from django.db.models import Min
+from django.db.models import Q
 from django.utils import timezone
+from scraper.ingest import ingest_ranking_rows
+from scraper.leases import acquire_lease
+from scraper.leases import release_lease
+from scraper.matching import MoveWindow
+from scraper.matching import find_combinations
+from scraper.models import AllianceTarget
 from scraper.models import FourmizzzServer
 from scraper.models import PlayerTarget
 from scraper.models import PrecisionSnapshot
+from scraper.models import PrecisionState
 from scraper.models import RankingSnapshot
+from scraper.models import RankingState
+from scraper.notifications import MoveNotification
+from scraper.notifications import send_move_notifications
+from scraper.parsers import ParseError
+from scraper.parsers import ranking_rows
+from scraper.partitions import DAYS_AHEAD
+from scraper.partitions import PARTITIONED_TABLES
+from scraper.partitions import create_partitions
+from scraper.partitions import drop_partitions_before
+from scraper.rollups import roll_up
+from scraper.rollups import rolled_up_until
 from scraper.utils import send_error
 from scraper.utils import send_message
+from scraper.web_agent import MV_LANE
+from scraper.web_agent import MV_PROFILE_MAX_AGE
 from scraper.web_agent import fetch
-from scraper.web_agent import get_player_alliance
+from scraper.web_agent import fetch_many
+from scraper.web_agent import get_alliance_members
+from scraper.web_agent import get_member_profile
+from scraper.web_agent import get_member_profiles
 
 from tracker.celery import app
-from tracker.settings import TIME_ZONE
+from tracker.celery import server_queue
 
 # --- MV
 
 
 @app.task
 def check_mv_players():
-    mv_players = PlayerTarget.objects.filter(mv=True)
-    subtasks = [
-        check_mv_player.si(pk) for pk in mv_players.values_list("pk", flat=True)
-    ]
-    return group(subtasks).delay()
+    """
+    One check_server_mv_players per server with players in vacation mode.
+
+    A server whose previous check is still going is skipped this tick, so slow checks do not pile
+    up on its queue every 5 seconds.
+    """
+    check_subtasks = []
+    for server in FourmizzzServer.objects.filter(
+        pk__in=PlayerTarget.objects.filter(mv=True).values("server")
+    ):
+        holder = acquire_lease(server, "mv", MV_LEASE_TTL)
+        if holder is None:
+            continue
+        queue = server_queue(server.name, "mv")
+        release = release_job_lease.si(server.pk, "mv", holder).set(queue=queue)
+        check_subtasks.append(
+            chain(check_server_mv_players.si(server.pk).set(queue=queue), release).on_error(
+                release
+            )
+        )
+    return group(check_subtasks).delay()
 
 
 @app.task
-def check_mv_player(mv_player_pk: int):
-    mv_player = PlayerTarget.objects.get(pk=mv_player_pk)
-    soup = fetch(mv_player.server, f"Membre.php?Pseudo={mv_player.name}")
-    mv = "Joueur en vacances" in soup.find("div", {"class": "boite_membre"}).text
-    if mv_player.mv and not mv:
-        mv_player.mv = False
-        mv_player.save()
+def check_server_mv_players(server_pk: int) -> List[str]:
+    """
+    Check every player of a server in vacation mode at once, and return those who came back.
+
+    Their member pages are fetched concurrently, the players who came back are updated in a single
+    query, and only they get a notification. A player whose page no longer exists (renamed or
+    deleted) has not come back: it is reported as an error instead, once a day.
+    """
+    server = FourmizzzServer.objects.get(pk=server_pk)
+    mv_players = list(
+        PlayerTarget.objects.filter(server=server, mv=True).select_related("alliance")
+    )
+    profiles = get_member_profiles(
+        server,
+        [mv_player.name for mv_player in mv_players],
+        max_age=MV_PROFILE_MAX_AGE,
+        lane=MV_LANE,
+        concurrency=settings.MV_CHECK_CONCURRENCY,
+    )
+    back = [
+        mv_player
+        for mv_player, profile in zip(mv_players, profiles)
+        if not isinstance(profile, Exception) and profile.exists and not profile.mv
+    ]
+    missing = [
+        mv_player
+        for mv_player, profile in zip(mv_players, profiles)
+        if not isinstance(profile, Exception) and not profile.exists
+    ]
+    # Polled again from the next tick
+    PlayerTarget.objects.filter(pk__in=[mv_player.pk for mv_player in back]).update(
+        mv=False, next_poll_at=None
+    )
+    for mv_player in back:
         send_message(
-            category=mv_player.server.name,
-            forum=mv_player.alliance.name or mv_player.name,
+            category=server.name,
+            forum=mv_player.alliance.name if mv_player.alliance else mv_player.name,
             thread=mv_player.name,
             title=f"{mv_player.name} n'est plus en vacances !!!",
             description=datetime.datetime.now().strftime("%d/%m/%Y %H:%M:%S"),
             color="03b2f8",
         )
 
+    for mv_player in missing:
+        # Checked every few seconds: cache.add only lets the first report of the day through
+        if cache.add(
+            f"mv_missing:{server.name}:{mv_player.name}", True, timeout=24 * 60 * 60
+        ):
+            send_error(
+                category=server.name,
+                thread="check_mv_players",
+                title=f"Player in vacation mode not found, renamed or deleted: {mv_player.name}",
+            )
+
+    # The others are checked again on the next tick, but a failure should still show
+    for profile in profiles:
+        if isinstance(profile, Exception):
+            raise profile
+
+    return [mv_player.name for mv_player in back]
+
+
+# --- Leases
+
+# How long a run keeps its server's lease if it never releases it
+MV_LEASE_TTL = datetime.timedelta(minutes=1)
+PRECISION_LEASE_TTL = datetime.timedelta(minutes=2)
+RANKING_LEASE_TTL = datetime.timedelta(minutes=3)
+
+
+@app.task
+def release_job_lease(server_pk: int, job: str, holder: str) -> bool:
+    """Last task of a leased run, and its errback. See scraper.leases."""
+    return release_lease(server_pk, job, holder)
+
+
+# --- Alliances
+
+
+@app.task
+def refresh_player_alliances() -> int:
+    """
+    Read the member pages of the tracked alliances, which saves their members' alliance (see
+    get_player_alliance) before it expires. Returns the number of members read.
+    """
+    n_members = 0
+    for alliance in AllianceTarget.objects.select_related("server"):
+        n_members += len(get_alliance_members(alliance.server, alliance.name))
+    return n_members
+
 
 # --- Precision snapshots
 
@@ -60,27 +178,22 @@ def check_mv_player(mv_player_pk: int):
 @app.task
 def take_player_precision_snapshot(player_pk: int) -> Tuple[int, int]:
     player = PlayerTarget.objects.get(pk=player_pk)
-    soup = fetch(player.server, f"Membre.php?Pseudo={player.name}")
     try:
-        cell = soup.select_one(
-            "#centre > center > div:nth-child(2) > div:nth-child(3) > table > tr:nth-child(2) > td:nth-child(2)"
-        )
-        hunting_field = int(cell.text.replace(" ", ""))
-    except AttributeError:
+        profile = get_member_profile(player.server, player.name)
+        if profile.hunting_field is None:
+            raise ParseError("no hunting field on the member page")
+    except ParseError:
         send_error(
             category=player.server.name,
             thread="take_player_precision_snapshot",
             title=f"Could not find hunting field for player: {player.name}",
         )
         raise
-    trophies = int(
-        soup.find("table", {"class": "tableau_score"})
-        .find_all("tr")[4]
-        .find_all("td")[1]
-        .text.replace(" ", "")
-    )
-    mv = "Joueur en vacances" in soup.find("div", {"class": "boite_membre"}).text
-    if not player.mv and mv:
+    if profile.trophies is None:
+        raise ParseError(f"no trophies on the member page of {player.name}")
+    hunting_field = profile.hunting_field
+    trophies = profile.trophies
+    if not player.mv and profile.mv:
         player.mv = True
         player.save()
         send_message(
@@ -92,88 +205,150 @@ def take_player_precision_snapshot(player_pk: int) -> Tuple[int, int]:
             color="03b2f8",
         )
 
-    last_player_snapshot = PrecisionSnapshot.objects.filter(player=player).last()
+    last_state = PrecisionState.objects.filter(player=player).first()
     # If this is the first player snapshot
-    if last_player_snapshot is None:
-        PrecisionSnapshot(
+    if last_state is None:
+        snapshot = PrecisionSnapshot(
             hunting_field=hunting_field,
             trophies=trophies,
             player=player,
             processed=True,
-        ).save()
+        )
     # If the player has a different hunting_field or trophies, save an unprocessed snapshot
-    elif (
-        last_player_snapshot.hunting_field != hunting_field
-        or last_player_snapshot.trophies != trophies
-    ):
-        PrecisionSnapshot(
+    elif last_state.hunting_field != hunting_field or last_state.trophies != trophies:
+        snapshot = PrecisionSnapshot(
             hunting_field=hunting_field,
-            hunting_field_diff=hunting_field - last_player_snapshot.hunting_field,
+            hunting_field_diff=hunting_field - last_state.hunting_field,
             trophies=trophies,
-            trophies_diff=trophies - last_player_snapshot.trophies,
+            trophies_diff=trophies - last_state.trophies,
             player=player,
-        ).save()
+        )
+    else:
+        return
+
+    with transaction.atomic():
+        snapshot.save()
+        PrecisionState.objects.update_or_create(
+            player=player,
+            defaults={
+                "hunting_field": hunting_field,
+                "trophies": trophies,
+                "time": snapshot.time,
+            },
+        )
+
+
+# How often a target is polled, from how long ago it last moved: the first tier it falls in,
+# else POLL_INTERVAL_IDLE. Targets in vacation mode are left to check_mv_players.
+POLL_INTERVALS = (
+    (datetime.timedelta(hours=1), datetime.timedelta(minutes=1)),
+    (datetime.timedelta(days=1), datetime.timedelta(minutes=5)),
+)
+POLL_INTERVAL_IDLE = datetime.timedelta(minutes=15)
+# Ticks do not land exactly a minute apart: a target due by the next one is not missed by a second
+POLL_SLACK = datetime.timedelta(seconds=30)
+
+
+def _poll_interval(
+    last_move: Optional[datetime.datetime], now: datetime.datetime
+) -> datetime.timedelta:
+    if last_move is None:
+        # Not snapshotted yet
+        return POLL_INTERVALS[0][1]
+    for idle, interval in POLL_INTERVALS:
+        if now - last_move < idle:
+            return interval
+    return POLL_INTERVAL_IDLE
+
+
+def _due_targets(
+    server: FourmizzzServer, now: datetime.datetime
+) -> List[Tuple[int, Optional[datetime.datetime]]]:
+    """
+    The (pk, last move) of the targets of a server due for a precision snapshot, the most recently
+    active first, within the server's budget.
+    """
+    targets = (
+        PlayerTarget.objects.filter(server=server, mv=False)
+        .filter(Q(next_poll_at__isnull=True) | Q(next_poll_at__lte=now))
+        .order_by(
+            F("precision_state__time").desc(nulls_first=True),
+            F("next_poll_at").asc(nulls_first=True),
+        )
+        .values_list("pk", "precision_state__time")
+    )
+    if server.precision_polls_per_minute:
+        targets = targets[: server.precision_polls_per_minute]
+    return list(targets)
 
 
 @app.task
 def take_precision_snapshots() -> None:
-    # Take both precision and ranking snapshots
-    take_snapshot_subtasks = []
-    for player_target in PlayerTarget.objects.iterator():
-        take_snapshot_subtasks.append(
-            take_player_precision_snapshot.si(player_target.pk)
+    """
+    Snapshot the targets due, and schedule their next poll from how recently they moved.
+
+    Active targets are polled every minute and idle ones less often (see POLL_INTERVALS), leaving
+    the game's request allowance to the ranking sweep.
+    """
+    now = timezone.now()
+    server_subtasks = []
+    for server in FourmizzzServer.objects.all():
+        # Skipped while the previous tick's snapshots of this server are still being taken
+        holder = acquire_lease(server, "precision", PRECISION_LEASE_TTL)
+        if holder is None:
+            continue
+        targets = _due_targets(server, now)
+        if not targets:
+            release_lease(server.pk, "precision", holder)
+            continue
+        queue = server_queue(server.name, "precision")
+        # One update per interval
+        by_interval: Dict[datetime.timedelta, List[int]] = defaultdict(list)
+        take_snapshot_subtasks = []
+        for player_pk, last_move in targets:
+            by_interval[_poll_interval(last_move, now)].append(player_pk)
+            take_snapshot_subtasks.append(
+                take_player_precision_snapshot.si(player_pk).set(queue=queue)
+            )
+        for interval, player_pks in by_interval.items():
+            PlayerTarget.objects.filter(pk__in=player_pks).update(
+                next_poll_at=now + interval - POLL_SLACK
+            )
+        release = release_job_lease.si(server.pk, "precision", holder).set(queue=queue)
+        server_subtasks.append(
+            chain(group(take_snapshot_subtasks), release).on_error(release)
         )
 
-    return group(take_snapshot_subtasks).delay()
+    return group(server_subtasks).delay()
 
 
 # --- Ranking snapshots
 
 
-@app.task
-def take_page_ranking_snapshot(server_pk: int, page: int) -> Tuple[int, int, int, int]:
-    server = FourmizzzServer.objects.get(pk=server_pk)
-    soup = fetch(server, f"classement2.php?page={page}&typeClassement=terrain")
-    table = soup.find("table", {"class": "tab_triable"})
-    if table is None:  # Page does not exist
-        return {"server_pk": server_pk, "page": page, "hunting_field": 0, "trophies": 0}
-    ranking_snapshots = list()
-    for row in table.find_all("tr")[1:]:
-        _, player_name, hunting_field, _, _, trophies = row.find_all("td")
-        player_name = player_name.find("a").text
-        hunting_field = int(hunting_field.text.replace(" ", ""))
-        trophies = int(trophies.text.replace(" ", ""))
-
-        last_player_snapshot = RankingSnapshot.objects.filter(
-            server=server, player_name=player_name
-        ).last()
-        if last_player_snapshot is None:
-            ranking_snapshots.append(
-                RankingSnapshot(
-                    server=server,
-                    player_name=player_name,
-                    hunting_field=hunting_field,
-                    trophies=trophies,
-                )
-            )
-        elif (
-            last_player_snapshot.hunting_field != hunting_field
-            or last_player_snapshot.trophies != trophies
-        ):
-            ranking_snapshots.append(
-                RankingSnapshot(
-                    server=server,
-                    player_name=player_name,
-                    hunting_field=hunting_field,
-                    hunting_field_diff=hunting_field
-                    - last_player_snapshot.hunting_field,
-                    trophies=trophies,
-                    trophies_diff=trophies - last_player_snapshot.trophies,
-                )
-            )
+def _ranking_page_path(page: int) -> str:
+    return f"classement2.php?page={page}&typeClassement=terrain"
+
+
+def _save_ranking_snapshots(
+    server: FourmizzzServer, rows: List[Tuple[str, int, int]]
+) -> int:
+    """
+    Save the snapshots for these ranking rows, and RankingState with them in one transaction.
+
+    The rows are diffed and filtered in the database (see scraper.ingest), the same way for a page
+    and for the thousands of rows of a sweep. Returns the number of players whose state moved.
+    """
+    return ingest_ranking_rows(server.pk, rows)
 
-    RankingSnapshot.objects.bulk_create(ranking_snapshots)
 
+def _ranking_page_result(
+    server_pk: int, page: int, rows: Optional[List[Tuple[str, int, int]]]
+) -> Dict[str, Optional[int]]:
+    """
+    What update_n_scanned_pages needs to know about a page: its lowest row, None for a page past the
+    end of the ranking.
+    """
+    _, hunting_field, trophies = rows[-1] if rows else (None, None, None)
     return {
         "server_pk": server_pk,
         "page": page,
@@ -183,309 +358,413 @@ def take_page_ranking_snapshot(server_pk: int, page: int) -> Tuple[int, int, int
 
 
 @app.task
-def update_n_scanned_pages(ranking_snapshot_results: List[List]):
-    server_pk = ranking_snapshot_results[0]["server_pk"]
+def take_page_ranking_snapshot(server_pk: int, page: int) -> Dict[str, Optional[int]]:
     server = FourmizzzServer.objects.get(pk=server_pk)
-    lowest_current_hunting_field = min(
-        PrecisionSnapshot.objects.filter(player__server=server)
-        .order_by("player", "-time")
-        .distinct("player")
-        .values_list("hunting_field", flat=True)
+    rows = ranking_rows(fetch(server, _ranking_page_path(page)))
+    if rows:
+        _save_ranking_snapshots(server, rows)
+    return _ranking_page_result(server_pk, page, rows)
+
+
+@app.task
+def take_server_ranking_sweep(server_pk: int) -> List[Dict[str, int]]:
+    """
+    Scrape every ranking page of a server from this one task and write them in a single batch.
+
+    Returns the same per-page results as a group of take_page_ranking_snapshot, so it chains into
+    update_n_scanned_pages the same way.
+    """
+    server = FourmizzzServer.objects.get(pk=server_pk)
+    pages = list(range(1, server.n_scanned_pages + 1))
+    parsed_pages = fetch_many(
+        server,
+        [_ranking_page_path(page) for page in pages],
+        parse=ranking_rows,
+        concurrency=settings.RANKING_SWEEP_CONCURRENCY,
+        max_wait=settings.RANKING_SWEEP_MAX_WAIT,
     )
 
-    last_page = ranking_snapshot_results[-1]["page"]
-    penultimate_page = ranking_snapshot_results[-2]["page"]
-    current_lowest_hunting_field_from_ranking_page = ranking_snapshot_results[-1][
-        "hunting_field"
+    rows = list()
+    for page_rows in parsed_pages:
+        if page_rows and not isinstance(page_rows, Exception):
+            rows.extend(page_rows)
+    _save_ranking_snapshots(server, rows)
+
+    # Like a failing page task breaks its chord: what was scraped is kept, but page counting
+    # does not run on an incomplete sweep.
+    for page_rows in parsed_pages:
+        if isinstance(page_rows, Exception):
+            raise page_rows
+
+    return [
+        _ranking_page_result(server_pk, page, page_rows)
+        for page, page_rows in zip(pages, parsed_pages)
     ]
 
-    # We should increase the number of scanned ranking pages
-    if (
-        current_lowest_hunting_field_from_ranking_page
-        > lowest_current_hunting_field // 3
-    ):
-        return chain(
-            group(
-                [
-                    take_page_ranking_snapshot.si(server_pk, i_page)
-                    for i_page in (last_page, 2 * last_page)
-                ]
-            ),
-            update_n_scanned_pages.s(),
-        ).delay()
-    # We're already in the process of increasing the number of pages
-    elif last_page - penultimate_page != 1:
-        penultimate_current_lowest_hunting_field_from_ranking_page = (
-            ranking_snapshot_results[-2]["hunting_field"]
-        )
-        # The target page amount is in between our two limits
-        if (
-            penultimate_current_lowest_hunting_field_from_ranking_page
-            > lowest_current_hunting_field // 3
-        ):
-            return chain(
-                group(
-                    [
-                        take_page_ranking_snapshot.si(server_pk, i_page)
-                        for i_page in ((last_page + penultimate_page) // 2, last_page)
-                    ]
-                ),
-                update_n_scanned_pages.s(),
-            ).delay()
-        # We overshoot the limit and should lower our limits
+
+def _first_page_below(
+    lowest: Callable[[int], Optional[int]],
+    threshold: int,
+    known: Dict[int, Optional[int]],
+    guess: Optional[int],
+    max_pages: int,
+) -> int:
+    """
+    The first ranking page whose lowest hunting field is at or under `threshold`, the last page of
+    the ranking if it ends before that, or `max_pages`.
+
+    Hunting fields only go down the ranking, so this is a binary search. `known` are the pages
+    already fetched, `lowest(page)` fetches another one; a page past the end of the ranking has
+    None. `guess` is where the previous sweeps put the answer: it is tried first, then its
+    neighbour, so a ranking that barely moved costs one or two fetches instead of a full bisection.
+    """
+    known = dict(known)
+
+    def reached(page: int) -> bool:
+        return known[page] is None or known[page] <= threshold
+
+    lo = max((page for page in known if not reached(page)), default=0)
+    hi = min((page for page in known if reached(page)), default=max_pages + 1)
+    if guess is not None:
+        # Pages moved since: start next to the scanned pages
+        guess = min(max(guess, lo + 1), hi - 1)
+    neighbour_tried = False
+    while hi - lo > 1:
+        page = guess if guess is not None and lo < guess < hi else (lo + hi) // 2
+        known[page] = lowest(page)
+        if reached(page):
+            hi = page
         else:
-            return chain(
-                group(
-                    [
-                        take_page_ranking_snapshot.si(server_pk, i_page)
-                        for i_page in (
-                            penultimate_page - (last_page - penultimate_page) // 2,
-                            penultimate_page,
-                        )
-                    ]
-                ),
-                update_n_scanned_pages.s(),
-            ).delay()
-
-    # We should decrease the number of scanned ranking pages
-    new_page = last_page
-    for ranking_page_result in ranking_snapshot_results[::-1]:
-        lowest_hunting_field_from_ranking_page = ranking_page_result["hunting_field"]
-        if lowest_hunting_field_from_ranking_page < lowest_current_hunting_field // 3:
-            new_page -= 1
-
-    # Set hard limit to 100 pages because of hardware limitations
-    new_page = max(1, min(100, new_page))
+            lo = page
+        if page == guess and not neighbour_tried:
+            guess, neighbour_tried = (page - 1 if hi == page else page + 1), True
+        else:
+            guess = None
+    if hi <= max_pages and known[hi] is None:
+        # The ranking ends before the threshold: all of it, and no page that does not exist
+        return max(lo, 1)
+    return min(hi, max_pages)
+
+
+@app.task
+def update_n_scanned_pages(ranking_snapshot_results: List[Dict]) -> Optional[int]:
+    """
+    Scan just enough ranking pages to reach a third of the weakest target's hunting field.
+
+    The pages just scanned usually settle it. Otherwise the missing pages are fetched (and their
+    snapshots saved) from here, guided by the lowest hunting field of each page kept on the server
+    from previous sweeps, within RANKING_MAX_PAGES.
+    """
+    server_pk = ranking_snapshot_results[0]["server_pk"]
+    server = FourmizzzServer.objects.get(pk=server_pk)
+    lowest_current_hunting_field = PrecisionState.objects.filter(
+        player__server=server
+    ).aggregate(lowest=Min("hunting_field"))["lowest"]
+    if lowest_current_hunting_field is None:
+        return None
+    threshold = lowest_current_hunting_field // 3
+
+    boundaries = {
+        int(page): hunting_field
+        for page, hunting_field in server.page_boundaries.items()
+    }
+    scanned = {
+        result["page"]: result["hunting_field"] for result in ranking_snapshot_results
+    }
+    guess = min(
+        (
+            page
+            for page, hunting_field in boundaries.items()
+            if hunting_field is None or hunting_field <= threshold
+        ),
+        default=None,
+    )
+
+    def lowest(page: int) -> Optional[int]:
+        result = take_page_ranking_snapshot(server_pk, page)
+        scanned[page] = result["hunting_field"]
+        return result["hunting_field"]
+
+    new_page = _first_page_below(
+        lowest, threshold, scanned, guess, settings.RANKING_MAX_PAGES
+    )
+
+    boundaries.update(scanned)
     server.n_scanned_pages = new_page
-    # Only this field: a bare save() would write back a possibly stale cookie jar and undo a
+    # Pages far past the ones scanned would only go stale
+    server.page_boundaries = {
+        page: hunting_field
+        for page, hunting_field in sorted(boundaries.items())
+        if page <= 2 * new_page
+    }
+    # Only these fields: a bare save() would write back a possibly stale cookie jar and undo a
     # session refresh another worker just made.
-    server.save(update_fields=["n_scanned_pages"])
+    server.save(update_fields=["n_scanned_pages", "page_boundaries"])
 
     return new_page
 
 
 @app.task
 def take_ranking_snapshots() -> None:
-    # Take both precision and ranking snapshots
+    """
+    Sweep the ranking of every server, then count its pages and match the moves.
+
+    A server whose previous sweep is still going, with its page counting, is skipped this tick.
+    """
     take_snapshot_subtasks = []
     for server in FourmizzzServer.objects.iterator():
+        holder = acquire_lease(server, "ranking", RANKING_LEASE_TTL)
+        if holder is None:
+            continue
+        queue = server_queue(server.name, "ranking")
+        if settings.RANKING_SWEEP_MODE == "pages":
+            take_pages = group(
+                [
+                    take_page_ranking_snapshot.si(server.pk, i_page).set(queue=queue)
+                    for i_page in range(1, server.n_scanned_pages + 1)
+                ]
+            )
+        else:
+            take_pages = take_server_ranking_sweep.si(server.pk).set(queue=queue)
+        release = release_job_lease.si(server.pk, "ranking", holder).set(queue=queue)
+        # Both get the pages' results once they are all in
         take_snapshot_subtasks.append(
             chain(
+                take_pages,
                 group(
-                    [
-                        take_page_ranking_snapshot.si(server.pk, i_page)
-                        for i_page in range(1, server.n_scanned_pages + 1)
-                    ]
+                    update_n_scanned_pages.s().set(queue=queue),
+                    process_new_moves.s().set(queue=queue),
                 ),
-                update_n_scanned_pages.s(),
-            )
+                release,
+            ).on_error(release)
         )
     return group(take_snapshot_subtasks).delay()
 
 
 # --- Process snapshots
 
+# How long the ranking may take to show a target's last polled values before its snapshots are
+# given up on, e.g. a target that fell off the pages scanned
+RANKING_CATCH_UP_TIMEOUT = datetime.timedelta(hours=1)
+
 
 @app.task
-def process_player_precision_snapshots(
-    unprocessed_player_snapshot_pk: List[int],
-) -> None:
-    def format_move(
-        server: FourmizzzServer,
-        player_name: str,
-        snapshot: Union[PrecisionSnapshot, RankingSnapshot],
-        field_name: Literal["hunting_field", "trophies"],
-        timestamp: bool = True,
-    ):
-        alliance_name = get_player_alliance(server, player_name)
-        alliance = (
-            ""
-            if alliance_name is None
-            else f"([{alliance_name}](http://{server.name}.fourmizzz.fr/classementAlliance.php?alliance={alliance_name}))"
-        )
-        field_before = "{:,}".format(
-            getattr(snapshot, field_name) - getattr(snapshot, f"{field_name}_diff")
-        ).replace(",", " ")
-        field_after = "{:,}".format(getattr(snapshot, field_name)).replace(",", " ")
-        field_diff = "{:+,}".format(getattr(snapshot, f"{field_name}_diff")).replace(
-            ",", " "
-        )
-        snapshot_time = timezone.localtime(snapshot.time, pytz.timezone(TIME_ZONE))
-        message = f"[{player_name}](http://{server.name}.fourmizzz.fr/Membre.php?Pseudo={player_name}){alliance}: {field_before} -> {field_after} ({field_diff})\n"
-        if timestamp:
-            message = snapshot_time.strftime("%d/%m/%Y %H:%M \n") + message
-        return message
-
-    def find_matched_snapshots(
-        last_player_ranking_snapshot: RankingSnapshot,
-        snapshots: QuerySet[RankingSnapshot],
-        field_name: Literal["hunting_field", "trophies"],
+@transaction.atomic
+def process_server_precision_snapshots(server_pk: int) -> int:
+    """
+    Match the moves of all the targets of a server with the ranking moves of the same minute.
+
+    A target's moves are matched once its last ranking snapshot shows the values it was last polled
+    at, against the minute of that ranking snapshot: idle targets are polled minutes after they
+    moved, while the ranking is swept every minute.
+
+    The ranking moves of all those minutes are read once, into a MoveWindow, instead of once per
+    target, and the processed snapshots are flagged in a single query. Returns how many were.
+
+    Runs both right after a sweep (process_new_moves) and on a schedule (process_snapshots). The
+    snapshots are locked for the whole run and skipped by a run that finds them locked, so two
+    runs never notify the same move twice. The searches stop taking on targets after
+    MATCHING_TASK_BUDGET seconds, well within the task's time limit: the others are left for the
+    next run. Notifications are only sent once the snapshots are flagged for good, each on its own.
+    """
+    server = FourmizzzServer.objects.get(pk=server_pk)
+    unprocessed: Dict[int, List[PrecisionSnapshot]] = dict()
+    for snapshot in (
+        PrecisionSnapshot.objects.filter(player__server=server, processed=False)
+        .select_related("player__server", "player__alliance")
+        .select_for_update(skip_locked=True, of=("self",))
+        .order_by("pk")
     ):
-        # Annotate with absolute value
-        snapshots = snapshots.annotate(
-            abs_diff=Func(F(f"{field_name}_diff"), function="ABS")
-        )
-        # Desc order by absolute value, fetch all in one query
-        snapshot_data = list(
-            snapshots.order_by(field_name)
-            .order_by("abs_diff")
-            .reverse()
-            .values_list("pk", f"{field_name}_diff")
-        )
-
-        # Look for combinations explaining this snapshot change (all in memory, no DB queries)
-        target = -getattr(last_player_ranking_snapshot, f"{field_name}_diff")
-        r = 1
-        matched_snapshots_pk = list()
-        while not matched_snapshots_pk and r <= len(snapshot_data) and r < 4:
-            for combo in itertools.combinations(snapshot_data, r):
-                if sum(diff for _, diff in combo) == target:
-                    matched_snapshots_pk.extend(pk for pk, _ in combo)
-                    break
-            r += 1
-
-        notification_message = "Mouvements de la cible:\n"
-        for precision_snapshot in unprocessed_player_snapshots:
-            if getattr(precision_snapshot, f"{field_name}_diff") != 0:
-                notification_message += format_move(
-                    precision_snapshot.player.server,
-                    precision_snapshot.player.name,
-                    precision_snapshot,
-                    field_name=field_name,
-                )
-
-        notification_message += "\nMouvements correspondants:\n"
-        for ranking_snapshot_pk in matched_snapshots_pk:
-            ranking_snapshot = RankingSnapshot.objects.get(pk=ranking_snapshot_pk)
-            notification_message += f"{format_move(ranking_snapshot.server, ranking_snapshot.player_name, ranking_snapshot, field_name=field_name, timestamp=False,)}\n"
-
-        category = player_target.server.name
-        forum = player_target.alliance.name or player_target.name
-        title = (
-            "Mouvement de Tdc"
-            if field_name == "hunting_field"
-            else "Mouvement de Trophées"
-        )
-        color = "80ff00" if field_name == "hunting_field" else "ffd700"
-        silent = field_name == "hunting_field"
-        send_message(
-            category,
-            forum,
-            player_target.name,
-            title,
-            notification_message,
-            color=color,
-            silent=silent,
-        )
+        unprocessed.setdefault(snapshot.player_id, list()).append(snapshot)
+    if not unprocessed:
+        return 0
+    player_targets = {
+        snapshots[0].player.name: snapshots[0].player
+        for snapshots in unprocessed.values()
+    }
 
-    unprocessed_player_snapshots = PrecisionSnapshot.objects.filter(
-        pk__in=unprocessed_player_snapshot_pk
+    # The last ranking snapshot of each target. With their times as well as their ids, only the
+    # partitions of those days are searched.
+    states = list(
+        RankingState.objects.filter(
+            server=server, player_name__in=list(player_targets)
+        ).values_list("player_name", "snapshot_id", "time")
     )
-    player_target = unprocessed_player_snapshots.last().player
-
-    last_player_ranking_snapshot = RankingSnapshot.objects.filter(
-        server=player_target.server, player_name=player_target.name
-    ).last()
-    try:
-        last_player_ranking_snapshot_time = last_player_ranking_snapshot.time.replace(
-            second=0,
-            microsecond=0,
+    last_ranking_snapshots = {
+        snapshot.player_name: snapshot
+        for snapshot in RankingSnapshot.objects.filter(
+            pk__in=[snapshot_id for _, snapshot_id, _ in states],
+            time__in=[time for _, _, time in states],
         )
-    except AttributeError:
-        unprocessed_player_snapshots_str = "\n".join(
-            [
-                f"{s.pk} - {s.time.strftime('%d/%m/%Y %H:%M:%S')}: {s.hunting_field} cm² (diff: {s.hunting_field_diff}) / {s.trophies} trophées (diff: {s.trophies_diff})"
-                for s in unprocessed_player_snapshots
-            ]
+    }
+
+    processed = list()
+    ready = list()
+    for player_name, player_target in player_targets.items():
+        snapshots = unprocessed[player_target.pk]
+        last_ranking_snapshot = last_ranking_snapshots.get(player_name)
+        if last_ranking_snapshot is None:
+            snapshots_str = "\n".join(
+                [
+                    f"{s.pk} - {s.time.strftime('%d/%m/%Y %H:%M:%S')}: "
+                    f"{s.hunting_field} cm² (diff: {s.hunting_field_diff}) / "
+                    f"{s.trophies} trophées (diff: {s.trophies_diff})"
+                    for s in snapshots
+                ]
+            )
+            transaction.on_commit(
+                partial(
+                    send_error,
+                    category=server.name,
+                    thread="process_server_precision_snapshots",
+                    title=f"Could not find last player ranking snapshot: {player_name}.\n"
+                    f"Last unprocessed precision snapshots are: \n{snapshots_str}",
+                )
+            )
+            processed.extend(snapshots)
+            continue
+        last_snapshot = snapshots[-1]
+        if (last_ranking_snapshot.hunting_field, last_ranking_snapshot.trophies) != (
+            last_snapshot.hunting_field,
+            last_snapshot.trophies,
+        ):
+            # The ranking has not caught up with the target yet: left for a later run
+            if timezone.now() - last_snapshot.time > RANKING_CATCH_UP_TIMEOUT:
+                transaction.on_commit(
+                    partial(
+                        send_error,
+                        category=server.name,
+                        thread="process_server_precision_snapshots",
+                        title=f"The ranking never caught up with {player_name}: "
+                        f"{len(snapshots)} precision snapshots left unmatched.",
+                    )
+                )
+                processed.extend(snapshots)
+            continue
+        minute = last_ranking_snapshot.time.replace(second=0, microsecond=0)
+        ready.append((player_target, last_ranking_snapshot, minute))
+
+    if ready:
+        minutes = {minute for _, _, minute in ready}
+        window_filter = Q()
+        for minute in minutes:
+            window_filter |= Q(
+                time__gt=minute, time__lt=minute + datetime.timedelta(minutes=1)
+            )
+        window = MoveWindow(
+            RankingSnapshot.objects.filter(window_filter, server=server).values_list(
+                "pk", "time", "hunting_field_diff", "trophies_diff"
+            )
         )
-        send_error(
-            category=player_target.server.name,
-            thread="process_player_precision_snapshots",
-            title=f"Could not find last player ranking snapshot: {player_target.name}.\n"
-            f"Last unprocessed precision snapshots are: \n{unprocessed_player_snapshots_str}",
+        bounds = window.slices(
+            [minute for _, _, minute in ready],
+            [minute + datetime.timedelta(minutes=1) for _, _, minute in ready],
         )
-        unprocessed_player_snapshots.update(processed=True)
-        raise
 
-    if (
-        last_player_ranking_snapshot_time + datetime.timedelta(minutes=1)
-        < unprocessed_player_snapshots.last().time
-    ):
-        # FIXME: This error message is not working as expected
-        # send_message(
-        #     player_target.server.name,
-        #     "errors",
-        #     f"Erreur: PrecisionSnapshot trop vieux pour {player_target.server}",
-        #     f"Le precision snapshot de {player_target.name} est trop vieux. Il a été pris à {unprocessed_player_snapshots.last().time.strftime('%d/%m/%Y %H:%M')} et le dernier ranking snapshot est à {last_player_ranking_snapshot_time.strftime('%d/%m/%Y %H:%M')}.",
-        #     color="bb0000",
-        # )
-        return
+        notifications = list()
+        deadline = time.monotonic() + settings.MATCHING_TASK_BUDGET
+        for i, ((player_target, last_ranking_snapshot, _), target_bounds) in enumerate(
+            zip(ready, bounds)
+        ):
+            # Only a target whose searches can all run their course
+            remaining = deadline - time.monotonic()
+            if i and remaining < len(MoveWindow.FIELDS) * settings.MATCHING_TIME_BUDGET:
+                break
+            for field_name in MoveWindow.FIELDS:
+                diff = getattr(last_ranking_snapshot, f"{field_name}_diff")
+                exclude = last_ranking_snapshot.pk
+                if diff == 0 or not window.has_moves(
+                    field_name, target_bounds, exclude
+                ):
+                    continue
+                explanations = find_combinations(
+                    window.candidates(field_name, target_bounds, exclude, -diff),
+                    -diff,
+                    max_size=settings.MATCHING_MAX_SIZE,
+                    time_budget=settings.MATCHING_TIME_BUDGET,
+                    all_minimal=True,
+                    limit=settings.MATCHING_MAX_EXPLANATIONS,
+                )
+                notifications.append(
+                    MoveNotification(
+                        player_target,
+                        unprocessed[player_target.pk],
+                        explanations,
+                        field_name,
+                    )
+                )
+            processed.extend(unprocessed[player_target.pk])
 
-    # Get simultaneous ranking snapshots
-    simultaneous_snapshots = RankingSnapshot.objects.filter(
-        server=player_target.server,
-        time__gt=last_player_ranking_snapshot_time,
-        time__lt=last_player_ranking_snapshot_time + datetime.timedelta(minutes=1),
-    )
-    simultaneous_snapshots = simultaneous_snapshots.exclude(
-        pk=last_player_ranking_snapshot.pk
-    )
+        transaction.on_commit(partial(send_move_notifications, notifications))
 
-    hf_simultaneous_snapshots = simultaneous_snapshots.exclude(hunting_field_diff=0)
-    if (
-        hf_simultaneous_snapshots
-        and last_player_ranking_snapshot.hunting_field_diff != 0
-    ):
-        find_matched_snapshots(
-            last_player_ranking_snapshot,
-            hf_simultaneous_snapshots,
-            "hunting_field",
-        )
+    PrecisionSnapshot.objects.filter(
+        pk__in=[snapshot.pk for snapshot in processed]
+    ).update(processed=True)
+    return len(processed)
 
-    trophies_simultaneous_snapshots = simultaneous_snapshots.exclude(trophies_diff=0)
-    if (
-        trophies_simultaneous_snapshots
-        and last_player_ranking_snapshot.trophies_diff != 0
-    ):
-        find_matched_snapshots(
-            last_player_ranking_snapshot,
-            trophies_simultaneous_snapshots,
-            "trophies",
-        )
 
-    unprocessed_player_snapshots.update(processed=True)
+@app.task
+def process_new_moves(ranking_snapshot_results: List[Dict]) -> Optional[int]:
+    """
+    Match the targets' moves as soon as a ranking sweep has landed, rather than at the next
+    process_snapshots. Takes the same per-page results as update_n_scanned_pages.
+    """
+    server_pk = ranking_snapshot_results[0]["server_pk"]
+    if not PrecisionSnapshot.objects.filter(
+        player__server=server_pk, processed=False
+    ).exists():
+        return None
+    return process_server_precision_snapshots(server_pk)
 
 
 @app.task
 def process_snapshots() -> None:
-    # Process pending precison snapshots
-    process_snapshot_subtasks = list()
-    unprocessed_snapshots = PrecisionSnapshot.objects.filter(processed=False)
-    unique_player_targets_pk = PlayerTarget.objects.filter(
-        pk__in=unprocessed_snapshots.distinct("player").values_list(
-            "player__pk", flat=True
-        )
+    # Process pending precison snapshots, one batch per server. Moves are normally matched
+    # right after each sweep (process_new_moves), this picks up whatever that missed.
+    servers = (
+        PrecisionSnapshot.objects.filter(processed=False)
+        .values_list("player__server", "player__server__name")
+        .distinct()
     )
-    for unique_player_target_pk in unique_player_targets_pk:
-        unique_player_unprocessed_snapshots_pk = list(
-            unprocessed_snapshots.filter(player=unique_player_target_pk).values_list(
-                "pk", flat=True
+    # With the matching that follows each sweep, on the server's ranking queue
+    return group(
+        [
+            process_server_precision_snapshots.si(server_pk).set(
+                queue=server_queue(server_name, "ranking")
             )
-        )
-        process_snapshot_subtasks.append(
-            process_player_precision_snapshots.si(
-                unique_player_unprocessed_snapshots_pk
-            )
-        )
+            for server_pk, server_name in servers
+        ]
+    ).delay()
 
-    return group(process_snapshot_subtasks).delay()
+
+# Seconds of rolling up per run, well within the time limit of both tasks (see settings). The
+# first run after a long stop cannot catch up at once: the next ones carry on.
+ROLLUP_TIME_BUDGET = 300
 
 
 @app.task
-def clean_old_snapshots() -> None:
-    PrecisionSnapshot.objects.filter(
-        time__lt=datetime.datetime.now() - datetime.timedelta(days=3)
-    ).delete()
-    RankingSnapshot.objects.filter(
-        time__lt=datetime.datetime.now() - datetime.timedelta(days=3)
-    ).delete()
+def rollup_snapshots() -> Dict[str, int]:
+    return roll_up(time_budget=ROLLUP_TIME_BUDGET)
+
+
+@app.task
+def clean_old_snapshots() -> Dict[str, Dict[str, List[str]]]:
+    # Snapshots are kept 3 full days, then dropped a whole partition (day) at a time, which is
+    # instant and leaves no dead rows behind. The coming days are partitioned first, whatever
+    # happens to the rest. Only the days the rollups have summed up are dropped, so no history is
+    # lost: a rollup that is behind holds back the drop, not the whole maintenance.
+    today = timezone.now().date()
+    partitions = dict()
+    for table in PARTITIONED_TABLES:
+        partitions[table] = {
+            "created": create_partitions(
+                table, today, today + datetime.timedelta(days=DAYS_AHEAD)
+            ),
+            "dropped": [],
+        }
+
+    roll_up(time_budget=ROLLUP_TIME_BUDGET)
+    drop_before = min(today - datetime.timedelta(days=3), rolled_up_until().date())
+    for table in PARTITIONED_TABLES:
+        partitions[table]["dropped"] = drop_partitions_before(table, drop_before)
+    return partitions
@@ -1,3 +1,1153 @@
+import datetime
+import itertools
+import os
+import random
+import threading
+import time
+import unittest
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db import connections
+from django.db import transaction
+from django.test import SimpleTestCase
 from django.test import TestCase
+from django.test import TransactionTestCase
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from scraper import web_agent
+from scraper.ingest import ingest_ranking_rows
+from scraper.leases import acquire_lease
+from scraper.leases import release_lease
+from scraper.matching import find_combinations
+from scraper.models import AllianceTarget
+from scraper.models import FourmizzzServer
+from scraper.models import JobLease
+from scraper.models import PlayerAlliance
+from scraper.models import PlayerTarget
+from scraper.models import PrecisionRollup
+from scraper.models import PrecisionSnapshot
+from scraper.models import PrecisionState
+from scraper.models import RankingRollup
+from scraper.models import RankingSnapshot
+from scraper.models import RankingState
+from scraper.models import RequestBucket
+from scraper.models import SnapshotRollup
+from scraper.notifications import MoveNotification
+from scraper.notifications import send_move_notifications
+from scraper.parsers import MV_MARKER
+from scraper.parsers import UNKNOWN_PLAYER_MARKER
+from scraper.parsers import MemberProfile
+from scraper.parsers import ParseError
+from scraper.parsers import alliance_members
+from scraper.parsers import backend
+from scraper.parsers import member_profile
+from scraper.parsers import ranking_rows
+from scraper.partitions import PARTITIONED_TABLES
+from scraper.partitions import create_partitions
+from scraper.partitions import partition_name
+from scraper.rollups import alliance_history
+from scraper.rollups import player_history
+from scraper.rollups import roll_up
+from scraper.rollups import rolled_up_until
+from scraper.standin import SyntheticWorld
+from scraper.tasks import _first_page_below
+from scraper.tasks import check_mv_players
+from scraper.tasks import check_server_mv_players
+from scraper.tasks import clean_old_snapshots
+from scraper.tasks import process_server_precision_snapshots
+from scraper.tasks import take_page_ranking_snapshot
+from scraper.tasks import take_server_ranking_sweep
+from scraper.tasks import update_n_scanned_pages
+from scraper.web_agent import DEFAULT_LANE
+from scraper.web_agent import MV_PROFILE_MAX_AGE
+from scraper.web_agent import PROFILE_MAX_AGE
+from scraper.web_agent import Throttled
+from scraper.web_agent import _http_session
+from scraper.web_agent import _remember_alliances
+from scraper.web_agent import _reserve
+from scraper.web_agent import fetch_many
+from scraper.web_agent import get_alliance_members
+from scraper.web_agent import get_member_profile
+from scraper.web_agent import get_member_profiles
+from scraper.web_agent import get_player_alliance
+from scraper.web_agent import get_player_alliances
+
+from tracker.celery import SERVER_JOBS
+from tracker.celery import SERVERS
+from tracker.celery import app
+from tracker.celery import server_queue
+
+
+@unittest.skipUnless(connection.vendor == "postgresql", "query plans are checked on PostgreSQL")
+class SnapshotQueryPlanTests(TestCase):
+    """
+    The hot snapshot queries must be able to use an index.
+
+    The test tables are small, so sequential scans are switched off: the planner then only falls
+    back to one when no index fits the query, which is the regression we are after. They hold a
+    ranking's worth of players, analyzed, so that it picks the index that fits best.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.server = FourmizzzServer.objects.create(name="s1", username="tracker")
+        other_server = FourmizzzServer.objects.create(name="s2", username="tracker")
+        players = PlayerTarget.objects.bulk_create(
+            PlayerTarget(server=cls.server, name=f"Joueur{i}") for i in range(1, 21)
+        )
+        cls.player = players[0]
+        now = timezone.now()
+        RankingSnapshot.objects.bulk_create(
+            RankingSnapshot(
+                server=server,
+                player_name=f"Joueur{i}",
+                time=now - datetime.timedelta(minutes=minutes),
+                hunting_field=1000,
+                trophies=0,
+                hunting_field_diff=0,
+                trophies_diff=0,
+            )
+            for server in (cls.server, other_server)
+            for i in range(1, 101)
+            for minutes in range(0, 200, 10)
+        )
+        PrecisionSnapshot.objects.bulk_create(
+            PrecisionSnapshot(
+                player=player,
+                time=now - datetime.timedelta(minutes=minutes),
+                hunting_field=1000,
+                trophies=0,
+                hunting_field_diff=0,
+                trophies_diff=0,
+                processed=minutes > 0,
+            )
+            for player in players
+            for minutes in range(10)
+        )
+        with connection.cursor() as cursor:
+            for table in PARTITIONED_TABLES:
+                cursor.execute(f"ANALYZE {table}")
+
+    def setUp(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+
+    def assertUsesIndex(self, queryset, index):
+        # The tables are partitioned, so the plan names each partition's own copy of the index
+        plan = queryset.explain()
+        self.assertNotIn("Seq Scan", plan)
+        self.assertRegex(plan, rf"\b{index}_(p\d{{8}}|default)\b")
+
+    def test_player_ranking_history(self):
+        self.assertUsesIndex(
+            RankingSnapshot.objects.filter(server=self.server, player_name="Joueur1").order_by("-time")[:1],
+            "rankingsnap_player_time_idx",
+        )
+
+    def test_simultaneous_ranking_snapshots(self):
+        start = timezone.now().replace(second=0, microsecond=0)
+        self.assertUsesIndex(
+            RankingSnapshot.objects.filter(
+                server=self.server,
+                time__gt=start,
+                time__lt=start + datetime.timedelta(minutes=1),
+            ),
+            "rankingsnap_server_time_idx",
+        )
+
+    def test_player_precision_history(self):
+        self.assertUsesIndex(
+            PrecisionSnapshot.objects.filter(player=self.player).order_by("-time"),
+            "precisionsnap_player_time_idx",
+        )
+
+    def test_unprocessed_precision_snapshots(self):
+        self.assertUsesIndex(
+            PrecisionSnapshot.objects.filter(processed=False).distinct("player"),
+            "precisionsnap_unprocessed_idx",
+        )
+
+    def test_time_window_prunes_to_its_day(self):
+        today = timezone.now().date()
+        start = timezone.now().replace(hour=12, minute=0, second=0, microsecond=0)
+        plan = RankingSnapshot.objects.filter(
+            server=self.server,
+            time__gt=start,
+            time__lt=start + datetime.timedelta(minutes=1),
+        ).explain()
+        self.assertIn(partition_name("scraper_rankingsnapshot", today), plan)
+        self.assertNotIn(
+            partition_name("scraper_rankingsnapshot", today + datetime.timedelta(days=1)), plan
+        )
+        self.assertNotIn("scraper_rankingsnapshot_default", plan)
+
+
+class MoveNotificationQueryTests(TestCase):
+    """
+    Rendering move notifications takes a fixed number of queries, however many moves they list:
+    one for the matched ranking snapshots, and one for the alliances of everyone named (see
+    get_player_alliances).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.server = FourmizzzServer.objects.create(name="s1", username="tracker")
+        cls.player = PlayerTarget.objects.create(server=cls.server, name="Cible")
+        cls.precision_snapshot = PrecisionSnapshot.objects.create(
+            player=cls.player, hunting_field=900, hunting_field_diff=-100, trophies=10
+        )
+        cls.ranking_snapshots = RankingSnapshot.objects.bulk_create(
+            RankingSnapshot(
+                server=cls.server,
+                player_name=f"Joueur{i}",
+                hunting_field=1000 + i,
+                hunting_field_diff=i + 1,
+                trophies=10,
+            )
+            for i in range(20)
+        )
+        # Alliances already known, as the profile fetches and refresh_player_alliances keep them
+        names = ["Cible"] + [snapshot.player_name for snapshot in cls.ranking_snapshots]
+        _remember_alliances(cls.server, {name: "ALLY" for name in names})
+
+    def notification(self, explanations):
+        # Fresh instances, so nothing is already loaded on them
+        player = PlayerTarget.objects.select_related("server", "alliance").get(pk=self.player.pk)
+        return MoveNotification(player, [self.precision_snapshot], explanations, "hunting_field")
+
+    def send(self, notifications):
+        """The messages sent, and the number of queries it took."""
+        with mock.patch("scraper.notifications.send_message") as send_message:
+            with CaptureQueriesContext(connection) as queries:
+                send_move_notifications(notifications)
+        self.assertEqual(send_message.call_count, len(notifications))
+        return [call.args[4] for call in send_message.call_args_list], len(queries)
+
+    def test_one_move(self):
+        (message,), n_queries = self.send([self.notification([[self.ranking_snapshots[0].pk]])])
+        self.assertLessEqual(n_queries, 2)
+        self.assertIn("Joueur0", message)
+        self.assertIn("[ALLY]", message)
+
+    def test_queries_do_not_grow_with_moves(self):
+        _, n_queries = self.send([self.notification([[self.ranking_snapshots[0].pk]])])
+        pks = [snapshot.pk for snapshot in self.ranking_snapshots]
+        notifications = [self.notification([pks[i:i + 4] for i in range(0, 20, 4)]) for _ in range(3)]
+        with self.assertNumQueries(n_queries):
+            messages, _ = self.send(notifications)
+        for i in range(20):
+            self.assertIn(f"Joueur{i}]", messages[0])
+        self.assertIn("possibilité 5", messages[0])
+
+    def test_failed_send_does_not_stop_the_others(self):
+        notifications = [self.notification([[self.ranking_snapshots[i].pk]]) for i in range(3)]
+        with mock.patch(
+            "scraper.notifications.send_message", side_effect=[Exception("HTTP 502"), None, None]
+        ) as send_message:
+            with self.assertLogs("scraper.notifications", "ERROR"):
+                self.assertEqual(send_move_notifications(notifications), 2)
+        self.assertEqual(send_message.call_count, 3)
+
+    def test_failed_render_does_not_stop_the_others(self):
+        notifications = [self.notification([[self.ranking_snapshots[i].pk]]) for i in range(3)]
+        # Cleaned away between the match and the notification
+        RankingSnapshot.objects.filter(pk=self.ranking_snapshots[0].pk).delete()
+        with mock.patch("scraper.notifications.send_message") as send_message:
+            with self.assertLogs("scraper.notifications", "ERROR"):
+                self.assertEqual(send_move_notifications(notifications), 2)
+        self.assertEqual([call.args[2] for call in send_message.call_args_list], ["Cible", "Cible"])
+        self.assertIn("Joueur1]", send_message.call_args_list[0].args[4])
+
+
+class ProcessPrecisionSnapshotsTests(TestCase):
+    """An idle target is polled minutes after it moved: its move is matched at the ranking's minute."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.server = FourmizzzServer.objects.create(name="s1", username="tracker")
+        cls.player = PlayerTarget.objects.create(server=cls.server, name="Cible")
+        cls.moved_at = timezone.now().replace(second=0, microsecond=0) - datetime.timedelta(minutes=20)
+        # Cible lost 100 cm² to Joueur1 in that minute, and Joueur2 moved by something else
+        moves = list()
+        for player_name, hunting_field, diff, seconds in (
+            ("Cible", 900, -100, 10),
+            ("Joueur1", 1100, 100, 20),
+            ("Joueur2", 2050, 50, 30),
+        ):
+            moves.append(
+                RankingSnapshot.objects.create(
+                    server=cls.server,
+                    player_name=player_name,
+                    hunting_field=hunting_field,
+                    hunting_field_diff=diff,
+                    trophies=10,
+                )
+            )
+            RankingSnapshot.objects.filter(pk=moves[-1].pk).update(
+                time=cls.moved_at + datetime.timedelta(seconds=seconds)
+            )
+        cls.ranking_move = moves[0]
+        _remember_alliances(cls.server, {name: None for name in ("Cible", "Joueur1", "Joueur2")})
+
+    def poll(self, hunting_field, minutes_after):
+        snapshot = PrecisionSnapshot.objects.create(
+            player=self.player, hunting_field=hunting_field, hunting_field_diff=hunting_field - 1000, trophies=10
+        )
+        PrecisionSnapshot.objects.filter(pk=snapshot.pk).update(
+            time=self.moved_at + datetime.timedelta(minutes=minutes_after)
+        )
+        return snapshot
+
+    def ranking_state(self, hunting_field):
+        RankingState.objects.create(
+            server=self.server,
+            player_name="Cible",
+            hunting_field=hunting_field,
+            trophies=10,
+            time=self.moved_at + datetime.timedelta(seconds=10),
+            snapshot_id=self.ranking_move.pk,
+        )
+
+    def process(self):
+        with mock.patch("scraper.notifications.send_message") as send_message, mock.patch(
+            "scraper.tasks.send_error"
+        ) as send_error, self.captureOnCommitCallbacks(execute=True):
+            n_processed = process_server_precision_snapshots(self.server.pk)
+        return n_processed, [call.args[4] for call in send_message.call_args_list], send_error
+
+    def test_idle_target_that_moves(self):
+        self.ranking_state(900)
+        # Polled at the idle interval, well after the ranking saw the move
+        snapshot = self.poll(900, 12)
+        n_processed, messages, _ = self.process()
+        self.assertEqual(n_processed, 1)
+        self.assertEqual(len(messages), 1)
+        self.assertIn("Joueur1", messages[0])
+        self.assertNotIn("Joueur2", messages[0])
+        snapshot.refresh_from_db()
+        self.assertTrue(snapshot.processed)
+
+    def test_ranking_not_caught_up(self):
+        # The ranking still shows the previous move's values
+        RankingSnapshot.objects.filter(pk=self.ranking_move.pk).update(hunting_field=1000)
+        self.ranking_state(1000)
+        snapshot = self.poll(900, 1)
+        self.assertEqual(self.process()[:2], (0, []))
+        snapshot.refresh_from_db()
+        self.assertFalse(snapshot.processed)
+
+    def test_ranking_never_catches_up(self):
+        RankingSnapshot.objects.filter(pk=self.ranking_move.pk).update(hunting_field=1000)
+        self.ranking_state(1000)
+        self.poll(900, -120)
+        n_processed, messages, send_error = self.process()
+        self.assertEqual((n_processed, messages), (1, []))
+        send_error.assert_called_once()
+
+
+RANKING_PAGE = """<html><head><title>Classement</title></head><body>
+<div id="menu"><a href="classement2.php">Classement</a></div>
+<div id="centre">
+<table class="tab_triable" cellspacing="0">
+<tr><th>Rang</th><th>Pseudo</th><th>Terrain de chasse</th><th>Fourmilière</th><th>Technologie</th>
+<th>Trophées</th></tr>
+<tr><td>101</td><td><a href="Membre.php?Pseudo=Joueur1">Joueur1</a></td><td>12 345 678</td>
+<td>30</td><td>25</td><td>1 204</td></tr>
+<tr><td>102</td><td><a href="Membre.php?Pseudo=Joueur%202">Joueur 2</a></td><td>9&nbsp;876&nbsp;543</td>
+<td>28</td><td>25</td><td>0</td></tr>
+</table>
+</div></body></html>"""
+
+MEMBER_PAGE = """<html><body><div id="centre"><center>
+<div>Profil de Joueur1</div>
+<div>
+<div class="boite_membre"><table>
+<tr><td>Alliance :</td><td><a href="classementAlliance.php?alliance=ALLY">ALLY</a></td></tr>
+<tr><td>Pseudo :</td><td>Joueur1</td></tr>
+</table>{mv}</div>
+<div>Statistiques</div>
+<div><table>
+<tr><td>Rang</td><td>101</td></tr>
+<tr><td>Terrain de chasse</td><td>12 345 678</td></tr>
+</table></div>
+</div>
+</center>
+<table class="tableau_score">
+<tr><td>Score</td><td>-</td></tr><tr><td>Fourmilière</td><td>30</td></tr>
+<tr><td>Technologie</td><td>25</td></tr><tr><td>Ouvrières</td><td>1 000</td></tr>
+<tr><td>Trophées</td><td>1 204</td></tr>
+</table>
+</div></body></html>"""
+
+
+@override_settings(HTML_PARSER="lxml")
+class ParserTests(SimpleTestCase):
+    """The extractors against game pages, with the default lxml backend (see ParserHtmlParserTests)."""
+
+    def setUp(self):
+        backend.cache_clear()
+        self.addCleanup(backend.cache_clear)
+
+    def test_backend(self):
+        self.assertEqual(backend(), settings.HTML_PARSER)
+
+    def test_ranking_rows(self):
+        self.assertEqual(ranking_rows(RANKING_PAGE), [("Joueur1", 12345678, 1204), ("Joueur 2", 9876543, 0)])
+
+    def test_ranking_past_the_end(self):
+        self.assertIsNone(ranking_rows("<html><body><div id='centre'><p>Aucun joueur</p></div></body></html>"))
+        empty = RANKING_PAGE.split("<tr><td>101")[0] + "</table></div></body></html>"
+        self.assertEqual(ranking_rows(empty), [])
+
+    def test_member_profile(self):
+        self.assertEqual(
+            member_profile(MEMBER_PAGE.format(mv="")),
+            MemberProfile(exists=True, hunting_field=12345678, trophies=1204, mv=False, alliance="ALLY"),
+        )
+        self.assertTrue(member_profile(MEMBER_PAGE.format(mv=f"<p>{MV_MARKER}</p>")).mv)
+
+    def test_member_without_alliance(self):
+        page = MEMBER_PAGE.format(mv="").replace('<a href="classementAlliance.php?alliance=ALLY">ALLY</a>', "")
+        self.assertIsNone(member_profile(page).alliance)
+        # The alliance row after the name
+        rows = "<tr><td>Pseudo :</td><td>Joueur1</td></tr><tr><td>Alliance :</td><td></td></tr>"
+        page = MEMBER_PAGE.format(mv="").replace(MEMBER_PAGE.split("<table>")[1].split("</table>")[0], rows)
+        self.assertIsNone(member_profile(page).alliance)
+
+    def test_member_missing_values(self):
+        page = MEMBER_PAGE.format(mv="").replace("Terrain de chasse</td><td>12 345 678", "Terrain de chasse</td><td>")
+        page = page.split('<table class="tableau_score">')[0] + "</div></body></html>"
+        profile = member_profile(page)
+        self.assertEqual((profile.exists, profile.hunting_field, profile.trophies), (True, None, None))
+
+    def test_unknown_member(self):
+        page = f"<html><body><div id='centre'><p>{UNKNOWN_PLAYER_MARKER} Joueur3</p></div></body></html>"
+        self.assertEqual(member_profile(page), MemberProfile(exists=False))
+
+    def test_odd_member_pages(self):
+        for page in (
+            "<html><body><p>Erreur 500</p></body></html>",
+            "<html><body><div id='centre'><p>Maintenance</p></div></body></html>",
+            "<html><body><div id='centre'><div class='boite_membre'><table></table></div></div></body></html>",
+        ):
+            with self.subTest(page=page):
+                with self.assertRaises(ParseError):
+                    member_profile(page)
+
+    def test_alliance_members(self):
+        page = (
+            "<html><body><div id='centre'><table id='tabMembresAlliance'>"
+            "<tr><th>Rang</th><th>Grade</th><th>Pseudo</th><th>Terrain de chasse</th></tr>"
+            "<tr><td>1</td><td>Chef</td><td>Joueur1</td><td>12 345 678</td></tr>"
+            "<tr><td>2</td><td>Membre</td><td>Joueur 2</td><td>9 876 543</td></tr>"
+            "</table></div></body></html>"
+        )
+        self.assertEqual(alliance_members(page), ["Joueur1", "Joueur 2"])
+
+    def test_unknown_alliance(self):
+        self.assertEqual(alliance_members("<html><body><div id='centre'>Alliance inconnue</div></body></html>"), [])
+        header_only = "<html><body><table id='tabMembresAlliance'><tr><th>Rang</th></tr></table></body></html>"
+        self.assertEqual(alliance_members(header_only), [])
+
+
+@override_settings(HTML_PARSER="html.parser")
+class ParserHtmlParserTests(ParserTests):
+    """The same, with the pure Python backend."""
+
+
+class CeleryQueueTests(SimpleTestCase):
+    """SERVERS is kept by hand: every server a FourmizzzServer can be must have its queues."""
+
+    def setUp(self):
+        self.declared = {queue.name for queue in app.conf.task_queues}
+
+    def test_every_server_has_its_queues(self):
+        names = [name for name, _ in FourmizzzServer._meta.get_field("name").choices]
+        self.assertCountEqual(SERVERS, names)
+        for name in names:
+            for job in SERVER_JOBS:
+                with self.subTest(server=name, job=job):
+                    self.assertIn(server_queue(name, job), self.declared)
+
+    def test_routes_are_declared(self):
+        self.assertIn(app.conf.task_default_queue, self.declared)
+        for task, route in app.conf.task_routes.items():
+            with self.subTest(task=task):
+                self.assertIn(route["queue"], self.declared)
+
+
+class FindCombinationsTests(SimpleTestCase):
+    """find_combinations against brute force, on inputs small enough to try every combination."""
+
+    @staticmethod
+    def brute_force(moves, target, max_size):
+        for size in range(1, max_size + 1):
+            found = [
+                sorted(pk for pk, _ in combination)
+                for combination in itertools.combinations(moves, size)
+                if sum(diff for _, diff in combination) == target
+                and all(diff * target > 0 for _, diff in combination)
+            ]
+            if found:
+                return sorted(found)
+        return []
+
+    def test_same_as_brute_force(self):
+        rng = random.Random(0)
+        for _ in range(200):
+            moves = [(pk, rng.choice([1, -1]) * rng.randint(1, 30)) for pk in range(rng.randint(0, 12))]
+            target = rng.choice([1, -1]) * rng.randint(1, 80)
+            for max_size in range(1, 6):
+                with self.subTest(moves=moves, target=target, max_size=max_size):
+                    expected = self.brute_force(moves, target, max_size)
+                    found = find_combinations(moves, target, max_size=max_size, all_minimal=True, limit=10**6)
+                    self.assertEqual(sorted(sorted(pks) for pks in found), expected)
+                    first = find_combinations(moves, target, max_size=max_size)
+                    self.assertEqual(len(first), min(1, len(expected)))
+                    if first:
+                        self.assertIn(sorted(first[0]), expected)
+
+    def test_time_budget(self):
+        moves = [(1, 3), (2, 4), (3, 5)]
+        self.assertEqual(find_combinations(moves, 7, time_budget=0.5), [[1, 2]])
+        # A second passes between every look at the clock: out of time before the pairs
+        with mock.patch("scraper.matching.time.monotonic", side_effect=itertools.count()):
+            self.assertEqual(find_combinations(moves, 7, time_budget=0.5), [])
+
+
+def lowest_of_page(page):
+    """A ranking of 30 pages, each of whose lowest hunting field is 10 under the previous one's."""
+    return 1000 - 10 * page if page <= 30 else None
+
+
+class FirstPageBelowTests(SimpleTestCase):
+    def search(self, threshold, guess=None, max_pages=100):
+        """The page found, and those fetched to find it."""
+        fetched = list()
+
+        def lowest(page):
+            fetched.append(page)
+            return lowest_of_page(page)
+
+        known = {page: lowest_of_page(page) for page in (1, 2, 3)}
+        return _first_page_below(lowest, threshold, known, guess, max_pages), fetched
+
+    def test_threshold_found(self):
+        for threshold in (995, 975, 970, 800, 705, 700):
+            with self.subTest(threshold=threshold):
+                page, _ = self.search(threshold)
+                self.assertEqual(page, (1000 - threshold + 9) // 10)
+
+    def test_ranking_exhausted(self):
+        # Not even the last page reaches it: the last page, not one past it
+        self.assertEqual(self.search(500)[0], 30)
+        self.assertEqual(self.search(500, guess=31)[0], 30)
+        self.assertEqual(self.search(500, max_pages=20)[0], 20)
+
+    def test_guess(self):
+        self.assertEqual(self.search(800, guess=20), (20, [20, 19]))
+        # The ranking moved since
+        self.assertEqual(self.search(800, guess=19), (20, [19, 20]))
+        self.assertEqual(self.search(800, guess=25)[0], 20)
+
+
+class UpdateScannedPagesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.server = FourmizzzServer.objects.create(name="s1", username="tracker", n_scanned_pages=3)
+        cls.player = PlayerTarget.objects.create(server=cls.server, name="Cible")
+
+    def update(self, weakest_hunting_field, pages):
+        """The page count found, and the pages fetched to find it."""
+        PrecisionState.objects.create(
+            player=self.player, hunting_field=weakest_hunting_field, trophies=0, time=timezone.now()
+        )
+        fetched = list()
+
+        def take_page_ranking_snapshot(server_pk, page):
+            fetched.append(page)
+            return {"server_pk": server_pk, "page": page, "hunting_field": lowest_of_page(page), "trophies": 0}
+
+        results = [
+            {"server_pk": self.server.pk, "page": page, "hunting_field": lowest_of_page(page), "trophies": 0}
+            for page in pages
+        ]
+        with mock.patch("scraper.tasks.take_page_ranking_snapshot", take_page_ranking_snapshot):
+            n_pages = update_n_scanned_pages(results)
+        self.server.refresh_from_db()
+        self.assertEqual(self.server.n_scanned_pages, n_pages)
+        return n_pages, fetched
+
+    def test_page_boundaries_reused(self):
+        self.server.page_boundaries = {str(page): lowest_of_page(page) for page in (18, 19, 20, 21)}
+        self.server.save()
+        # A third of it is reached on page 20, where the previous sweeps saw it
+        self.assertEqual(self.update(2400, [1, 2, 3]), (20, [20, 19]))
+        self.assertEqual(self.server.page_boundaries["19"], 810)
+
+    def test_ranking_exhausted(self):
+        self.assertEqual(self.update(1500, range(1, 32)), (30, []))
+        self.assertIsNone(self.server.page_boundaries["31"])
+
+
+class CheckMvPlayersTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.server = FourmizzzServer.objects.create(name="s1", username="tracker")
+        PlayerTarget.objects.bulk_create(
+            PlayerTarget(server=cls.server, name=name, mv=True) for name in ("Revenu", "Parti", "Absent")
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_back_and_missing_players(self):
+        profiles = {
+            "Revenu": MemberProfile(exists=True, mv=False),
+            "Parti": MemberProfile(exists=False),  # Renamed or deleted
+            "Absent": MemberProfile(exists=True, mv=True),
+        }
+
+        max_ages = set()
+
+        def get_member_profiles(server, names, **kwargs):
+            max_ages.add(kwargs.get("max_age"))
+            return [profiles[name] for name in names]
+
+        with mock.patch("scraper.tasks.get_member_profiles", get_member_profiles), mock.patch(
+            "scraper.tasks.send_message"
+        ) as send_message, mock.patch("scraper.tasks.send_error") as send_error:
+            self.assertEqual(check_server_mv_players(self.server.pk), ["Revenu"])
+            # The missing player is only reported once
+            check_server_mv_players(self.server.pk)
+
+        self.assertEqual(
+            list(PlayerTarget.objects.filter(mv=True).order_by("name").values_list("name", flat=True)),
+            ["Absent", "Parti"],
+        )
+        send_message.assert_called_once()
+        self.assertEqual(send_message.call_args.kwargs["title"], "Revenu n'est plus en vacances !!!")
+        send_error.assert_called_once()
+        self.assertIn("Parti", send_error.call_args.kwargs["title"])
+        # Fresher pages than the other callers of the shared profile cache want
+        self.assertEqual(max_ages, {MV_PROFILE_MAX_AGE})
+
+
+class JobLeaseTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.server = FourmizzzServer.objects.create(name="s1", username="tracker")
+
+    def lease(self):
+        return JobLease.objects.get(server=self.server, job="ranking")
+
+    def test_single_flight(self):
+        holder = acquire_lease(self.server, "ranking", datetime.timedelta(minutes=3))
+        self.assertTrue(holder)
+        self.assertIsNone(acquire_lease(self.server, "ranking", datetime.timedelta(minutes=3)))
+        self.assertIsNone(acquire_lease(self.server, "ranking", datetime.timedelta(minutes=3)))
+        self.assertEqual((self.lease().holder, self.lease().n_skipped), (holder, 2))
+        # Other jobs and servers are not held up
+        self.assertTrue(acquire_lease(self.server, "precision", datetime.timedelta(minutes=3)))
+        other_server = FourmizzzServer.objects.create(name="s2", username="tracker")
+        self.assertTrue(acquire_lease(other_server, "ranking", datetime.timedelta(minutes=3)))
+
+        self.assertTrue(release_lease(self.server.pk, "ranking", holder))
+        self.assertTrue(acquire_lease(self.server, "ranking", datetime.timedelta(minutes=3)))
+
+    def test_expired_lease_taken_over(self):
+        stale = acquire_lease(self.server, "ranking", datetime.timedelta(minutes=3))
+        JobLease.objects.update(expires_at=timezone.now() - datetime.timedelta(seconds=1))
+        holder = acquire_lease(self.server, "ranking", datetime.timedelta(minutes=3))
+        self.assertTrue(holder)
+        self.assertNotEqual(holder, stale)
+        self.assertEqual(self.lease().n_skipped, 0)
+
+        # The run that lost it finishes late: it must not release the new run's lease
+        self.assertFalse(release_lease(self.server.pk, "ranking", stale))
+        self.assertEqual(self.lease().holder, holder)
+        self.assertTrue(release_lease(self.server.pk, "ranking", holder))
+        self.assertEqual((self.lease().holder, self.lease().expires_at), ("", None))
+
+    def test_mv_checks_single_flight(self):
+        PlayerTarget.objects.create(server=self.server, name="Absent", mv=True)
+        with mock.patch("scraper.tasks.group") as group:
+            check_mv_players()
+            check_mv_players()
+        self.assertEqual([len(call.args[0]) for call in group.call_args_list], [1, 0])
+        self.assertEqual(JobLease.objects.get(server=self.server, job="mv").n_skipped, 1)
+
+
+class MemberProfileCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Not rate limited: the request slots would be reserved outside of the test's transaction
+        cls.server = FourmizzzServer.objects.create(name="s1", username="tracker", requests_per_second=0)
+
+    def setUp(self):
+        cache.clear()
+        fetch = mock.patch("scraper.web_agent.fetch", return_value=MEMBER_PAGE.format(mv=""))
+        self.fetch = fetch.start()
+        self.addCleanup(fetch.stop)
+
+    def fetched(self):
+        """The players whose member page was fetched since the last call."""
+        players = sorted(call.args[1].split("Pseudo=")[1] for call in self.fetch.call_args_list)
+        self.fetch.reset_mock()
+        return players
+
+    def at(self, seconds):
+        return mock.patch("django.utils.timezone.now", return_value=self.start + datetime.timedelta(seconds=seconds))
+
+    def test_shared_between_callers(self):
+        self.start = timezone.now()
+        with self.at(0):
+            profile = get_member_profile(self.server, "Joueur1")
+        self.assertEqual(profile.hunting_field, 12345678)
+        self.assertEqual(self.fetched(), ["Joueur1"])
+
+        # Another caller, within PROFILE_MAX_AGE
+        with self.at(PROFILE_MAX_AGE.total_seconds() - 1):
+            self.assertEqual(get_member_profile(self.server, "Joueur1"), profile)
+            self.assertEqual(get_member_profiles(self.server, ["Joueur1", "Joueur2"]), [profile, profile])
+        self.assertEqual(self.fetched(), ["Joueur2"])
+
+        # Too old by then
+        with self.at(PROFILE_MAX_AGE.total_seconds() + 1):
+            get_member_profile(self.server, "Joueur1")
+        self.assertEqual(self.fetched(), ["Joueur1"])
+
+    def test_mv_checks_want_fresher_pages(self):
+        self.start = timezone.now()
+        with self.at(0):
+            get_member_profiles(self.server, ["Joueur1", "Joueur2"])
+        self.fetched()
+
+        with self.at(MV_PROFILE_MAX_AGE.total_seconds() + 1):
+            get_member_profile(self.server, "Joueur1")
+            self.assertEqual(self.fetched(), [])
+            get_member_profiles(self.server, ["Joueur1", "Joueur2"], max_age=MV_PROFILE_MAX_AGE)
+            self.assertEqual(self.fetched(), ["Joueur1", "Joueur2"])
+
+
+class PlayerAllianceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.server = FourmizzzServer.objects.create(name="s1", username="tracker")
+
+    def setUp(self):
+        cache.clear()
+
+    def test_many_players(self):
+        members = [f"Joueur{i}" for i in range(400)]
+        cache.add("mv_missing:s1:Parti", True)
+        with mock.patch("scraper.web_agent.fetch"), mock.patch(
+            "scraper.web_agent.alliance_members", return_value=members
+        ):
+            get_alliance_members(self.server, "ALLY")
+        # All read back without a member page, and the error flags in the cache are left alone
+        with mock.patch("scraper.web_agent.get_member_profiles", side_effect=AssertionError):
+            self.assertEqual(get_player_alliances(self.server, members), {member: "ALLY" for member in members})
+        self.assertTrue(cache.get("mv_missing:s1:Parti"))
+
+    def test_expires(self):
+        with mock.patch("scraper.web_agent.fetch"), mock.patch(
+            "scraper.web_agent.alliance_members", return_value=["Joueur1"]
+        ):
+            get_alliance_members(self.server, "ALLY")
+        self.assertEqual(get_player_alliance(self.server, "Joueur1", fetch_missing=False), "ALLY")
+        PlayerAlliance.objects.update(updated_at=timezone.now() - datetime.timedelta(hours=2))
+        self.assertIsNone(get_player_alliance(self.server, "Joueur1", fetch_missing=False))
+
+    def test_refresh_renews_unchanged_alliances(self):
+        start = timezone.now()
+
+        def at(minutes):
+            return mock.patch("django.utils.timezone.now", return_value=start + datetime.timedelta(minutes=minutes))
+
+        # First read a minute after a refresh, then refreshed every 30 minutes, never changing alliance
+        for minutes in (1, 30, 60):
+            with at(minutes), mock.patch("scraper.web_agent.fetch"), mock.patch(
+                "scraper.web_agent.alliance_members", return_value=["Joueur1"]
+            ):
+                get_alliance_members(self.server, "ALLY")
+        # Over an hour after it was first read, and before the next refresh
+        with at(75):
+            self.assertEqual(get_player_alliance(self.server, "Joueur1", fetch_missing=False), "ALLY")
+
+
+@unittest.skipUnless(connection.vendor == "postgresql", "ranking rows are ingested with COPY")
+class IngestRankingRowsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.server = FourmizzzServer.objects.create(name="s1", username="tracker")
+
+    def ingest(self, rows):
+        """The number of players whose state moved, and the snapshots it saved."""
+        before = set(RankingSnapshot.objects.values_list("pk", flat=True))
+        n_moved = ingest_ranking_rows(self.server.pk, rows)
+        snapshots = RankingSnapshot.objects.exclude(pk__in=before).order_by("pk")
+        return n_moved, list(
+            snapshots.values_list("player_name", "hunting_field", "trophies", "hunting_field_diff", "trophies_diff")
+        )
+
+    def states(self):
+        return {
+            state.player_name: (state.hunting_field, state.trophies, state.snapshot_id)
+            for state in RankingState.objects.filter(server=self.server)
+        }
+
+    def test_first_snapshot(self):
+        self.assertEqual(
+            self.ingest([("Joueur1", 2000, 20), ("Joueur2", 1000, 10)]),
+            (2, [("Joueur1", 2000, 20, 0, 0), ("Joueur2", 1000, 10, 0, 0)]),
+        )
+        snapshots = {snapshot.player_name: snapshot.pk for snapshot in RankingSnapshot.objects.all()}
+        self.assertEqual(
+            self.states(),
+            {"Joueur1": (2000, 20, snapshots["Joueur1"]), "Joueur2": (1000, 10, snapshots["Joueur2"])},
+        )
+
+    def test_unchanged(self):
+        rows = [("Joueur1", 2000, 20), ("Joueur2", 1000, 10)]
+        self.ingest(rows)
+        states = self.states()
+        self.assertEqual(self.ingest(rows), (0, []))
+        self.assertEqual(self.states(), states)
+
+    def test_changed_row(self):
+        self.ingest([("Joueur1", 2000, 20), ("Joueur2", 1000, 10)])
+        self.assertEqual(
+            self.ingest([("Joueur1", 2100, 20), ("Joueur2", 1000, 10)]),
+            (1, [("Joueur1", 2100, 20, 100, 0)]),
+        )
+        latest = RankingSnapshot.objects.filter(player_name="Joueur1").latest("pk")
+        self.assertEqual(self.states()["Joueur1"], (2100, 20, latest.pk))
+
+    def test_player_twice_in_a_batch(self):
+        # Pushed onto the next page while the sweep was under way: compared to its own first row
+        self.ingest([("Joueur1", 2000, 20), ("Joueur2", 1000, 10)])
+        self.assertEqual(
+            self.ingest([("Joueur1", 2100, 20), ("Joueur2", 1000, 10), ("Joueur1", 1900, 21)]),
+            (1, [("Joueur1", 2100, 20, 100, 0), ("Joueur1", 1900, 21, -200, 1)]),
+        )
+        latest = RankingSnapshot.objects.filter(player_name="Joueur1").latest("pk")
+        self.assertEqual(self.states()["Joueur1"], (1900, 21, latest.pk))
+
+    def test_special_characters_in_names(self):
+        names = ["Tab\tJoueur", "Ligne\nJoueur", "Anti\\slash", "Vide \\N"]
+        self.ingest([(name, 1000 - i, 0) for i, name in enumerate(names)])
+        self.assertEqual(set(self.states()), set(names))
+
+    def test_other_servers_untouched(self):
+        other_server = FourmizzzServer.objects.create(name="s2", username="tracker")
+        ingest_ranking_rows(other_server.pk, [("Joueur1", 5000, 50)])
+        self.assertEqual(self.ingest([("Joueur1", 2000, 20)]), (1, [("Joueur1", 2000, 20, 0, 0)]))
+        self.assertEqual(RankingState.objects.get(server=other_server).hunting_field, 5000)
+
+    def test_ranking_page(self):
+        world = SyntheticWorld(n_players=150)
+        with mock.patch("scraper.tasks.fetch", ranking_pages_of(world)):
+            first = take_page_ranking_snapshot(self.server.pk, 1)
+            last = take_page_ranking_snapshot(self.server.pk, 2)
+            # Nothing moved: scraped again, saved nothing
+            take_page_ranking_snapshot(self.server.pk, 1)
+
+        self.assertEqual(RankingSnapshot.objects.filter(server=self.server).count(), 150)
+        self.assertEqual(RankingState.objects.filter(server=self.server).count(), 150)
+        hunting_field, trophies = world.players["Joueur149"][:2]
+        self.assertEqual(
+            RankingState.objects.values_list("hunting_field", "trophies").get(player_name="Joueur149"),
+            (hunting_field, trophies),
+        )
+        self.assertEqual((first["page"], first["hunting_field"]), (1, world.players["Joueur99"][0]))
+        self.assertEqual((last["page"], last["hunting_field"], last["trophies"]), (2, hunting_field, trophies))
+
+
+def ranking_pages_of(world, failing=()):
+    """A stand-in for web_agent.fetch serving `world`'s ranking pages, `failing` ones as errors."""
+
+    def fetch(server, path, **kwargs):
+        page = int(path.split("page=")[1].split("&")[0])
+        if page in failing:
+            raise ConnectionError(f"page {page} timed out")
+        return world.ranking_page(page)
+
+    return fetch
+
+
+class HttpSessionTests(SimpleTestCase):
+    def setUp(self):
+        for pools in (mock.patch.dict(web_agent._pools, clear=True), mock.patch.object(web_agent, "_pools_pid", None)):
+            pools.start()
+            self.addCleanup(pools.stop)
+        self.s1 = FourmizzzServer(name="s1")
+        self.s2 = FourmizzzServer(name="s2")
+
+    def test_reused_per_server(self):
+        session = _http_session(self.s1, {"PHPSESSID": "abc"})
+        self.assertIs(_http_session(self.s1, {"PHPSESSID": "abc"}), session)
+        self.assertIsNot(_http_session(self.s2, {"PHPSESSID": "abc"}), session)
+        self.assertIs(_http_session(self.s1, {"PHPSESSID": "abc"}), session)
+        self.assertEqual(session.cookies.get_dict(), {"PHPSESSID": "abc"})
+
+    def test_rebuilt_with_a_new_jar(self):
+        session = _http_session(self.s1, {"PHPSESSID": "abc"})
+        with mock.patch.object(session, "close") as close:
+            renewed = _http_session(self.s1, {"PHPSESSID": "def"})
+        self.assertIsNot(renewed, session)
+        # The connections of the old session go with it
+        close.assert_called_once()
+        self.assertEqual(renewed.cookies.get_dict(), {"PHPSESSID": "def"})
+
+    def test_not_shared_with_a_forked_process(self):
+        session = _http_session(self.s1, {"PHPSESSID": "abc"})
+        with mock.patch.object(session, "close") as close, mock.patch(
+            "scraper.web_agent.os.getpid", return_value=os.getpid() + 1
+        ):
+            child_session = _http_session(self.s1, {"PHPSESSID": "abc"})
+            self.assertIs(_http_session(self.s1, {"PHPSESSID": "abc"}), child_session)
+        self.assertIsNot(child_session, session)
+        # Its sockets are still the parent's
+        close.assert_not_called()
+
+
+class FetchManyTests(SimpleTestCase):
+    def setUp(self):
+        # Not saved, and not rate limited: no request slot to reserve
+        self.server = FourmizzzServer(name="s1", requests_per_second=0)
+
+    def test_fan_out(self):
+        lock = threading.Lock()
+        in_flight = Counter()
+
+        def fetch(server, path, **kwargs):
+            page = int(path.split("page=")[1])
+            with lock:
+                in_flight["now"] += 1
+                in_flight["most"] = max(in_flight["most"], in_flight["now"])
+            # The first pages of a round answer last
+            time.sleep(0.01 * (10 - page))
+            with lock:
+                in_flight["now"] -= 1
+            if page == 5:
+                raise ConnectionError("HTTP 502")
+            return path
+
+        paths = [f"classement2.php?page={page}" for page in range(1, 10)]
+        with mock.patch("scraper.web_agent.fetch", fetch):
+            fetched = fetch_many(self.server, paths, parse=str.upper, concurrency=4)
+
+        # In page order, whatever order they came back in, and a failed page in its place
+        self.assertEqual(fetched[:4] + fetched[5:], [path.upper() for path in paths[:4] + paths[5:]])
+        self.assertIsInstance(fetched[4], ConnectionError)
+        self.assertGreater(in_flight["most"], 1)
+        self.assertLessEqual(in_flight["most"], 4)
+
+
+@unittest.skipUnless(connection.vendor == "postgresql", "ranking rows are ingested with COPY")
+class RankingSweepTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Not rate limited: the request slots would be reserved outside of the test's transaction
+        cls.server = FourmizzzServer.objects.create(
+            name="s1", username="tracker", n_scanned_pages=3, requests_per_second=0
+        )
+
+    def setUp(self):
+        # Not class data: its lock cannot be deep-copied for each test
+        self.world = SyntheticWorld(n_players=250)
+
+    def test_sweep(self):
+        with mock.patch("scraper.web_agent.fetch", ranking_pages_of(self.world)):
+            results = take_server_ranking_sweep(self.server.pk)
+        self.assertEqual([result["page"] for result in results], [1, 2, 3])
+        self.assertEqual(
+            [result["hunting_field"] for result in results],
+            [self.world.players[name][0] for name in ("Joueur99", "Joueur199", "Joueur249")],
+        )
+        self.assertEqual(RankingSnapshot.objects.filter(server=self.server).count(), 250)
+
+    def test_failed_page(self):
+        with mock.patch("scraper.web_agent.fetch", ranking_pages_of(self.world, failing={2})):
+            with self.assertRaises(ConnectionError):
+                take_server_ranking_sweep(self.server.pk)
+        # The other pages are saved all the same
+        self.assertEqual(
+            set(RankingState.objects.filter(server=self.server).values_list("player_name", flat=True)),
+            {f"Joueur{i}" for i in (*range(100), *range(200, 250))},
+        )
+
+
+class RequestBucketTests(TransactionTestCase):
+    """
+    Transactions are committed for real here: the slots are reserved on a connection of their own
+    when the caller is inside a transaction, which would not see the server a TestCase created.
+    """
+
+    def setUp(self):
+        # A bucket of 10 requests
+        self.server = FourmizzzServer.objects.create(name="s1", username="tracker", requests_per_second=5)
+
+    def test_reserve_inside_a_transaction(self):
+        def lock_bucket():
+            # Another worker, on another connection
+            try:
+                with transaction.atomic():
+                    return RequestBucket.objects.select_for_update(nowait=True).get(
+                        server=self.server, lane=DEFAULT_LANE
+                    ).tokens
+            finally:
+                connections.close_all()
+
+        # As in the admin, around a form's validation and the fetch it makes
+        with transaction.atomic():
+            self.assertEqual(_reserve(self.server, DEFAULT_LANE), [0.0])
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                self.assertEqual(executor.submit(lock_bucket).result(), 9)
+
+    def test_reserves_a_round_at_a_time(self):
+        paths = [f"classement2.php?page={page}" for page in range(1, 21)]
+        with mock.patch("scraper.web_agent.fetch", lambda server, path, **kwargs: path), mock.patch(
+            "scraper.web_agent.asyncio.sleep", mock.AsyncMock()
+        ):
+            # No time passes between the rounds here: the 10 requests of the bucket and the 5 more
+            # of max_wait cover three rounds of 4, not a fourth
+            fetched = fetch_many(self.server, paths, concurrency=4, max_wait=1)
+
+        self.assertEqual(fetched[:12], paths[:12])
+        self.assertTrue(all(isinstance(page, Throttled) for page in fetched[12:]))
+        # The lane is no more than a round in debt, so other requests still get a slot soon
+        self.assertGreater(RequestBucket.objects.get(server=self.server, lane=DEFAULT_LANE).tokens, -4)
+
+
+@unittest.skipUnless(connection.vendor == "postgresql", "rollups are computed in PostgreSQL")
+class RollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.now = datetime.datetime(2026, 10, 18, 15, 30, tzinfo=datetime.timezone.utc)
+        cls.day = datetime.datetime(2026, 10, 16, tzinfo=datetime.timezone.utc)
+        for table in PARTITIONED_TABLES:
+            create_partitions(table, cls.day.date(), cls.now.date())
+        cls.server = FourmizzzServer.objects.create(name="s1", username="tracker")
+        # bulk_create: AllianceTarget.save() would read the members from the game
+        (cls.alliance,) = AllianceTarget.objects.bulk_create([AllianceTarget(server=cls.server, name="ALLY")])
+        cls.player = PlayerTarget.objects.create(server=cls.server, name="Joueur1", alliance=cls.alliance)
+        PlayerTarget.objects.create(server=cls.server, name="Joueur2", alliance=cls.alliance)
+
+        # Joueur1 moves four times over two hours of the first day, Joueur2 once on each day
+        for name, hours, hunting_field, diff in (
+            ("Joueur1", 10.5, 100, 0),
+            ("Joueur1", 10.7, 150, 50),
+            ("Joueur1", 11.2, 120, -30),
+            ("Joueur1", 11.6, 130, 10),
+            ("Joueur2", 12.0, 1000, 0),
+            ("Joueur2", 36.0, 1100, 100),
+        ):
+            cls.ranking_snapshot(name, cls.day + datetime.timedelta(hours=hours), hunting_field, diff)
+        snapshot = PrecisionSnapshot.objects.create(player=cls.player, hunting_field=150, trophies=5)
+        PrecisionSnapshot.objects.filter(pk=snapshot.pk).update(time=cls.day + datetime.timedelta(hours=10.7))
+
+    @classmethod
+    def ranking_snapshot(cls, player_name, time, hunting_field, hunting_field_diff):
+        snapshot = RankingSnapshot.objects.create(
+            server=cls.server,
+            player_name=player_name,
+            hunting_field=hunting_field,
+            hunting_field_diff=hunting_field_diff,
+            trophies=10,
+        )
+        # `time` is auto_now_add
+        RankingSnapshot.objects.filter(pk=snapshot.pk).update(time=time)
+
+    def test_clean_old_snapshots_after_a_rollup_gap(self):
+        # Three days on, the partitions of the first two days are past retention
+        later = self.now + datetime.timedelta(days=3)
+        table = "scraper_rankingsnapshot"
+        # The deferred foreign key checks of the test data would hold back DROP TABLE
+        with connection.cursor() as cursor:
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        with mock.patch("django.utils.timezone.now", return_value=later):
+            # Rolling up stopped: nothing is dropped, the raw snapshots are all the history there is
+            with mock.patch("scraper.tasks.roll_up"):
+                self.assertEqual(clean_old_snapshots()[table]["dropped"], [])
+            self.assertEqual(RankingSnapshot.objects.count(), 6)
+
+            # Once summed up, they go
+            self.assertEqual(
+                clean_old_snapshots()[table]["dropped"],
+                [partition_name(table, (self.day + datetime.timedelta(days=days)).date()) for days in (0, 1)],
+            )
+        self.assertEqual(RankingSnapshot.objects.count(), 0)
+        self.assertEqual(self.rollup(SnapshotRollup.DAY, self.day).n_snapshots, 4)
+
+    def rollup(self, period, start, player_name="Joueur1"):
+        return RankingRollup.objects.get(server=self.server, player_name=player_name, period=period, start=start)
+
+    def assertSummedUp(self):
+        ten = self.rollup(SnapshotRollup.HOUR, self.day + datetime.timedelta(hours=10))
+        self.assertEqual(
+            (ten.n_snapshots, ten.first_hunting_field, ten.last_hunting_field, ten.max_hunting_field),
+            (2, 100, 150, 150),
+        )
+        self.assertEqual(ten.hunting_field_moved, 50)
+        # Hours are whole hours, whenever the first snapshot came in
+        eleven = self.rollup(SnapshotRollup.HOUR, self.day + datetime.timedelta(hours=11))
+        self.assertEqual((eleven.n_snapshots, eleven.first_hunting_field, eleven.last_hunting_field), (2, 120, 130))
+        day = self.rollup(SnapshotRollup.DAY, self.day)
+        self.assertEqual(
+            (day.n_snapshots, day.first_hunting_field, day.last_hunting_field, day.min_hunting_field),
+            (4, 100, 130, 100),
+        )
+        self.assertEqual(day.hunting_field_moved, 90)
+        self.assertEqual(PrecisionRollup.objects.get(player=self.player, period=SnapshotRollup.DAY).n_snapshots, 1)
+
+    def test_roll_up(self):
+        roll_up(now=self.now)
+        self.assertSummedUp()
+        # The current hour and day are not complete yet
+        self.assertEqual(rolled_up_until(now=self.now), self.now.replace(minute=0))
+        self.assertFalse(
+            RankingRollup.objects.filter(period=SnapshotRollup.DAY, start=self.now.replace(hour=0, minute=0))
+        )
+        # Running it again rewrites nothing it should not
+        roll_up(now=self.now)
+        self.assertSummedUp()
+
+    def test_time_budget(self):
+        # A second passes between every look at the clock: one hour per run
+        with mock.patch("scraper.rollups.time.monotonic", side_effect=itertools.count()):
+            roll_up(now=self.now, time_budget=1.5)
+        self.assertEqual(RankingRollup.objects.filter(period=SnapshotRollup.HOUR).count(), 1)
+        # No day before all its hours
+        self.assertFalse(RankingRollup.objects.filter(period=SnapshotRollup.DAY))
+        # The ranking's first hour is summed up, but time ran out before the precision table's
+        self.assertEqual(rolled_up_until(now=self.now), self.day + datetime.timedelta(hours=10))
+
+        # The next runs carry on where it stopped
+        roll_up(now=self.now)
+        self.assertSummedUp()
 
-# Create your tests here.
+    def test_history(self):
+        roll_up(now=self.now)
+        self.assertEqual(
+            [(row.player_name, row.start) for row in player_history(self.server, ["Joueur1", "Joueur2"])],
+            [("Joueur1", self.day), ("Joueur2", self.day), ("Joueur2", self.day + datetime.timedelta(days=1))],
+        )
+        # Joueur1 did not move on the second day, and still counts with its last hunting field
+        self.assertEqual(
+            [(row["start"], row["hunting_field"], row["members"]) for row in alliance_history(self.alliance)],
+            [(self.day, 1130, 2), (self.day + datetime.timedelta(days=1), 1230, 2)],
+        )
+        since = self.day + datetime.timedelta(days=1)
+        self.assertEqual(
+            [(row["start"], row["hunting_field"]) for row in alliance_history(self.alliance, since=since)],
+            [(since, 1230)],
+        )
@@ -1,15 +1,35 @@
+import asyncio
 import datetime
+import http.cookiejar
 import logging
+import os
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+from typing import Callable
 from typing import Dict
 from typing import List
 from typing import NoReturn
 from typing import Optional
+from typing import Tuple
 from typing import Union
 
 import requests
-from bs4 import BeautifulSoup
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db import connections
 from django.db import transaction
 from django.utils import timezone
+from requests.adapters import HTTPAdapter
+from scraper.parsers import MemberProfile
+from scraper.parsers import ParseError
+from scraper.parsers import alliance_members
+from scraper.parsers import make_soup
+from scraper.parsers import member_profile
 from scraper.utils import send_error
 
 logger = logging.getLogger(__name__)
@@ -24,6 +44,40 @@ LOGIN_TIMEOUT = 8
 LOGIN_COOLDOWN = datetime.timedelta(minutes=1)
 # Text the game shows instead of the page content once the session is gone
 SESSION_EXPIRED_MARKER = "Session expirée"
+# Pages saved under FOURMIZZZ_RECORD_DIR when recording, for the stand-in game (scraper.standin)
+RECORDED_PAGES = ("classement2.php", "Membre.php", "classementAlliance.php")
+# Keep-alive connections kept open per game server and per process. Every request of a sweep goes
+# to the same host, so reusing connections saves a TCP handshake per page. Bounded so a burst of
+# threads cannot open an unbounded number of sockets to the game.
+HTTP_POOL_SIZE = 10
+# How old a member profile may be and still be reused instead of fetching Membre.php again. Long
+# enough for the precision snapshot, MV check and alliance lookups of one tick to share a request;
+# short enough that the snapshot still belongs to the minute it is recorded in.
+PROFILE_MAX_AGE = datetime.timedelta(seconds=15)
+# The MV check runs every 5 seconds and a player coming back must be noticed on the next run.
+MV_PROFILE_MAX_AGE = datetime.timedelta(seconds=5)
+# How long a player's alliance, as last read from its member page or its alliance's page, is
+# trusted. Players seldom change alliance, while notifications and admin pages show many at once.
+PLAYER_ALLIANCE_MAX_AGE = datetime.timedelta(hours=1)
+# Past this age a player's alliance is saved again even if unchanged, so that refresh_player_alliances
+# (every 30 minutes) renews every row it reads at least once before PLAYER_ALLIANCE_MAX_AGE, however
+# late that row was written after the previous refresh.
+PLAYER_ALLIANCE_RENEW_AGE = PLAYER_ALLIANCE_MAX_AGE / 4
+
+# Throttling. The game serialises every request of a session (see _login), so a burst from many
+# workers does not go any faster: it queues on the session lock until something times out, usually
+# a login. Requests are spread out instead, through a token bucket per server and lane that lives
+# in Postgres so every worker draws from the same one.
+DEFAULT_LANE = "default"
+# The vacation checks get their own allowance, so they never queue behind a ranking sweep.
+MV_LANE = "mv"
+# Bucket capacity, in seconds' worth of the rate: how much of a burst is let through at once
+RATE_LIMIT_BURST = 2
+# A request whose slot is further away than this is dropped rather than kept waiting
+RATE_LIMIT_MAX_WAIT = 10
+# Same, for the last request of a batch. Under the 30s time limit of the tasks that fetch one,
+# which still have to send the last requests and save what they got.
+RATE_LIMIT_BATCH_MAX_WAIT = 20
 
 
 class SessionExpired(Exception):
@@ -42,6 +96,10 @@ class SessionExpired(Exception):
         )
 
 
+class Throttled(Exception):
+    """The request allowance of the server is used up for longer than we are willing to wait."""
+
+
 class LoginFailed(Exception):
     """A login attempt we owned could not be carried out. Worth reporting."""
 
@@ -55,15 +113,146 @@ class LoginUnreachable(LoginFailed):
 
 
 def _url(server, path: str) -> str:
-    return f"http://{server.name}.fourmizzz.fr/{path.lstrip('/')}"
+    base_url = settings.FOURMIZZZ_URL.format(server=server.name)
+    return f"{base_url}/{path.lstrip('/')}"
+
+
+def recording_path(record_dir: str, server_name: str, path: str) -> Optional[Path]:
+    """
+    Where a recording of this page lives, or None for a page we do not record.
+
+    The query is unquoted first, so the path the scraper asked for and the one the stand-in
+    receives (percent-encoded by requests) land on the same file.
+    """
+    page, _, query = path.lstrip("/").partition("?")
+    if page not in RECORDED_PAGES:
+        return None
+    query = urllib.parse.quote(urllib.parse.unquote(query), safe="=&")
+    return Path(record_dir) / server_name / page / f"{query or 'index'}.html"
+
+
+def _record(server, path: str, html: str) -> None:
+    target = recording_path(settings.FOURMIZZZ_RECORD_DIR, server.name, path)
+    if target is None or _session_expired(html):
+        return
+    target.parent.mkdir(parents=True, exist_ok=True)
+    target.write_text(html, encoding="utf-8")
+
+
+class _IgnoreResponseCookies(http.cookiejar.DefaultCookiePolicy):
+    """Never store cookies the game sends back: the jar in the database is the source of truth."""
+
+    def set_ok(self, cookie, request):
+        return False
+
+
+# server name -> (cookie jar the session was built with, session). Guarded by _pools_lock, and only
+# valid in the process recorded in _pools_pid.
+_pools: Dict[str, Tuple[Dict[str, str], requests.Session]] = {}
+_pools_lock = threading.Lock()
+_pools_pid: Optional[int] = None
+
+
+def _http_session(server, cookies: Dict[str, str]) -> requests.Session:
+    """
+    The pooled keep-alive session for this server, in this process.
+
+    It is rebuilt whenever it is asked for with a different jar than the one it holds, which is
+    what happens once refresh_cookies swapped the jar: the connections opened for the old session
+    are closed along with it. A forked Celery worker starts with an empty pool rather than sharing
+    its parent's sockets.
+    """
+    global _pools_pid
+    jar = dict(cookies)
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            # Inherited from the parent process: drop the references without closing the sockets,
+            # which the parent may still be using.
+            _pools.clear()
+            _pools_pid = os.getpid()
+
+        pooled = _pools.get(server.name)
+        if pooled is not None and pooled[0] == jar:
+            return pooled[1]
+        if pooled is not None:
+            pooled[1].close()
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.cookies.set_policy(_IgnoreResponseCookies())
+        session.cookies.update(jar)
+        _pools[server.name] = (jar, session)
+        return session
+
 
+def _get(server, path: str, cookies: Dict[str, str]) -> str:
+    r = _http_session(server, cookies).get(_url(server, path), timeout=REQUEST_TIMEOUT)
+    if settings.FOURMIZZZ_RECORD_DIR:
+        _record(server, path, r.text)
+    return r.text
 
-def _get(server, path: str, cookies: Dict[str, str]) -> BeautifulSoup:
-    r = requests.get(_url(server, path), cookies=cookies, timeout=REQUEST_TIMEOUT)
-    return BeautifulSoup(r.text, "html.parser")
 
+def _reserve(
+    server, lane: str, n: int = 1, max_wait: float = RATE_LIMIT_MAX_WAIT
+) -> List[float]:
+    """
+    Reserve `n` request slots on the server's bucket, returning how long to wait before each.
+
+    The slots are handed out in one short row lock and waited for outside of it, so a worker
+    waiting for its turn never holds up the others. Raises Throttled, reserving nothing, when the
+    last slot is more than `max_wait` seconds away.
 
-def _session_expired(soup: BeautifulSoup) -> bool:
+    Inside a transaction (the admin's changeform_view), the row lock would last until that
+    transaction commits, the request itself included, and stall every worker's fetch on the lane.
+    The slots are then reserved from a thread of their own, whose connection commits right away.
+    """
+    rate = server.mv_requests_per_second if lane == MV_LANE else server.requests_per_second
+    if server.pk is None or not rate:
+        # Not saved yet (admin form validation), or not limited
+        return [0.0] * n
+    if connection.in_atomic_block:
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(_reserve_in_thread, server, lane, rate, n, max_wait).result()
+    return _take_tokens(server, lane, rate, n, max_wait)
+
+
+def _reserve_in_thread(server, lane: str, rate: float, n: int, max_wait: float) -> List[float]:
+    try:
+        return _take_tokens(server, lane, rate, n, max_wait)
+    finally:
+        # Django never closes the connections of threads it did not start
+        connections.close_all()
+
+
+def _take_tokens(server, lane: str, rate: float, n: int, max_wait: float) -> List[float]:
+    capacity = max(1.0, rate * RATE_LIMIT_BURST)
+    with transaction.atomic():
+        now = timezone.now()
+        # Through the related manager's model, for the same circular import reason as in
+        # refresh_cookies.
+        buckets = server.request_buckets.model.objects.select_for_update()
+        bucket, _ = buckets.get_or_create(
+            server=server, lane=lane, defaults={"tokens": capacity, "updated_at": now}
+        )
+        tokens = min(capacity, bucket.tokens + (now - bucket.updated_at).total_seconds() * rate)
+        waits = [max(0.0, (i + 1 - tokens) / rate) for i in range(n)]
+        if waits[-1] > max_wait:
+            raise Throttled(
+                f"no request slot on server '{server.name}' ({lane}) within {max_wait}s"
+            )
+        bucket.tokens = tokens - n
+        bucket.updated_at = now
+        bucket.save(update_fields=["tokens", "updated_at"])
+    return waits
+
+
+def _throttle(server, lane: str) -> None:
+    time.sleep(_reserve(server, lane)[0])
+
+
+def _session_expired(html: str) -> bool:
     """
     Whether this page is the game telling us we are logged out.
 
@@ -71,6 +260,10 @@ def _session_expired(soup: BeautifulSoup) -> bool:
     unrecognisable page (game down, HTTP 500, network hiccup) must NOT be read as an expiry,
     otherwise an outage would turn into a login storm.
     """
+    # Nearly every page is a normal one: rule those out without building a tree.
+    if "loginForm" not in html and SESSION_EXPIRED_MARKER not in html:
+        return False
+    soup = make_soup(html)
     if soup.find(id="loginForm") is not None:
         return True
     centre = soup.find(id="centre")
@@ -78,7 +271,8 @@ def _session_expired(soup: BeautifulSoup) -> bool:
 
 
 def _post_login(server, jar: Dict[str, str]) -> Dict[str, str]:
-    # A short lived Session, so cookies set across the login redirects are all collected.
+    # A short lived Session rather than the pooled one, so cookies set across the login redirects
+    # are all collected. Logins are rare enough that the extra handshake does not matter.
     with requests.Session() as session:
         session.cookies.update(jar)
         session.post(
@@ -139,14 +333,22 @@ def _login(server, jar: Dict[str, str]) -> Dict[str, str]:
     return {**jar, **new_jar}
 
 
-def refresh_cookies(server) -> bool:
+# Default of refresh_cookies' `seen_login_attempt`, where None is a meaningful value
+_UNSET = object()
+
+
+def refresh_cookies(server, seen_login_attempt=_UNSET) -> bool:
     """
     Renew `server.cookies` in place.
 
+    `seen_login_attempt` is the `last_login_attempt` of the jar that turned out expired, by
+    default the one on the instance. Threads of fetch_many share the instance, so they pass the
+    value they read before sending their request: by the time they get here, a peer may already
+    have stamped its fresh login on the instance.
+
     An expiry hits every running task at once (up to ~100 ranking pages per server per minute), so
-    exactly one of them must log in. There is no shared cache to coordinate through -- the broker
-    is RabbitMQ and CACHES is unconfigured, so Django's LocMemCache is per process -- hence a
-    Postgres row lock.
+    exactly one of them must log in. The shared cache is no help there -- it has no lock or
+    compare-and-swap -- hence a Postgres row lock.
 
     Returns True if this call performed the login, and is therefore the one responsible for
     reporting a failure; False if it adopted a jar another process had just obtained.
@@ -156,6 +358,8 @@ def refresh_cookies(server) -> bool:
         server.cookies = _login(server, server.cookies or {})
         return True
 
+    if seen_login_attempt is _UNSET:
+        seen_login_attempt = server.last_login_attempt
     try:
         with transaction.atomic():
             # `server.__class__` instead of importing FourmizzzServer: models.py imports this
@@ -165,7 +369,7 @@ def refresh_cookies(server) -> bool:
             # Compare-and-swap on the timestamp rather than on the cookie value: a successful
             # login usually returns the *same* PHPSESSID (see _login), so the cookie cannot tell
             # us whether a peer already refreshed. The timestamp always changes.
-            if locked.last_login_attempt != server.last_login_attempt:
+            if locked.last_login_attempt != seen_login_attempt:
                 logger.info(
                     "Another process just refreshed the %s session, reusing it", server.name
                 )
@@ -201,20 +405,25 @@ def refresh_cookies(server) -> bool:
         raise
 
 
-def fetch(server, path: str) -> BeautifulSoup:
+def fetch(server, path: str, lane: str = DEFAULT_LANE, reserved: bool = False) -> str:
     """
-    Fetch a game page, logging back in once if the session has expired.
+    Fetch a game page and return its HTML, logging back in once if the session has expired.
 
     Every request to the game goes through here, so an expiry is caught before the HTML reaches
-    any parsing code.
+    any parsing code, and every request waits for its turn on the server's `lane`. `reserved`
+    means the caller already waited for the slot of the first request (see fetch_many). Parsing
+    is left to the extractors in scraper.parsers.
     """
-    soup = _get(server, path, server.cookies)
-    if not _session_expired(soup):
-        return soup
+    if not reserved:
+        _throttle(server, lane)
+    seen_login_attempt = server.last_login_attempt
+    html = _get(server, path, server.cookies)
+    if not _session_expired(html):
+        return html
 
     logger.info("Session expired on %s while fetching %s", server.name, path)
     try:
-        we_logged_in = refresh_cookies(server)
+        we_logged_in = refresh_cookies(server, seen_login_attempt)
     except LoginFailed as e:
         # We owned the attempt, so we are the one that reports it. The cooldown recorded by
         # _claim_login keeps this to one report per minute per server.
@@ -226,9 +435,10 @@ def fetch(server, path: str) -> BeautifulSoup:
         )
         raise SessionExpired(server, str(e))
 
-    soup = _get(server, path, server.cookies)
-    if not _session_expired(soup):
-        return soup
+    _throttle(server, lane)
+    html = _get(server, path, server.cookies)
+    if not _session_expired(html):
+        return html
 
     if we_logged_in:
         # The login went through but the game still treats us as logged out: almost always a wrong
@@ -242,6 +452,78 @@ def fetch(server, path: str) -> BeautifulSoup:
     raise SessionExpired(server, "still logged out after logging in again")
 
 
+def _fetch_in_thread(server, path: str, lane: str) -> str:
+    try:
+        return fetch(server, path, lane=lane, reserved=True)
+    finally:
+        # A session refresh touches the database from this thread, and Django never closes the
+        # connections of threads it did not start.
+        connections.close_all()
+
+
+async def _fetch_all(
+    server,
+    paths: List[str],
+    parse: Callable[[str], Any],
+    concurrency: int,
+    lane: str,
+    waits: List[float],
+) -> List[Any]:
+    loop = asyncio.get_running_loop()
+    results: List[Any] = [None] * len(paths)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+
+        async def fetch_one(i: int) -> None:
+            try:
+                await asyncio.sleep(waits[i])
+                html = await loop.run_in_executor(
+                    executor, _fetch_in_thread, server, paths[i], lane
+                )
+                # Parsed here, on the event loop, while the other requests are still in flight.
+                results[i] = parse(html)
+            except Exception as e:
+                results[i] = e
+
+        await asyncio.gather(*(fetch_one(i) for i in range(len(paths))))
+    return results
+
+
+def fetch_many(
+    server,
+    paths: List[str],
+    parse: Callable[[str], Any] = lambda html: html,
+    concurrency: int = 8,
+    lane: str = DEFAULT_LANE,
+    max_wait: float = RATE_LIMIT_BATCH_MAX_WAIT,
+) -> List[Any]:
+    """
+    Fetch several pages of one server concurrently, returning `parse(html)` for each, in order.
+
+    At most `concurrency` requests are in flight at once. A page that failed is returned as its
+    exception rather than raised, so one bad page does not throw away the rest of a sweep; the
+    caller decides what a failure means. Each request goes through `fetch`, so a session expiry is
+    handled exactly as for a single page.
+
+    The slots are reserved one round of `concurrency` requests at a time, each round in a single
+    trip to the database: the ORM cannot be used from the event loop, and reserving from the
+    worker threads would open a connection per thread. Reserving the whole batch at once would
+    leave the lane that many requests in debt, and throttle every other fetch on it until the
+    batch is done. The pages of a round that cannot get its slots within `max_wait` seconds of the
+    start of the batch are returned as Throttled.
+    """
+    deadline = time.monotonic() + max_wait
+    results: List[Any] = list()
+    for start in range(0, len(paths), concurrency):
+        round_paths = paths[start:start + concurrency]
+        try:
+            waits = _reserve(server, lane, len(round_paths), max_wait=max(0.0, deadline - time.monotonic()))
+        except Throttled as e:
+            results.extend([e] * (len(paths) - start))
+            break
+        results.extend(asyncio.run(_fetch_all(server, round_paths, parse, concurrency, lane, waits)))
+    return results
+
+
 def login_and_validate(server) -> Dict[str, str]:
     """
     Log in and confirm we reach a page that requires being logged in, returning the cookie jar.
@@ -255,41 +537,169 @@ def login_and_validate(server) -> Dict[str, str]:
     return jar
 
 
+def _profile_cache_key(server, player_name: str) -> str:
+    return f"member_profile:{server.name}:{urllib.parse.quote(player_name)}"
+
+
+def _known_alliances(
+    server, player_names: List[str], max_age: datetime.timedelta = PLAYER_ALLIANCE_MAX_AGE
+) -> Dict[str, str]:
+    """The alliances ("" for none) of those of these players read at most `max_age` ago."""
+    return dict(
+        server.player_alliances.filter(
+            player_name__in=player_names, updated_at__gt=timezone.now() - max_age
+        ).values_list("player_name", "alliance")
+    )
+
+
+def _remember_alliances(server, alliances: Dict[str, Optional[str]]) -> None:
+    """
+    Save these players' alliances, except those unchanged and saved less than
+    PLAYER_ALLIANCE_RENEW_AGE ago: the same players are read every minute, and most of the time
+    nothing changed.
+    """
+    known = _known_alliances(server, list(alliances), max_age=PLAYER_ALLIANCE_RENEW_AGE)
+    now = timezone.now()
+    # Through the related manager's model, for the same circular import reason as in refresh_cookies
+    player_alliance = server.player_alliances.model
+    to_save = [
+        player_alliance(server=server, player_name=player_name, alliance=alliance or "", updated_at=now)
+        for player_name, alliance in alliances.items()
+        if known.get(player_name) != (alliance or "")
+    ]
+    if to_save:
+        player_alliance.objects.bulk_create(
+            to_save,
+            update_conflicts=True,
+            unique_fields=["server", "player_name"],
+            update_fields=["alliance", "updated_at"],
+        )
+
+
+def get_member_profile(
+    server,
+    player_name: str,
+    max_age: datetime.timedelta = PROFILE_MAX_AGE,
+    lane: str = DEFAULT_LANE,
+) -> MemberProfile:
+    """
+    The player's Membre.php page, as read by any process at most `max_age` ago.
+
+    The precision snapshot, the MV check and the alliance lookups all read this same page, often
+    for the same player within the same tick; sharing one fetch between them takes that many
+    requests off a session the game serialises.
+    """
+    key = _profile_cache_key(server, player_name)
+    cached = cache.get(key)
+    if cached is not None:
+        fetched_at, profile = cached
+        if timezone.now() - fetched_at <= max_age:
+            return MemberProfile(*profile)
+
+    profile = member_profile(fetch(server, f"Membre.php?Pseudo={player_name}", lane=lane))
+    cache.set(key, (timezone.now(), tuple(profile)), timeout=PROFILE_MAX_AGE.total_seconds())
+    if profile.exists:
+        _remember_alliances(server, {player_name: profile.alliance})
+    return profile
+
+
+def get_member_profiles(
+    server,
+    player_names: List[str],
+    max_age: datetime.timedelta = PROFILE_MAX_AGE,
+    lane: str = DEFAULT_LANE,
+    concurrency: int = 8,
+) -> List[Union[MemberProfile, Exception]]:
+    """
+    get_member_profile for several players of one server, in order.
+
+    The cache is read and written in one round trip each, and the missing pages are fetched
+    concurrently with fetch_many. As there, a profile that could not be had is returned as its
+    exception.
+    """
+    keys = [_profile_cache_key(server, player_name) for player_name in player_names]
+    cached = cache.get_many(keys)
+    now = timezone.now()
+    profiles: List[Union[MemberProfile, Exception, None]] = [None] * len(player_names)
+    missing = list()
+    for i, key in enumerate(keys):
+        if key in cached and now - cached[key][0] <= max_age:
+            profiles[i] = MemberProfile(*cached[key][1])
+        else:
+            missing.append(i)
+    if not missing:
+        return profiles
+
+    fetched = fetch_many(
+        server,
+        [f"Membre.php?Pseudo={player_names[i]}" for i in missing],
+        parse=member_profile,
+        concurrency=concurrency,
+        lane=lane,
+    )
+    now = timezone.now()
+    to_cache = dict()
+    alliances = dict()
+    for i, profile in zip(missing, fetched):
+        profiles[i] = profile
+        if not isinstance(profile, Exception):
+            to_cache[keys[i]] = (now, tuple(profile))
+            if profile.exists:
+                alliances[player_names[i]] = profile.alliance
+    cache.set_many(to_cache, timeout=PROFILE_MAX_AGE.total_seconds())
+    _remember_alliances(server, alliances)
+    return profiles
+
+
 def player_exists(server, player_name: str) -> bool:
-    soup = fetch(server, f"Membre.php?Pseudo={player_name}")
-    if "Aucun joueurs avec le pseudo" in soup.find(id="centre").text:
-        return False
-    return True
+    return get_member_profile(server, player_name).exists
 
 
 def get_alliance_members(server, alliance: str) -> List[str]:
-    soup = fetch(server, f"classementAlliance.php?alliance={alliance}")
-    table = soup.find(id="tabMembresAlliance")
-    if table is None:
-        return []
-    rows = table.find_all("tr")[1:]
-    member_list = list(row.find_all("td")[2].text for row in rows)
-
-    return member_list
+    """The members of an alliance, whose alliance is saved on the way."""
+    members = alliance_members(fetch(server, f"classementAlliance.php?alliance={alliance}"))
+    if members:
+        _remember_alliances(server, {member: alliance for member in members})
+    return members
 
 
-def get_player_alliance(server, player_name: str) -> Union[Optional[str], NoReturn]:
+def get_player_alliance(server, player_name: str, fetch_missing: bool = True) -> Union[Optional[str], NoReturn]:
     """
     Returns the alliance in which the player is, or None if the player has no alliance
+
+    Read from PlayerAlliance while it is at most PLAYER_ALLIANCE_MAX_AGE old. Otherwise the member
+    page is fetched, unless `fetch_missing` is False: then None, for pages that must not hit the game.
     """
-    soup = fetch(server, f"Membre.php?Pseudo={player_name}")
+    known = _known_alliances(server, [player_name])
+    if player_name in known:
+        return known[player_name] or None
+    if not fetch_missing:
+        return None
     try:
-        boite_membre = soup.find("div", {"class": "boite_membre"}).find("table")
-        if "Alliance" in boite_membre.find_all("tr")[0].text:
-            alliance_tr = boite_membre.find_all("tr")[0]
-        else:
-            alliance_tr = boite_membre.find_all("tr")[1]
-        alliance_td = alliance_tr.find_all("td")[1].find("a")
-        return None if not alliance_td else alliance_td.text
-    except Exception:
+        return get_member_profile(server, player_name).alliance
+    except ParseError:
         send_error(
             category=server.name,
             thread="get_player_alliance",
             title=f"Alliance not found for player '{player_name}' on server '{server.name}'",
         )
         raise
+
+
+def get_player_alliances(server, player_names: List[str]) -> Dict[str, Optional[str]]:
+    """
+    get_player_alliance for several players of one server: one query, and the member pages of
+    those missing from it fetched together. A player whose page could not be read has None.
+    """
+    known = _known_alliances(server, player_names)
+    alliances = dict()
+    missing = list()
+    for player_name in player_names:
+        if player_name in known:
+            alliances[player_name] = known[player_name] or None
+        else:
+            missing.append(player_name)
+    if missing:
+        for player_name, profile in zip(missing, get_member_profiles(server, missing)):
+            alliances[player_name] = None if isinstance(profile, Exception) else profile.alliance
+    return alliances
@@ -46,11 +46,28 @@ app.conf.beat_schedule = {
             "priority": 4,  # middle priority
         },
     },
-    "process-snapshots-every-3-minutes": {
+    # Moves are matched right after each sweep, this only catches what was missed
+    "process-snapshots-every-10-minutes": {
         "task": "scraper.tasks.process_snapshots",
-        "schedule": crontab(minute="*/3"),
+        "schedule": crontab(minute="*/10"),
         "options": {
-            "expires": 120,
+            "expires": 300,
+            "priority": 2,  # low priority
+        },
+    },
+    "refresh-player-alliances-every-30-minutes": {
+        "task": "scraper.tasks.refresh_player_alliances",
+        "schedule": crontab(minute="*/30"),
+        "options": {
+            "expires": 600,
+            "priority": 2,  # low priority
+        },
+    },
+    "rollup-snapshots-every-hour": {
+        "task": "scraper.tasks.rollup_snapshots",
+        "schedule": crontab(minute="5"),
+        "options": {
+            "expires": 3000,
             "priority": 2,  # low priority
         },
     },
@@ -71,14 +88,38 @@ app.conf.beat_schedule = {
     },
 }
 
+# The servers a FourmizzzServer can be (see its `name` choices), and the classes of jobs each of
+# them gets its own queue for: a slow sweep on one server then holds up neither the other servers
+# nor the vacation checks, and each can be given its own workers (see docker-compose.prod.yml).
+# Kept by hand, in step with those choices: a server missing here would have its tasks sent to a
+# queue that is never declared and that no worker consumes. A choice added to the model needs its
+# entry here and its worker in docker-compose.prod.yml (CeleryQueueTests checks the former).
+SERVERS = ("s1", "s2", "s3", "s4")
+SERVER_JOBS = ("ranking", "precision", "mv")
+
+
+def server_queue(server: str, job: str) -> str:
+    """The queue of one class of jobs on one server, e.g. "s1.ranking"."""
+    return f"{server}.{job}"
+
+
 app.conf.task_default_queue = "default"
 
 app.conf.task_queues = (
     Queue("default"),
     Queue("mv"),
+    # RabbitMQ only honours priorities on queues declared with x-max-priority. The two above keep
+    # their arguments: a broker refuses to redeclare an existing queue with different ones.
+    *(
+        Queue(server_queue(server, job), queue_arguments={"x-max-priority": 10})
+        for server in SERVERS
+        for job in SERVER_JOBS
+    ),
 )
 
+# The per-server tasks are sent to their server's queues by the tasks dispatching them, which
+# know the server. These only cover the dispatchers, and a per-server task sent on its own.
 app.conf.task_routes = {
     "scraper.tasks.check_mv_players": {"queue": "mv"},
-    "scraper.tasks.check_mv_player": {"queue": "mv"},
+    "scraper.tasks.check_server_mv_players": {"queue": "mv"},
 }
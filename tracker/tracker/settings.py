@@ -96,6 +96,28 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Shared by the web and Celery processes, so a worker can reuse a page another one just fetched.
+# Kept in Postgres, the only store every process already reaches; create the table with
+# `python manage.py createcachetable`.
+# Sized for every live entry at once, with room to spare: the member pages of the last 15 seconds
+# and the once-a-day error flags (players' alliances live in PlayerAlliance). Past MAX_ENTRIES, a
+# write first deletes the expired entries, and only if that is not enough a quarter of the others,
+# in key order.
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "scraper_cache",
+        "OPTIONS": {
+            "MAX_ENTRIES": 20000,
+            "CULL_FREQUENCY": 4,
+        },
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -185,4 +207,46 @@ CELERY_TASK_IGNORE_RESULT = True
 CELERY_TASK_TIME_LIMIT = 30
 CELERY_TASK_ANNOTATIONS = {
     "celery.backend_cleanup": {"time_limit": 600},
+    # A whole server sweep in one task, so it gets most of the minute between two ticks.
+    "scraper.tasks.take_server_ranking_sweep": {"time_limit": 55},
+    # Fetches the pages its binary search needs one after the other, each of which may wait up to
+    # RATE_LIMIT_MAX_WAIT for its request slot. Within RANKING_LEASE_TTL after the sweep.
+    "scraper.tasks.update_n_scanned_pages": {"time_limit": 120},
+    # Matching a server's batch of moves: MATCHING_TASK_BUDGET seconds of searches, and the
+    # queries around them.
+    "scraper.tasks.process_server_precision_snapshots": {"time_limit": 45},
+    "scraper.tasks.process_new_moves": {"time_limit": 45},
+    # Rolling up, within ROLLUP_TIME_BUDGET, and partition maintenance
+    "scraper.tasks.rollup_snapshots": {"time_limit": 600},
+    "scraper.tasks.clean_old_snapshots": {"time_limit": 600},
 }
+
+# Where the game lives. Point it at the stand-in game (`python manage.py fourmizzz_standin`) to
+# run the scraper offline, e.g. http://localhost:8765/{server}
+FOURMIZZZ_URL = os.environ.get("FOURMIZZZ_URL", "http://{server}.fourmizzz.fr")
+# When set, every ranking, member and alliance page fetched is saved there, for the stand-in
+FOURMIZZZ_RECORD_DIR = os.environ.get("FOURMIZZZ_RECORD_DIR", "")
+
+# HTML parser used to read game pages: "lxml" or "html.parser" (see scraper.parsers)
+HTML_PARSER = os.environ.get("HTML_PARSER", "lxml")
+
+# How ranking pages are scraped: "sweep" fetches all the pages of a server concurrently from a
+# single task and writes them in one batch; "pages" falls back to one Celery task per page.
+RANKING_SWEEP_MODE = os.environ.get("RANKING_SWEEP_MODE", "sweep")
+# Ranking pages in flight at once per server, in "sweep" mode
+RANKING_SWEEP_CONCURRENCY = int(os.environ.get("RANKING_SWEEP_CONCURRENCY", "8"))
+# Seconds a sweep may wait for the request slots of its last pages, within the sweep's time limit
+RANKING_SWEEP_MAX_WAIT = float(os.environ.get("RANKING_SWEEP_MAX_WAIT", "40"))
+# Member pages in flight at once per server when checking the players in vacation mode
+MV_CHECK_CONCURRENCY = int(os.environ.get("MV_CHECK_CONCURRENCY", "4"))
+# Most ranking pages scanned per server. Each page is a request to the game every minute.
+RANKING_MAX_PAGES = int(os.environ.get("RANKING_MAX_PAGES", "100"))
+
+# Matching a target's move with the ranking moves of the same minute (see scraper.matching):
+# the most moves in one explanation, the seconds one search may take, the seconds of searches a
+# server's batch may take (the targets left over wait for the next run), and how many equally
+# small explanations a notification lists.
+MATCHING_MAX_SIZE = int(os.environ.get("MATCHING_MAX_SIZE", "4"))
+MATCHING_TIME_BUDGET = float(os.environ.get("MATCHING_TIME_BUDGET", "5"))
+MATCHING_TASK_BUDGET = float(os.environ.get("MATCHING_TASK_BUDGET", "20"))
+MATCHING_MAX_EXPLANATIONS = int(os.environ.get("MATCHING_MAX_EXPLANATIONS", "3"))